@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Сколько выбросов на группу отправляем в браузер
+MAX_OUTLIERS_PER_GROUP = int(os.environ.get("GEOQUICK_MAX_BOX_OUTLIERS", "200"))
+# Множитель IQR для усов (как в plotly.js по умолчанию)
+WHISKER_IQR = 1.5
+
+
+class BoxStats:
+    """Предвычисленная статистика box plot по группам"""
+
+    def __init__(self, labels, q1, median, q3, lowerfence, upperfence, mean, counts,
+                 outlier_x, outlier_y):
+        self.labels = labels
+        self.q1 = q1
+        self.median = median
+        self.q3 = q3
+        self.lowerfence = lowerfence
+        self.upperfence = upperfence
+        self.mean = mean
+        self.counts = counts
+        self.outlier_x = outlier_x
+        self.outlier_y = outlier_y
+
+
+def compute_box_stats(df, y_column, group_column=None, max_outliers=MAX_OUTLIERS_PER_GROUP):
+    """Квартили, усы и выбросы по каждой группе за один проход groupby"""
+    values = df[y_column].to_numpy(dtype=float, na_value=np.nan)
+
+    if group_column:
+        # Порядок групп - по первому появлению, как у px.box
+        codes, labels = pd.factorize(df[group_column], sort=False)
+    else:
+        codes = np.zeros(len(values), dtype=np.int64)
+        labels = pd.Index([y_column])
+
+    # Пропуски в значениях и в группе не участвуют в статистике
+    valid = np.isfinite(values) & (codes >= 0)
+    if not valid.any():
+        raise ValueError(f"Column '{y_column}' has no numeric values")
+    values = values[valid]
+    codes = codes[valid]
+
+    grouped = pd.Series(values).groupby(codes, sort=True)
+    quantiles = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    present = quantiles.index.to_numpy()
+
+    q1 = np.full(len(labels), np.nan)
+    median = np.full(len(labels), np.nan)
+    q3 = np.full(len(labels), np.nan)
+    q1[present] = quantiles[0.25].to_numpy()
+    median[present] = quantiles[0.5].to_numpy()
+    q3[present] = quantiles[0.75].to_numpy()
+
+    # Усы - крайние значения внутри 1.5 IQR от квартилей
+    iqr = q3 - q1
+    low_limit = (q1 - WHISKER_IQR * iqr)[codes]
+    high_limit = (q3 + WHISKER_IQR * iqr)[codes]
+    inside = (values >= low_limit) & (values <= high_limit)
+
+    inside_grouped = pd.Series(values[inside]).groupby(codes[inside])
+    lowerfence = inside_grouped.min().reindex(range(len(labels))).to_numpy()
+    upperfence = inside_grouped.max().reindex(range(len(labels))).to_numpy()
+    mean = grouped.mean().reindex(range(len(labels))).to_numpy()
+    counts = np.bincount(codes, minlength=len(labels))
+
+    # Выбросы: оставляем самые далекие от медианы, не больше лимита на группу
+    outside = np.flatnonzero(~inside)
+    out_codes = codes[outside]
+    distance = np.abs(values[outside] - median[out_codes])
+    order = np.lexsort((-distance, out_codes))
+    sizes = np.bincount(out_codes, minlength=len(labels))
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    rank = np.empty(len(outside), dtype=np.int64)
+    rank[order] = np.arange(len(outside)) - starts[out_codes[order]]
+    kept = outside[rank < max_outliers]
+
+    # Группы без единого числового значения не рисуем
+    has_data = counts > 0
+    label_values = np.empty(len(labels), dtype=object)
+    label_values[:] = labels.tolist()
+
+    return BoxStats(
+        labels=label_values[has_data].tolist(),
+        q1=q1[has_data].tolist(),
+        median=median[has_data].tolist(),
+        q3=q3[has_data].tolist(),
+        lowerfence=lowerfence[has_data].tolist(),
+        upperfence=upperfence[has_data].tolist(),
+        mean=mean[has_data].tolist(),
+        counts=counts[has_data].tolist(),
+        outlier_x=label_values[codes[kept]].tolist(),
+        outlier_y=values[kept].tolist(),
+    )
@@ -0,0 +1,60 @@
+import json
+import os
+
+from fastapi.responses import Response
+
+from app.metrics import span
+
+# Отрисовка scatter:
+#   auto  - WebGL (scattergl), начиная с WEBGL_THRESHOLD точек, иначе SVG
+#   webgl - всегда WebGL
+#   svg   - всегда SVG (медленно на десятках тысяч точек)
+SCATTER_RENDER = os.environ.get("GEOQUICK_SCATTER_RENDER", "auto")
+WEBGL_THRESHOLD = int(os.environ.get("GEOQUICK_WEBGL_THRESHOLD", "1000"))
+
+# Мобильная конфигурация (общая для scatter и box)
+MOBILE_CONFIG = {
+    "displayModeBar": False,  # Убираем панель инструментов
+    "responsive": True,       # Адаптивный размер
+    "doubleClick": False,     # Отключаем двойной клик
+    "scrollZoom": False,      # Отключаем зум скроллом
+    "showTips": False,        # Убираем подсказки
+    "staticPlot": False,      # Оставляем интерактивность для hover
+    "displaylogo": False,     # Убираем логотип Plotly
+    # Отключаем все взаимодействия кроме hover
+    "modeBarButtonsToRemove": [
+        'pan2d', 'select2d', 'lasso2d', 'zoomIn2d', 'zoomOut2d',
+        'autoScale2d', 'resetScale2d', 'zoom2d'
+    ]
+}
+
+
+def render_mode(points):
+    """webgl или svg для scatter с таким числом точек на графике"""
+    if SCATTER_RENDER in ("webgl", "svg"):
+        return SCATTER_RENDER
+    return "webgl" if points >= WEBGL_THRESHOLD else "svg"
+
+
+def figure_body(fig, **extra):
+    """JSON с фигурой для Plotly.react на клиенте"""
+    import plotly.io as pio
+
+    payload = {"success": True, "config": MOBILE_CONFIG, **extra}
+    # Фигуру сериализует plotly.io, вклеиваем ее без повторного json.dumps.
+    # numpy-массивы (x, y, цвет) plotly пишет как base64 typed arrays
+    # ({"dtype": "f8", "bdata": ...}), а не десятичным текстом
+    with span("figure.to_json"):
+        figure_json = pio.to_json(fig, validate=False)
+    return json.dumps(payload)[:-1] + ', "figure": ' + figure_json + '}'
+
+
+def cacheable(response, etag):
+    """Браузер хранит ответ, но каждый раз сверяет ETag (данные сессии могут смениться)"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def not_modified(etag):
+    return cacheable(Response(status_code=304), etag)
@@ -0,0 +1,91 @@
+import importlib.util
+import os
+
+# Parquet нужен pyarrow; без него продолжаем хранить данные в CSV.
+# Сам pyarrow импортируется при первом чтении/записи, а не при старте
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+COLUMNAR_SUFFIX = ".parquet"
+
+
+def is_columnar(path):
+    return path.endswith(COLUMNAR_SUFFIX)
+
+
+def columnar_path(path):
+    """Путь к parquet-версии файла данных"""
+    return os.path.splitext(path)[0] + COLUMNAR_SUFFIX
+
+
+def normalize_columns(df):
+    """Parquet требует уникальные строковые имена колонок (как после CSV)"""
+    names = []
+    seen = {}
+    for name in map(str, df.columns):
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        names.append(name)
+    if names != list(df.columns):
+        df = df.copy()
+        df.columns = names
+    return df
+
+
+def write_columnar(df, path):
+    """Сохраняет DataFrame в parquet с уже выведенными типами колонок"""
+    import pyarrow as pa
+
+    df = normalize_columns(df)
+    tmp_path = path + ".tmp"
+    try:
+        df.to_parquet(tmp_path, engine="pyarrow", index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Колонки со смешанными типами (числа вперемешку с текстом) храним как строки
+        df = df.copy()
+        for col in df.columns[df.dtypes == object]:
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+        df.to_parquet(tmp_path, engine="pyarrow", index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def save_dataset(df, path_base):
+    """Сохраняет датасет в колоночном формате (без pyarrow - CSV), возвращает путь"""
+    if PARQUET_AVAILABLE:
+        return write_columnar(df, path_base + COLUMNAR_SUFFIX)
+    path = path_base + ".csv"
+    df.to_csv(path, index=False)
+    return path
+
+
+def convert_csv(csv_path, remove_source=False):
+    """Конвертирует CSV в parquet один раз при загрузке"""
+    if not PARQUET_AVAILABLE:
+        return csv_path
+    import pandas as pd
+
+    parquet_path = write_columnar(pd.read_csv(csv_path), columnar_path(csv_path))
+    if remove_source:
+        os.remove(csv_path)
+    return parquet_path
+
+
+def read_schema(path):
+    """Колонки, числовые колонки и число строк без чтения самих данных"""
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    # Пустая таблица с той же схемой дает те же pandas-типы, что и полная
+    empty = parquet_file.schema_arrow.empty_table().to_pandas()
+    numeric_columns = empty.select_dtypes(include=['number']).columns.tolist()
+    return list(empty.columns), numeric_columns, parquet_file.metadata.num_rows
+
+
+def read_columns(path, columns):
+    """Читает только нужные колонки (projection + memory map)"""
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas()
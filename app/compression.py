@@ -0,0 +1,244 @@
+"""Сжатие ответов по Accept-Encoding (brotli, если установлен, и gzip).
+
+Страницы графиков со встроенными фигурами Plotly и JSON распознанных
+таблиц хорошо сжимаются (в 5-10 раз), а телефон в мобильной сети
+упирается именно в объем. Маленькие ответы и уже сжатые (картинки,
+предсжатая статика из app/static_assets.py) отдаются как есть.
+Большие тела сжимаются и отправляются кусками: браузер начинает
+разбирать страницу, пока сервер сжимает ее хвост.
+"""
+import gzip
+import importlib.util
+import os
+import threading
+import zlib
+
+COMPRESSION_ENABLED = os.environ.get("GEOQUICK_COMPRESSION", "1") == "1"
+# Ответы меньше этого размера не сжимаем - заголовки и работа дороже выигрыша
+MIN_SIZE = int(os.environ.get("GEOQUICK_COMPRESS_MIN_BYTES", "1024"))
+# Уровни для сжатия на лету: быстрые, но с хорошим коэффициентом
+GZIP_LEVEL = int(os.environ.get("GEOQUICK_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("GEOQUICK_BROTLI_QUALITY", "5"))
+# Тела больше этого отправляются сжатыми кусками такого размера (до сжатия)
+STREAM_CHUNK = 64 * 1024
+
+BROTLI_AVAILABLE = importlib.util.find_spec("brotli") is not None
+# Порядок - предпочтение сервера при равных q у клиента
+ENCODINGS = ("br", "gzip") if BROTLI_AVAILABLE else ("gzip",)
+# Расширение предсжатого файла для каждой кодировки
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript",
+                      "application/xml", "image/svg+xml")
+
+
+def is_compressible(content_type):
+    return content_type.split(";", 1)[0].strip().lower().startswith(COMPRESSIBLE_TYPES)
+
+
+def negotiate(accept_encoding, encodings=ENCODINGS):
+    """Лучшая из encodings по заголовку Accept-Encoding или None (без сжатия)"""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class GzipEncoder:
+    def __init__(self, level=GZIP_LEVEL):
+        # wbits 16+ - формат gzip (заголовок и CRC), а не голый zlib
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        """Все, что накоплено, уходит клиенту - он может распаковать это сразу"""
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, quality=BROTLI_QUALITY):
+        import brotli
+
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+ENCODERS = {"br": BrotliEncoder, "gzip": GzipEncoder}
+
+
+def compress_max(data, encoding):
+    """Максимальное сжатие для статики: делается один раз, время не важно"""
+    if encoding == "br":
+        import brotli
+
+        return brotli.compress(data, quality=11)
+    # mtime=0 - одинаковый файл дает одинаковый .gz (и ETag)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class CompressionStats:
+    """Сколько байт ушло бы без сжатия и сколько ушло на самом деле"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}  # кодировка -> [ответов, байт до, байт после]
+
+    def record(self, encoding, raw, sent):
+        with self._lock:
+            totals = self._totals.setdefault(encoding, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += raw
+            totals[2] += sent
+
+    def metrics(self):
+        with self._lock:
+            return {
+                encoding: {"responses": responses, "raw_bytes": raw, "sent_bytes": sent}
+                for encoding, (responses, raw, sent) in self._totals.items()
+            }
+
+
+compression_stats = CompressionStats()
+
+
+class CompressionMiddleware:
+    """ASGI-middleware: сжимает ответ выбранной по Accept-Encoding кодировкой
+
+    Не трогает ответы с Content-Encoding (предсжатая статика), частичные
+    ответы (Range), HEAD и несжимаемые типы. Сильный ETag становится
+    слабым: байты сжатого тела другие, а содержимое то же.
+    """
+
+    def __init__(self, app, minimum_size=MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESSION_ENABLED or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        encoding = negotiate(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = CompressingSender(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressingSender:
+    """Состояние одного ответа: решение сжимать принимается по первому куску тела"""
+
+    def __init__(self, send, encoding, minimum_size):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self._start = None
+        self._encoder = None
+        self._passthrough = False
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self._start = message
+            self._passthrough = not self._eligible(message)
+            if self._passthrough:
+                await self._send(message)
+            return
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self._encoder is None:
+            if not more_body and len(body) < self.minimum_size:
+                self._passthrough = True
+                await self._send(self._start)
+                await self._send(message)
+                return
+            self._encoder = ENCODERS[self.encoding]()
+            if not more_body and len(body) <= STREAM_CHUNK:
+                # Небольшое тело целиком: сжимаем сразу и знаем Content-Length
+                compressed = self._encoder.compress(body) + self._encoder.finish()
+                await self._send(self._start_message(len(compressed)))
+                await self._body(compressed, body, more_body=False)
+                return
+            await self._send(self._start_message(None))
+
+        # Большое или потоковое тело: сжатые куски уходят по мере готовности
+        for offset in range(0, len(body), STREAM_CHUNK):
+            piece = body[offset:offset + STREAM_CHUNK]
+            await self._body(self._encoder.compress(piece) + self._encoder.flush(), piece, more_body=True)
+        if more_body:
+            return
+        await self._body(self._encoder.finish(), b"", more_body=False)
+
+    async def _body(self, compressed, raw, more_body):
+        self.raw_bytes += len(raw)
+        self.sent_bytes += len(compressed)
+        if compressed or not more_body:
+            await self._send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+        if not more_body:
+            compression_stats.record(self.encoding, self.raw_bytes, self.sent_bytes)
+
+    def _eligible(self, message):
+        if message["status"] < 200 or message["status"] in (204, 206, 304):
+            return False
+        headers = {name.lower(): value for name, value in message.get("headers", [])}
+        if b"content-encoding" in headers or b"content-range" in headers:
+            return False
+        return is_compressible(headers.get(b"content-type", b"").decode("latin-1"))
+
+    def _start_message(self, content_length):
+        headers = []
+        vary = []
+        for name, value in self._start.get("headers", []):
+            lowered = name.lower()
+            if lowered == b"content-length":
+                continue
+            if lowered == b"vary":
+                vary.append(value)
+                continue
+            if lowered == b"etag" and not value.startswith(b"W/"):
+                value = b"W/" + value
+            headers.append((name, value))
+        if not any(b"accept-encoding" in value.lower() or value.strip() == b"*" for value in vary):
+            vary.append(b"Accept-Encoding")
+        headers.append((b"vary", b", ".join(vary)))
+        headers.append((b"content-encoding", self.encoding.encode()))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode()))
+        return {**self._start, "headers": headers}
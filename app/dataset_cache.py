@@ -0,0 +1,251 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from starlette.concurrency import run_in_threadpool
+
+from app.columnar import is_columnar, read_columns, read_schema
+from app.dataset_store import dataset_store, session_id
+from app.ingest import adopt_legacy_file, load_manifest
+from app.metrics import row_counts, span
+from app.shared_datasets import SHARED_DATASETS, shared_datasets
+from app.sheets import SheetFetchError, sheet_fetcher
+
+# Бюджет памяти для распарсенных датасетов (в мегабайтах)
+DATASET_CACHE_MAX_BYTES = int(os.environ.get("GEOQUICK_DATASET_CACHE_MB", "512")) * 1024 * 1024
+# Google Sheets не имеют mtime, поэтому кешируем их на ограниченное время
+URL_CACHE_TTL = float(os.environ.get("GEOQUICK_URL_CACHE_TTL", "60"))
+
+
+class CachedDataset:
+    """Распарсенный DataFrame и производные метаданные
+
+    Для CSV весь файл парсится сразу. Для колоночного формата (parquet)
+    метаданные берутся из схемы, а колонки подгружаются по мере запроса.
+    """
+
+    def __init__(self, source, key, df=None, on_grow=None):
+        import pandas as pd
+
+        self.source = source
+        self.key = key
+        self._on_grow = on_grow
+        self._load_lock = threading.Lock()
+        # Манифест загрузки уже содержит колонки, типы и статистики
+        self.manifest = load_manifest(source)
+        if df is None:
+            if self.manifest is not None:
+                self.columns = [col["name"] for col in self.manifest["columns"]]
+                self.numeric_columns = list(self.manifest["numeric_columns"])
+                num_rows = self.manifest["rows"]
+            else:
+                self.columns, self.numeric_columns, num_rows = read_schema(source)
+            self._frame = pd.DataFrame(index=pd.RangeIndex(num_rows))
+            self.nbytes = 0
+        else:
+            self._frame = df
+            self.columns = list(df.columns)
+            self.numeric_columns = df.select_dtypes(include=['number']).columns.tolist()
+            self.nbytes = int(df.memory_usage(deep=True).sum())
+        self.loaded_at = time.monotonic()
+        # Короткий идентификатор версии данных (для ключей производных кешей)
+        self.version = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        # Хеш содержимого из хранилища: одинаковые данные разных сессий дают тот же id
+        self.content_id = (self.manifest or {}).get("dataset_id") or self.version
+        self._derived = {}
+        self._derived_lock = threading.Lock()
+
+    @property
+    def df(self):
+        """Полный DataFrame (все колонки)"""
+        return self.frame()
+
+    def frame(self, columns=None):
+        """DataFrame только с нужными колонками (несуществующие пропускаются)"""
+        import pandas as pd
+
+        if columns is None:
+            columns = self.columns
+        columns = [c for c in dict.fromkeys(columns) if c in self.columns]
+
+        if any(c not in self._frame.columns for c in columns):
+            with self._load_lock:
+                missing = [c for c in columns if c not in self._frame.columns]
+                if missing:
+                    with span("dataset.read_columns"):
+                        if SHARED_DATASETS:
+                            # Колонки поверх общей с другими воркерами памяти; в бюджет идут только копии
+                            loaded, grown = shared_datasets.read_columns(self.source, missing)
+                        else:
+                            loaded = read_columns(self.source, missing)
+                            grown = int(loaded.memory_usage(deep=True, index=False).sum())
+                    loaded.index = self._frame.index
+                    # Новый объект - уже выданные срезы остаются неизменными
+                    self._frame = pd.concat([self._frame, loaded], axis=1)
+                    self.nbytes += grown
+                    if self._on_grow:
+                        self._on_grow(self, grown)
+
+        return self._frame[columns]
+
+    def memo(self, key, factory):
+        """Кеширует производные данные (статистики, индексы) вместе с датасетом
+
+        Значения с атрибутом nbytes (отсортированные индексы колонок)
+        учитываются в бюджете памяти кеша, как подгруженные колонки.
+        """
+        with self._derived_lock:
+            if key in self._derived:
+                return self._derived[key]
+        value = factory()
+        with self._derived_lock:
+            if key in self._derived:
+                return self._derived[key]
+            self._derived[key] = value
+            grown = getattr(value, "nbytes", 0)
+            self.nbytes += grown
+        if grown and self._on_grow:
+            self._on_grow(self, grown)
+        return value
+
+
+class DatasetCache:
+    """LRU-кеш датасетов с ограничением по памяти"""
+
+    def __init__(self, max_bytes=DATASET_CACHE_MAX_BYTES, url_ttl=URL_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.url_ttl = url_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+
+    def _make_key(self, source):
+        if os.path.exists(source):
+            stat = os.stat(source)
+            return (source, stat.st_mtime_ns, stat.st_size)
+        return (source,)
+
+    def get(self, source):
+        """Возвращает датасет из кеша или парсит CSV заново"""
+        key = self._make_key(source)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expired = len(key) == 1 and time.monotonic() - entry.loaded_at > self.url_ttl
+                if not expired:
+                    self._entries.move_to_end(key)
+                    return entry
+                self._remove(key)
+
+        # Парсим вне блокировки, чтобы не задерживать другие запросы
+        if is_columnar(source):
+            entry = CachedDataset(source, key, on_grow=self._grown)
+        else:
+            import pandas as pd
+
+            with span("dataset.read_csv"):
+                df = pd.read_csv(source)
+            entry = CachedDataset(source, key, df)
+
+        row_counts.observe(len(entry._frame), kind="dataset")
+
+        with self._lock:
+            # Старые версии того же файла больше не нужны
+            for old_key in [k for k in self._entries if k[0] == source]:
+                self._remove(old_key)
+            if entry.nbytes <= self.max_bytes:
+                self._entries[key] = entry
+                self.total_bytes += entry.nbytes
+                self._evict()
+        return entry
+
+    def invalidate(self, source):
+        """Удаляет все версии источника из кеша"""
+        if not source:
+            return
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == source]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def _grown(self, entry, nbytes):
+        """Учитывает подгруженные колонки в бюджете памяти"""
+        with self._lock:
+            if self._entries.get(entry.key) is entry:
+                self.total_bytes += nbytes
+                self._evict()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.nbytes
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+
+
+dataset_cache = DatasetCache()
+# Удаленные сборщиком файлы не должны оставаться в памяти
+dataset_store.on_evict.append(dataset_cache.invalidate)
+
+
+async def load_session_dataset(request):
+    """Загружает датасет текущей сессии (None если данные не загружены)"""
+    data_path = request.session.get("data_path")
+    gsheet_csv_url = request.session.get("gsheet_csv_url")
+    if data_path:
+        # Файлы старых сессий (CSV, parquet вне хранилища) переносим в хранилище при первом обращении
+        columnar = await run_in_threadpool(adopt_legacy_file, data_path)
+        if columnar != data_path:
+            request.session["data_path"] = columnar
+            dataset_store.attach(session_id(request), columnar, data_path)
+        if os.path.exists(columnar):
+            dataset_store.touch(request.session.get("sid"), columnar)
+            return dataset_cache.get(columnar)
+        # Файл удален сборщиком (истек срок или квота) - нужно загрузить данные заново
+        request.session.pop("data_path", None)
+    if gsheet_csv_url:
+        # Снимок таблицы обновляется асинхронно, event loop не ждет сеть
+        try:
+            snapshot_path = await sheet_fetcher.fetch(gsheet_csv_url)
+        except SheetFetchError as e:
+            # Снимка нет, а Google не отвечает - покажем причину на странице загрузки
+            print(f"Session sheet {gsheet_csv_url} unavailable: {e}")
+            request.session["data_error"] = str(e)
+            return None
+        dataset_store.touch(request.session.get("sid"), snapshot_path)
+        return dataset_cache.get(snapshot_path)
+    return None
+
+
+def no_data_error(request):
+    """Почему у сессии нет данных (один раз) - для ответов API"""
+    return request.session.pop("data_error", None) or "No data loaded"
+
+
+def set_session_dataset(request, data_path, data_source):
+    """Привязывает новый датасет к сессии вместо прежних данных"""
+    previous_path = request.session.get("data_path")
+    invalidate_session_dataset(request)
+    dataset_store.attach(session_id(request), data_path, previous_path)
+    request.session["data_path"] = data_path
+    request.session["data_source"] = data_source
+
+
+def invalidate_session_dataset(request):
+    """Сбрасывает кеш для данных, которые сессия собирается заменить
+
+    Датасеты хранилища не трогаем: путь адресуется содержимым и не
+    меняется, а тот же датасет могут открывать другие сессии. Их
+    вытеснит бюджет памяти или сборщик хранилища.
+    """
+    data_path = request.session.get("data_path")
+    if data_path and not dataset_store.owns(data_path):
+        dataset_cache.invalidate(data_path)
+    dataset_cache.invalidate(request.session.get("gsheet_csv_url"))
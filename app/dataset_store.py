@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: локально запускается один процесс, блокировки не нужны
+    fcntl = None
+
+from starlette.concurrency import run_in_threadpool
+
+STORE_DIR = "app/uploads"
+# Лимит диска под датасеты (в мегабайтах)
+STORE_QUOTA_BYTES = int(os.environ.get("GEOQUICK_STORE_QUOTA_MB", "1024")) * 1024 * 1024
+# Ссылка сессии считается живой столько времени после последнего обращения
+SESSION_TTL = float(os.environ.get("GEOQUICK_SESSION_TTL_HOURS", "24")) * 3600
+# Датасет без обращений дольше этого срока удаляется в любом случае
+DATASET_TTL = float(os.environ.get("GEOQUICK_DATASET_TTL_HOURS", "72")) * 3600
+# Как часто запускается сборщик
+REAP_INTERVAL = float(os.environ.get("GEOQUICK_REAP_INTERVAL", "600"))
+# Свежие датасеты без ссылок не трогаем (загрузка могла еще не записаться в сессию)
+UNREFERENCED_GRACE = 600
+# Метки обращений обновляются на диске не чаще этого (секунды); должно быть меньше UNREFERENCED_GRACE
+MARK_INTERVAL = 60
+# Брошенные временные файлы (.incoming-*, *.tmp) старше этого удаляем
+STALE_TEMP_AGE = 3600
+
+INDEX_FILE = ".store-index.json"  # индекс ссылок прежних версий - больше не пишется
+INDEX_LOCK_FILE = ".store-index.lock"
+# <dataset_id>.ref-<session_id> - ссылка сессии, <dataset_id>.access - обращение без сессии.
+# Пустые файлы, mtime - время последнего обращения
+REF_MARKER = ".ref-"
+ACCESS_MARKER = ".access"
+
+
+def dataset_id_of(path):
+    """Идентификатор датасета - имя файла до первой точки"""
+    return os.path.basename(path).split(".", 1)[0]
+
+
+@contextmanager
+def file_lock(path):
+    """Межпроцессная блокировка (воркеры uvicorn работают с одним каталогом)"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def frame_digest(df):
+    """Хеш содержимого DataFrame (имена колонок + значения) для дедупликации"""
+    import pandas as pd
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(col) for col in df.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class DatasetStore:
+    """Хранилище датасетов по хешу содержимого со ссылками от сессий
+
+    Файлы датасета лежат в одном каталоге под общим префиксом
+    <dataset_id>.* (данные, манифест). Ссылки сессий и обращения - это
+    пустые файлы-метки рядом с данными (<dataset_id>.ref-<sid>), их mtime
+    обновляется при обращении. Состояние целиком на диске, поэтому все
+    воркеры uvicorn видят ссылки друг друга сразу, без обмена индексом,
+    а удаление датасета удаляет и его метки.
+    """
+
+    def __init__(self, directory=STORE_DIR, quota_bytes=STORE_QUOTA_BYTES,
+                 session_ttl=SESSION_TTL, dataset_ttl=DATASET_TTL):
+        self.directory = directory
+        self.quota_bytes = quota_bytes
+        self.session_ttl = session_ttl
+        self.dataset_ttl = dataset_ttl
+        self._lock = threading.Lock()
+        self._marked = {}       # путь метки -> когда этот процесс ее обновлял
+        self.on_evict = []      # колбэки (путь к данным) - например, сброс кеша
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.dedup_hits = 0
+
+    def owns(self, path):
+        return os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.directory)
+
+    def path_base(self, dataset_id):
+        return os.path.join(self.directory, dataset_id)
+
+    # --- ссылки сессий ---
+
+    def _ref_path(self, dataset_id, session_id):
+        return self.path_base(dataset_id) + REF_MARKER + session_id
+
+    def _mark(self, path, now, force=False):
+        """Обновляет mtime метки (создает ее при необходимости)"""
+        with self._lock:
+            if not force and now - self._marked.get(path, 0) < MARK_INTERVAL:
+                return
+            self._marked[path] = now
+        try:
+            os.utime(path, (now, now))
+        except FileNotFoundError:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "a"):
+                pass
+
+    def _unmark(self, path):
+        with self._lock:
+            self._marked.pop(path, None)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def attach(self, session_id, data_path, previous_path=None):
+        """Сессия начала использовать датасет (и, возможно, бросила предыдущий)"""
+        now = time.time()
+        if previous_path and self.owns(previous_path):
+            self._unmark(self._ref_path(dataset_id_of(previous_path), session_id))
+        if self.owns(data_path):
+            self._mark(self._ref_path(dataset_id_of(data_path), session_id), now, force=True)
+
+    def touch(self, session_id, data_path):
+        """Обращение к датасету продлевает жизнь и ему, и ссылке сессии"""
+        if not self.owns(data_path):
+            return
+        dataset_id = dataset_id_of(data_path)
+        if session_id:
+            self._mark(self._ref_path(dataset_id, session_id), time.time())
+        else:
+            self._mark(self.path_base(dataset_id) + ACCESS_MARKER, time.time())
+
+    def record_dedup(self, dataset_id):
+        with self._lock:
+            self.dedup_hits += 1
+        self._mark(self.path_base(dataset_id) + ACCESS_MARKER, time.time(), force=True)
+
+    # --- сборка мусора ---
+
+    def _scan(self, now=None):
+        """Файлы каталога, сгруппированные по датасетам, с живыми ссылками сессий"""
+        datasets = {}
+        stale = []
+        now = now or time.time()
+        if not os.path.isdir(self.directory):
+            return datasets, stale
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or entry.name in (INDEX_FILE, INDEX_LOCK_FILE):
+                continue
+            stat = entry.stat()
+            if entry.name.startswith(".incoming-") or entry.name.endswith(".tmp"):
+                if now - stat.st_mtime > STALE_TEMP_AGE:
+                    stale.append(entry.path)
+                continue
+            if REF_MARKER in entry.name and now - stat.st_mtime > self.session_ttl:
+                # Протухшая ссылка сессии больше не держит датасет
+                stale.append(entry.path)
+                continue
+            info = datasets.setdefault(dataset_id_of(entry.name),
+                                       {"paths": [], "bytes": 0, "mtime": 0, "refs": 0})
+            info["paths"].append(entry.path)
+            info["bytes"] += stat.st_size
+            # Последнее обращение - самая свежая метка (или запись данных)
+            info["mtime"] = max(info["mtime"], stat.st_mtime)
+            if REF_MARKER in entry.name:
+                info["refs"] += 1
+        return datasets, stale
+
+    def _evict(self, dataset_id, info):
+        for path in info["paths"]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            if REF_MARKER in path or path.endswith(ACCESS_MARKER):
+                with self._lock:
+                    self._marked.pop(path, None)
+                continue
+            for callback in self.on_evict:
+                callback(path)
+        self.evictions += 1
+        self.evicted_bytes += info["bytes"]
+
+    def reap(self, now=None):
+        """Удаляет брошенные и просроченные датасеты, затем соблюдает квоту"""
+        now = now or time.time()
+        # Воркеры собирают мусор по очереди
+        with file_lock(os.path.join(self.directory, INDEX_LOCK_FILE)):
+            return self._reap(now)
+
+    def _reap(self, now):
+        datasets, stale = self._scan(now)
+        for path in stale:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        evicted = []
+        for dataset_id, info in list(datasets.items()):
+            idle = now - info["mtime"]
+            unreferenced = not info["refs"] and idle > UNREFERENCED_GRACE
+            if idle > self.dataset_ttl or unreferenced:
+                self._evict(dataset_id, info)
+                evicted.append(dataset_id)
+                del datasets[dataset_id]
+
+        # Квота: удаляем самые давно использованные, даже если на них есть ссылки
+        total = sum(info["bytes"] for info in datasets.values())
+        for dataset_id in sorted(datasets, key=lambda dataset_id: datasets[dataset_id]["mtime"]):
+            if total <= self.quota_bytes:
+                break
+            total -= datasets[dataset_id]["bytes"]
+            self._evict(dataset_id, datasets[dataset_id])
+            evicted.append(dataset_id)
+        return evicted
+
+    def metrics(self):
+        datasets, _ = self._scan()
+        return {
+            "bytes_held": sum(info["bytes"] for info in datasets.values()),
+            "quota_bytes": self.quota_bytes,
+            "datasets": len(datasets),
+            "referenced_datasets": sum(1 for info in datasets.values() if info["refs"]),
+            "evictions": self.evictions,
+            "evicted_bytes": self.evicted_bytes,
+            "dedup_hits": self.dedup_hits,
+        }
+
+
+dataset_store = DatasetStore()
+
+
+def session_id(request):
+    """Стабильный идентификатор сессии для учета ссылок на датасеты"""
+    sid = request.session.get("sid")
+    if not sid:
+        sid = uuid.uuid4().hex
+        request.session["sid"] = sid
+    return sid
+
+
+async def run_reaper(store=dataset_store, interval=REAP_INTERVAL):
+    """Фоновая задача: периодическая сборка мусора в хранилище"""
+    while True:
+        try:
+            evicted = await run_in_threadpool(store.reap)
+            if evicted:
+                print(f"Dataset store: evicted {len(evicted)} datasets")
+        except Exception as e:
+            print(f"Dataset store reaper error: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,121 @@
+import hashlib
+import importlib.metadata
+import os
+import threading
+from collections import OrderedDict
+
+from app import box_stats, point_reduction
+from app.charts import SCATTER_RENDER, WEBGL_THRESHOLD
+from app.metrics import payload_bytes
+from app.compression import ENCODING_SUFFIXES
+from app.static_assets import HASHED_ASSET_RE, PLOTLY_INCLUDE, PLOTLY_JS_DIR
+
+# Бюджет памяти для готовых графиков (HTML и JSON фигур), в мегабайтах
+FIGURE_CACHE_MAX_BYTES = int(os.environ.get("GEOQUICK_FIGURE_CACHE_MB", "64")) * 1024 * 1024
+# Код, шаблоны и скрипты страниц: их правка при деплое меняет графики
+BUILD_DIRS = ("app", "app/routes", "app/templates", PLOTLY_JS_DIR)
+# Идентификатор сборки можно задать при деплое, иначе он считается по файлам
+BUILD_ID = os.environ.get("GEOQUICK_BUILD_ID", "")
+
+
+def build_hash(directories=BUILD_DIRS):
+    """Хеш кода, шаблонов и скриптов приложения (без подкаталогов)
+
+    Бандл plotly.js (имя с хешем) и его .gz/.br пропускаем - он уже
+    учтен в PLOTLY_INCLUDE.
+    """
+    digest = hashlib.sha1()
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            base = name
+            for suffix in ENCODING_SUFFIXES.values():
+                base = base.removesuffix(suffix)
+            if base != name or HASHED_ASSET_RE.search(base) or not os.path.isfile(path):
+                continue
+            digest.update(f"{path}\0".encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+# Все, от чего зависит готовый график: версии, режим отрисовки, настройки сокращения
+# точек и ящиков, сборка приложения. Меняется - старые ETag становятся недействительными
+RENDER_SALT = ":".join(str(part) for part in (
+    importlib.metadata.version("plotly"), PLOTLY_INCLUDE, SCATTER_RENDER, WEBGL_THRESHOLD,
+    point_reduction.REDUCTION_MODE, point_reduction.MAX_SCATTER_POINTS,
+    point_reduction.DENSITY_THRESHOLD, point_reduction.DENSITY_BINS, point_reduction.WINDOW_MARGIN,
+    box_stats.MAX_OUTLIERS_PER_GROUP, BUILD_ID or build_hash(),
+))
+
+
+def figure_key(kind, dataset, **params):
+    """Ключ графика: тип, версия содержимого датасета и параметры построения"""
+    return (kind, dataset.content_id) + tuple(sorted(params.items()))
+
+
+class FigureCache:
+    """LRU-кеш готовых графиков с ограничением по памяти
+
+    Хранит уже сериализованный результат (HTML-фрагмент или JSON), так
+    что повторный запрос не строит фигуру и не вызывает plotly.io.
+    """
+
+    def __init__(self, max_bytes=FIGURE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def etag(key):
+        """Слабый ETag: одинаковые данные и параметры дают тот же график"""
+        digest = hashlib.sha1(f"{RENDER_SALT}:{key!r}".encode()).hexdigest()[:20]
+        return f'W/"{digest}"'
+
+    def get_or_render(self, key, render):
+        """Готовый график из кеша или render() с сохранением результата"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        # Строим вне блокировки; одинаковые запросы в редком случае построят график дважды
+        value = render()
+        size = len(value)
+        payload_bytes.observe(size, kind=key[0])
+        if size <= self.max_bytes:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = value
+                    self.total_bytes += size
+                    while self.total_bytes > self.max_bytes:
+                        _, old = self._entries.popitem(last=False)
+                        self.total_bytes -= len(old)
+        return value
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+figure_cache = FigureCache()
+
+
+def client_has(request, etag):
+    """Браузер прислал If-None-Match с этим ETag - тело можно не отправлять"""
+    header = request.headers.get("if-none-match", "")
+    return etag in [tag.strip() for tag in header.split(",")] or header.strip() == "*"
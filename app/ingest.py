@@ -0,0 +1,304 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import uuid
+
+import aiofiles
+from starlette.concurrency import run_in_threadpool
+
+from app.columnar import PARQUET_AVAILABLE, COLUMNAR_SUFFIX, is_columnar, normalize_columns, save_dataset, write_columnar
+from app.dataset_store import dataset_store, frame_digest
+from app.metrics import payload_bytes, row_counts, span
+
+# Максимальный размер загружаемого файла (в мегабайтах)
+MAX_UPLOAD_BYTES = int(os.environ.get("GEOQUICK_MAX_UPLOAD_MB", "200")) * 1024 * 1024
+# Размер блока при потоковой записи загрузки
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# По первым байтам определяем кодировку, разделитель и типы колонок
+SNIFF_BYTES = 64 * 1024
+ENCODINGS = ("utf-8-sig", "cp1251", "latin-1")
+DELIMITERS = ",;\t|"
+# Сколько строк парсим за раз при подсчете статистик
+PARSE_CHUNK_ROWS = 100_000
+# Больше уникальных значений не считаем точно - только факт превышения
+MAX_TRACKED_DISTINCT = 10_000
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+class IngestError(Exception):
+    """Файл нельзя принять как таблицу (понятное пользователю сообщение)"""
+
+
+def sniff_format(sample, truncated=True):
+    """Кодировка и разделитель по первому блоку файла"""
+    import pandas as pd
+
+    if b"\x00" in sample:
+        raise IngestError("File does not look like a text table")
+
+    for encoding in ENCODINGS:
+        try:
+            text = sample.decode(encoding)
+            break
+        except UnicodeDecodeError as e:
+            # Блок мог обрезать многобайтовый символ в самом конце
+            if encoding.startswith("utf-8") and truncated and e.start >= len(sample) - 3:
+                text = sample[:e.start].decode(encoding)
+                break
+
+    lines = text.splitlines()
+    if truncated and len(lines) > 1:
+        lines = lines[:-1]  # Последняя строка блока может быть неполной
+    lines = lines[:200]
+    if not lines:
+        raise IngestError("File is empty")
+
+    try:
+        delimiter = csv.Sniffer().sniff("\n".join(lines[:50]), delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = ","
+
+    # Пробуем распарсить начало файла, чтобы отказать сразу, а не на странице графика
+    try:
+        head = pd.read_csv(io.StringIO("\n".join(lines)), sep=delimiter)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, ValueError) as e:
+        raise IngestError(f"Could not parse file as a table: {e}")
+    if len(head.columns) == 0:
+        raise IngestError("No columns found in file")
+
+    return encoding, delimiter, {col: str(dtype) for col, dtype in head.dtypes.items()}
+
+
+class ColumnSummary:
+    """Статистика колонки, накапливаемая по блокам строк"""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.distinct = set()
+        self.distinct_overflow = False
+
+    def update(self, series):
+        import pandas as pd
+
+        self.count += len(series)
+        self.nulls += int(series.isna().sum())
+
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            chunk_min, chunk_max = series.min(), series.max()
+            if pd.notna(chunk_min):
+                self.min = chunk_min if self.min is None else min(self.min, chunk_min)
+                self.max = chunk_max if self.max is None else max(self.max, chunk_max)
+
+        if not self.distinct_overflow:
+            self.distinct.update(series.dropna().unique().tolist())
+            if len(self.distinct) > MAX_TRACKED_DISTINCT:
+                self.distinct_overflow = True
+                self.distinct = set()
+
+    def to_dict(self, dtype):
+        import pandas as pd
+
+        numeric = pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+        return {
+            "name": self.name,
+            "dtype": str(dtype),
+            "numeric": bool(numeric),
+            # min/max имеют смысл, только если колонка осталась числовой во всех блоках
+            "min": float(self.min) if numeric and self.min is not None else None,
+            "max": float(self.max) if numeric and self.max is not None else None,
+            "nulls": self.nulls,
+            "cardinality": None if self.distinct_overflow else len(self.distinct),
+        }
+
+
+def build_manifest(df, summaries=None, **info):
+    """Описание датасета: колонки, типы и статистики для страниц графиков"""
+    if summaries is None:
+        summaries = {}
+        for col in df.columns:
+            summaries[col] = ColumnSummary(col)
+            summaries[col].update(df[col])
+
+    columns = [summaries[col].to_dict(df[col].dtype) for col in df.columns]
+    return {
+        **info,
+        "rows": len(df),
+        "columns": columns,
+        # Тот же критерий, что и select_dtypes(include=['number'])
+        "numeric_columns": df.select_dtypes(include=['number']).columns.tolist(),
+    }
+
+
+def manifest_path(data_path):
+    return os.path.splitext(data_path)[0] + MANIFEST_SUFFIX
+
+
+def write_manifest(data_path, manifest):
+    path = manifest_path(data_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, default=str)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(data_path):
+    """Манифест датасета (None если его нет - например, старый файл или URL)"""
+    try:
+        with open(manifest_path(data_path), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def find_stored(dataset_id, store=dataset_store):
+    """Путь к уже сохраненному датасету с таким хешем (или None)"""
+    base = store.path_base(dataset_id)
+    for path in (base + COLUMNAR_SUFFIX, base + ".csv"):
+        if os.path.exists(path) and load_manifest(path) is not None:
+            return path
+    return None
+
+
+def store_frame(df, store=dataset_store, **info):
+    """Сохраняет готовый DataFrame в хранилище вместе с манифестом, возвращает путь"""
+    df = normalize_columns(df)
+    dataset_id = frame_digest(df)[:24]
+
+    # Такая же таблица уже есть (например, повторный импорт того же фото)
+    existing = find_stored(dataset_id, store)
+    if existing:
+        store.record_dedup(dataset_id)
+        return existing
+
+    os.makedirs(store.directory, exist_ok=True)
+    data_path = save_dataset(df, store.path_base(dataset_id))
+    write_manifest(data_path, build_manifest(df, dataset_id=dataset_id, data_path=data_path, **info))
+    return data_path
+
+
+def adopt_legacy_file(data_path, store=dataset_store):
+    """Файл старой сессии (CSV или parquet вне хранилища) - в хранилище, возвращает новый путь
+
+    Сборщик и квота видят только файлы хранилища с манифестом. Чтение и
+    запись блокирующие - вызывать в пуле потоков.
+    """
+    if not PARQUET_AVAILABLE or not os.path.exists(data_path):
+        return data_path
+    if store.owns(data_path) and is_columnar(data_path):
+        return data_path
+    import pandas as pd
+
+    with span("dataset.migrate"):
+        df = pd.read_parquet(data_path) if is_columnar(data_path) else pd.read_csv(data_path)
+    return store_frame(df, store, source_name=os.path.basename(data_path))
+
+
+def _parse_and_store(raw_path, data_base, encoding, delimiter, info):
+    """Парсит CSV блоками со статистиками и сохраняет в колоночном формате"""
+    import pandas as pd
+
+    summaries = {}
+    chunks = []
+    try:
+        with span("ingest.parse"):
+            reader = pd.read_csv(raw_path, sep=delimiter, encoding=encoding, chunksize=PARSE_CHUNK_ROWS)
+            for chunk in reader:
+                for col in chunk.columns:
+                    summaries.setdefault(col, ColumnSummary(col)).update(chunk[col])
+                chunks.append(chunk)
+    except (pd.errors.ParserError, UnicodeDecodeError, ValueError) as e:
+        raise IngestError(f"Could not parse file as a table: {e}")
+    if not chunks:
+        raise IngestError("File contains no rows")
+
+    df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+    row_counts.observe(len(df), kind="upload")
+    manifest = build_manifest(df, summaries, **info)
+
+    if PARQUET_AVAILABLE:
+        with span("ingest.write_columnar"):
+            data_path = write_columnar(df, data_base + COLUMNAR_SUFFIX)
+        os.remove(raw_path)
+    else:
+        data_path = data_base + ".csv"
+        os.replace(raw_path, data_path)
+
+    manifest["data_path"] = data_path
+    write_manifest(data_path, manifest)
+    return manifest
+
+
+async def ingest_upload(upload, store=dataset_store, max_bytes=MAX_UPLOAD_BYTES):
+    """Потоковый прием загрузки: лимит размера, проверка формата, манифест
+
+    Файл сохраняется под именем из хеша содержимого, поэтому одинаковые
+    имена файлов у разных пользователей не перезаписывают друг друга.
+    """
+    if getattr(upload, "size", None) and upload.size > max_bytes:
+        raise IngestError(f"File is larger than {max_bytes // (1024 * 1024)} MB")
+
+    os.makedirs(store.directory, exist_ok=True)
+    incoming_path = os.path.join(store.directory, f".incoming-{uuid.uuid4().hex}")
+    digest = hashlib.sha256()
+    size = 0
+    sniffed = None
+    head = b""
+
+    try:
+        async with aiofiles.open(incoming_path, "wb") as out:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise IngestError(f"File is larger than {max_bytes // (1024 * 1024)} MB")
+                if sniffed is None:
+                    head += chunk
+                    if len(head) >= SNIFF_BYTES:
+                        sniffed = sniff_format(head[:SNIFF_BYTES])
+                digest.update(chunk)
+                await out.write(chunk)
+
+        if size == 0:
+            raise IngestError("File is empty")
+        if sniffed is None:
+            sniffed = sniff_format(head, truncated=False)
+    except BaseException:
+        if os.path.exists(incoming_path):
+            os.remove(incoming_path)
+        raise
+
+    payload_bytes.observe(size, kind="upload")
+    encoding, delimiter, sniffed_dtypes = sniffed
+    dataset_id = digest.hexdigest()[:24]
+    data_base = store.path_base(dataset_id)
+
+    # Такой же файл уже загружали - используем готовый датасет
+    existing = find_stored(dataset_id, store)
+    if existing:
+        os.remove(incoming_path)
+        store.record_dedup(dataset_id)
+        return load_manifest(existing)
+
+    info = {
+        "dataset_id": dataset_id,
+        "source_name": upload.filename,
+        "size": size,
+        "sha256": digest.hexdigest(),
+        "encoding": encoding,
+        "delimiter": delimiter,
+        "sniffed_dtypes": sniffed_dtypes,
+    }
+    try:
+        return await run_in_threadpool(_parse_and_store, incoming_path, data_base, encoding, delimiter, info)
+    finally:
+        if os.path.exists(incoming_path):
+            os.remove(incoming_path)
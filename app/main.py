@@ -1,15 +1,48 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
-from app.routes import upload, scatter, box, img2table_extract
+from app.routes import upload, scatter, box, img2table_extract, table_processing
+from app.static_assets import CachedStaticFiles, precompress_on_startup
+from app.dataset_store import dataset_store, run_reaper
+from app.ocr_jobs import ocr_queue
+from app.sheets import sheet_fetcher
+from app.figure_cache import figure_cache
+from app.shared_datasets import shared_datasets
+from app.subsystems import SUBSYSTEMS, WARMUP, readiness, warm_up
+from app.metrics import MetricsMiddleware, registry
+from app.compression import CompressionMiddleware, compression_stats
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Фоновая сборка мусора в хранилище датасетов
+    reaper = asyncio.create_task(run_reaper())
+    # pandas, plotly и OCR грузятся в фоне - старт сервера их не ждет
+    warmup = asyncio.create_task(warm_up()) if WARMUP else None
+    # Сжатые варианты статики, если их не сделал шаг сборки
+    precompress = asyncio.create_task(asyncio.to_thread(precompress_on_startup))
+    yield
+    reaper.cancel()
+    precompress.cancel()
+    if warmup is not None:
+        warmup.cancel()
+    ocr_queue.shutdown()
+    await sheet_fetcher.close()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(SessionMiddleware, secret_key="supersecret")
+# gzip/brotli по Accept-Encoding; снаружи нее метрики видят байты, ушедшие в сеть
+app.add_middleware(CompressionMiddleware)
+# Время и размер ответов по роутам для /metrics (снаружи всех остальных middleware)
+app.add_middleware(MetricsMiddleware)
 
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+app.mount("/static", CachedStaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
 
 @app.get("/", response_class=HTMLResponse)
@@ -25,8 +58,41 @@ app.include_router(upload.router)
 app.include_router(scatter.router)
 app.include_router(box.router)
 app.include_router(img2table_extract.router)
+app.include_router(table_processing.router)
 
 # Для отладки - добавим простой тестовый роут
 @app.get("/test")
 async def test():
-    return {"message": "FastAPI working"}
\ No newline at end of file
+    return {"message": "FastAPI working"}
+
+# Сервер жив и принимает запросы (подсистемы могут еще загружаться)
+@app.get("/api/health")
+async def health():
+    return {"status": "ok", **readiness()}
+
+# Готовность к запросам графиков: 503 пока не загружены обязательные подсистемы
+@app.get("/api/ready")
+async def ready():
+    state = readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+# Счетчики синглтонов попадают в /metrics как gauge
+registry.register_collector("geoquick_store", dataset_store.metrics)
+registry.register_collector("geoquick_sheets", sheet_fetcher.metrics)
+registry.register_collector("geoquick_figures", figure_cache.metrics)
+registry.register_collector("geoquick_shared_datasets", shared_datasets.metrics)
+registry.register_collector("geoquick_compression", compression_stats.metrics)
+registry.register_collector("geoquick_ocr_queue", lambda: {"pending": ocr_queue.pending, "jobs": len(ocr_queue.jobs)})
+registry.register_collector("geoquick_subsystem_load_ms",
+                            lambda: {s.name: s.load_ms for s in SUBSYSTEMS if s.load_ms is not None})
+
+# Метрики в текстовом формате Prometheus
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+# Размер хранилища датасетов и статистика сборщика
+@app.get("/api/store-stats")
+async def store_stats():
+    return {**dataset_store.metrics(), "sheets": sheet_fetcher.metrics(),
+            "figures": figure_cache.metrics(), "shared": shared_datasets.metrics()}
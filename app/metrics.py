@@ -0,0 +1,267 @@
+"""Легкая инструментовка: гистограммы, этапы запросов и /metrics.
+
+Метрики считаются в памяти процесса и отдаются в текстовом формате
+Prometheus. observe() - это поиск корзины и сложение под блокировкой,
+поэтому инструментовку можно держать включенной в продакшене.
+Сэмплирующий профилировщик включается отдельно (GEOQUICK_PROFILING)
+и только для запросов, которые его явно попросили.
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+# Корзины гистограмм: время в секундах, размеры в байтах, число строк
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+ROWS_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# Разрешить профилирование запросов (заголовок X-Profile: 1 или ?_profile=1)
+PROFILING_ENABLED = os.environ.get("GEOQUICK_PROFILING", "0") == "1"
+PROFILE_DIR = os.environ.get("GEOQUICK_PROFILE_DIR", "app/profiles")
+# Интервал сэмплирования стеков, секунды
+PROFILE_INTERVAL = float(os.environ.get("GEOQUICK_PROFILE_INTERVAL_MS", "5")) / 1000
+
+
+class Histogram:
+    """Гистограмма Prometheus с метками (накопительные корзины считаются при выводе)"""
+
+    def __init__(self, name, help, buckets, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # значения меток -> [счетчики корзин..., +Inf], сумма
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        for key, counts, total in sorted(series):
+            labels = [f'{name}="{escape(value)}"' for name, value in zip(self.labelnames, key)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else format_number(bound)
+                bucket_labels = ",".join(labels + [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = f"{{{','.join(labels)}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {format_number(total)}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Все гистограммы процесса плюс счетчики из metrics() синглтонов"""
+
+    def __init__(self):
+        self.histograms = []
+        self.collectors = []
+
+    def histogram(self, name, help, buckets, labelnames=()):
+        histogram = Histogram(name, help, buckets, labelnames)
+        self.histograms.append(histogram)
+        return histogram
+
+    def register_collector(self, prefix, collect):
+        """collect() возвращает плоский dict чисел (как dataset_store.metrics())"""
+        self.collectors.append((prefix, collect))
+
+    def render(self):
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.render())
+        for prefix, collect in self.collectors:
+            for key, value in flatten(collect()):
+                name = f"{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {format_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def flatten(values, prefix=""):
+    """Числовые поля вложенного dict: {"a": {"b": 1}} -> ("a_b", 1)"""
+    for key, value in values.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, f"{name}_")
+        elif isinstance(value, bool):
+            yield name, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+
+registry = MetricsRegistry()
+
+request_seconds = registry.histogram(
+    "geoquick_http_request_duration_seconds", "Время обработки HTTP-запроса",
+    LATENCY_BUCKETS, ("method", "route", "status"))
+response_bytes = registry.histogram(
+    "geoquick_http_response_bytes", "Размер тела ответа",
+    BYTES_BUCKETS, ("route",))
+stage_seconds = registry.histogram(
+    "geoquick_stage_duration_seconds", "Время этапов обработки (чтение данных, построение графика, OCR)",
+    LATENCY_BUCKETS, ("stage",))
+payload_bytes = registry.histogram(
+    "geoquick_payload_bytes", "Размер входных данных и готовых графиков",
+    BYTES_BUCKETS, ("kind",))
+row_counts = registry.histogram(
+    "geoquick_rows", "Число строк в прочитанных датасетах и на графиках",
+    ROWS_BUCKETS, ("kind",))
+
+
+@contextmanager
+def span(stage):
+    """Замеряет время блока кода как этап stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage=stage)
+
+
+def record_stages(prefix, timings):
+    """Этапы, замеренные в другом процессе (StageTimer.timings в миллисекундах)"""
+    for stage, ms in (timings or {}).items():
+        stage_seconds.observe(ms / 1000, stage=f"{prefix}.{stage}")
+
+
+class SamplingProfiler:
+    """Сэмплирующий профилировщик одного запроса
+
+    Фоновый поток раз в interval снимает стеки всех потоков (event loop
+    и пул потоков, где идет тяжелая работа) и считает одинаковые стеки.
+    Результат - collapsed stacks, их читают flamegraph.pl и speedscope.
+    """
+
+    IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+
+    def __init__(self, label, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.filename = (f"{time.strftime('%Y%m%d-%H%M%S')}-{label.strip('/').replace('/', '_') or 'root'}"
+                         f"-{uuid.uuid4().hex[:6]}.txt")
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                # Ожидающие потоки (пустой пул, select в event loop) не интересны
+                if os.path.basename(frame.f_code.co_filename) in self.IDLE_FILES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def save(self):
+        """Пишет collapsed stacks в PROFILE_DIR и возвращает путь к файлу"""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, self.filename)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def wants_profile(scope):
+    if not PROFILING_ENABLED:
+        return False
+    headers = dict(scope.get("headers") or [])
+    return headers.get(b"x-profile") == b"1" or b"_profile=1" in scope.get("query_string", b"")
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: время и размер ответа по шаблону роута
+
+    Метка route - шаблон пути ("/api/img2table-jobs/{job_id}"), а не сам
+    путь, чтобы число рядов метрик не росло с каждым id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        size = 0
+        profiler = SamplingProfiler(scope["path"]) if wants_profile(scope) else None
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profiler is not None:
+                    # Имя файла профиля известно заранее - сообщаем его в заголовке
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-profile-file", profiler.filename.encode())]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            if profiler is not None:
+                with profiler:
+                    await self.app(scope, receive, send_wrapper)
+            else:
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            route = route_label(scope)
+            request_seconds.observe(time.perf_counter() - started,
+                                    method=scope["method"], route=route, status=status)
+            response_bytes.observe(size, route=route)
+            if profiler is not None:
+                path = profiler.save()
+                print(f"Profile of {scope['method']} {scope['path']}: {path} ({profiler.samples} samples)")
+
+
+def route_label(scope):
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if scope["path"].startswith("/static/"):
+        return "/static"
+    return "unmatched"
@@ -0,0 +1,182 @@
+import base64
+import hashlib
+import json
+import os
+import time
+
+# Кеш результатов OCR на диске (общий для сервера и процессов пула)
+OCR_CACHE_DIR = os.environ.get("GEOQUICK_OCR_CACHE_DIR", "app/ocr_cache")
+OCR_CACHE_BYTES = int(os.environ.get("GEOQUICK_OCR_CACHE_MB", "64")) * 1024 * 1024
+# Размер картинки для перцептивного хеша (dHash: 8x8 бит) - только поиск кандидата
+HASH_SIZE = 8
+# Проверка кандидата: большой dHash (16x16 бит) и уменьшенная картинка в оттенках серого.
+# Таблицы одного бланка с разными числами дают одинаковый 64-битный хеш, но
+# отличаются в пикселях ячеек; пересжатие и смена размера меняют яркость слабо.
+VERIFY_HASH_SIZE = 16
+MAX_HASH_DISTANCE = 24  # из 256 бит
+THUMBNAIL_SIZE = 64
+PIXEL_TOLERANCE = 24  # разница яркости, которая уже считается другим пикселем
+MAX_CHANGED_PIXELS = 0.001  # доля таких пикселей
+
+
+def params_key(params):
+    """Параметры извлечения - часть ключа: другие настройки дают другую таблицу"""
+    return json.dumps(params, sort_keys=True)
+
+
+def content_key(contents, params, page=None):
+    """Ключ по байтам файла - точное совпадение, проверяется до декодирования"""
+    digest = hashlib.sha256(contents)
+    digest.update(params_key(params).encode())
+    if page is not None:
+        digest.update(f"page={page}".encode())
+    return "c-" + digest.hexdigest()[:32]
+
+
+def page_keys(contents, params, pages):
+    """content_key для каждой страницы PDF - байты файла хешируются один раз"""
+    digest = hashlib.sha256(contents)
+    digest.update(params_key(params).encode())
+    keys = []
+    for page in pages:
+        page_digest = digest.copy()
+        page_digest.update(f"page={page}".encode())
+        keys.append("c-" + page_digest.hexdigest()[:32])
+    return keys
+
+
+def dhash_bits(gray, size):
+    """dHash: знаки разностей соседних пикселей уменьшенной картинки"""
+    import cv2
+
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    return (small[:, 1:] > small[:, :-1]).flatten()
+
+
+def perceptual_hash(gray):
+    """64-битный dHash для поиска кандидата в кеше
+
+    Не меняется при пересжатии JPEG, смене размера и небольших
+    изменениях яркости - то есть при повторной загрузке того же фото.
+    Но одинаков и у разных таблиц с той же сеткой, поэтому совпадение
+    подтверждается по image_fingerprint.
+    """
+    bits = dhash_bits(gray, HASH_SIZE)
+    return f"{int(''.join('1' if bit else '0' for bit in bits), 2):016x}"
+
+
+def image_fingerprint(gray):
+    """Данные для проверки совпадения: 256-битный dHash и картинка 64x64"""
+    import cv2
+    import numpy as np
+
+    thumbnail = cv2.resize(gray, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA)
+    return {
+        "dhash": np.packbits(dhash_bits(gray, VERIFY_HASH_SIZE)).tobytes().hex(),
+        "thumbnail": base64.b64encode(thumbnail.astype(np.uint8).tobytes()).decode(),
+    }
+
+
+def same_image(stored, fingerprint):
+    """Сохраненный в кеше отпечаток совпадает с отпечатком загруженного фото"""
+    import numpy as np
+
+    if not stored or not fingerprint:
+        return False
+    try:
+        stored_bits = np.unpackbits(np.frombuffer(bytes.fromhex(stored["dhash"]), np.uint8))
+        stored_pixels = np.frombuffer(base64.b64decode(stored["thumbnail"]), np.uint8)
+    except (KeyError, ValueError, TypeError):
+        return False
+    bits = np.unpackbits(np.frombuffer(bytes.fromhex(fingerprint["dhash"]), np.uint8))
+    pixels = np.frombuffer(base64.b64decode(fingerprint["thumbnail"]), np.uint8)
+    if stored_bits.shape != bits.shape or stored_pixels.shape != pixels.shape:
+        return False
+    if np.count_nonzero(stored_bits != bits) > MAX_HASH_DISTANCE:
+        return False
+    changed = np.abs(stored_pixels.astype(np.int16) - pixels.astype(np.int16)) > PIXEL_TOLERANCE
+    return changed.mean() <= MAX_CHANGED_PIXELS
+
+
+def perceptual_key(phash, params):
+    digest = hashlib.sha256(phash.encode())
+    digest.update(params_key(params).encode())
+    return "p-" + digest.hexdigest()[:32]
+
+
+class OcrResultCache:
+    """LRU-кеш извлеченных таблиц в файлах <key>.json с лимитом размера
+
+    Время последнего обращения - mtime файла, поэтому кеш работает
+    одинаково из разных процессов без общего состояния в памяти.
+    """
+
+    def __init__(self, directory=OCR_CACHE_DIR, max_bytes=OCR_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key, fingerprint=None):
+        """Сохраненный результат (tables, preprocessing) или None
+
+        С fingerprint (перцептивный ключ) запись отдается, только если
+        сохраненный с ней отпечаток картинки совпадает (same_image).
+        """
+        import pandas as pd
+
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            if fingerprint is not None and not same_image(entry.get("fingerprint"), fingerprint):
+                return None
+            tables = [pd.DataFrame(table["rows"], columns=table["columns"])
+                      for table in entry["tables"]]
+            os.utime(path)  # отмечаем обращение для LRU
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return {"success": True, "tables": tables, "preprocessing": entry["preprocessing"]}
+
+    def put(self, keys, outcome, fingerprint=None):
+        """Сохраняет успешный результат под всеми ключами (точным и перцептивным)"""
+        payload = json.dumps({
+            "tables": [{"columns": df.columns.tolist(), "rows": df.values.tolist()}
+                       for df in outcome["tables"]],
+            "preprocessing": outcome["preprocessing"],
+            "fingerprint": fingerprint,
+            "created": time.time(),
+        }, ensure_ascii=False, default=str)
+
+        os.makedirs(self.directory, exist_ok=True)
+        for key in keys:
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        """Удаляет самые давно использованные записи сверх лимита"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+ocr_cache = OcrResultCache()
@@ -0,0 +1,400 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from starlette.concurrency import run_in_threadpool
+
+from app import ocr_worker
+from app.ocr_cache import ocr_cache, content_key, page_keys
+from app.dataset_store import STORE_DIR
+from app.ingest import store_frame
+from app.metrics import payload_bytes, record_stages, row_counts
+
+# Размер пула процессов OCR (по умолчанию - число ядер)
+OCR_WORKERS = int(os.environ.get("GEOQUICK_OCR_WORKERS", "0")) or os.cpu_count() or 1
+# Сколько страниц (изображений и страниц PDF) может ждать/выполняться одновременно, дальше - 429
+OCR_QUEUE_SIZE = int(os.environ.get("GEOQUICK_OCR_QUEUE_SIZE", str(OCR_WORKERS * 4)))
+# Максимум страниц (изображений + страниц PDF) в одной задаче
+MAX_JOB_PAGES = int(os.environ.get("GEOQUICK_OCR_MAX_PAGES", "100"))
+# Сколько хранить результаты завершенных задач
+JOB_TTL = 600
+# Состояние задач - файлы <job_id>.json рядом с датасетами: статус задачи,
+# созданной одним воркером uvicorn, читает и меняет любой другой
+JOB_DIR = os.path.join(STORE_DIR, ".ocr-jobs")
+# Задача без результата дольше этого - брошенная (воркер перезапустился)
+STALE_JOB_AGE = 3600
+# Как часто long-poll проверяет задачу, которую выполняет другой воркер
+POLL_INTERVAL = 0.5
+JOB_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+
+class QueueFullError(Exception):
+    """Очередь OCR заполнена - клиенту нужно повторить позже"""
+
+
+class OcrJob:
+    """Задача извлечения таблиц из изображений и PDF"""
+
+    # Поля, которые сохраняются в файл задачи
+    STATE_FIELDS = ("id", "session_id", "filenames", "status", "created", "finished", "result",
+                    "error", "tables", "data_path", "attached", "timings")
+
+    def __init__(self, session_id, filenames, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.session_id = session_id
+        self.filenames = filenames
+        self.status = "queued"  # queued / done / failed
+        self.created = time.time()
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.tables = {}        # id таблицы -> путь к датасету
+        self.data_path = None   # таблица, которая привязывается к сессии
+        self.attached = False
+        self.timings = None
+        self.done = asyncio.Event()
+
+    def to_state(self):
+        return {field: getattr(self, field) for field in self.STATE_FIELDS}
+
+    @classmethod
+    def from_state(cls, state):
+        job = cls(state["session_id"], state["filenames"], state["id"])
+        for field in cls.STATE_FIELDS:
+            setattr(job, field, state.get(field, getattr(job, field)))
+        if job.status != "queued":
+            job.done.set()
+        return job
+
+    def to_dict(self):
+        payload = {"job_id": self.id, "status": self.status}
+        if self.status == "done":
+            payload.update(self.result)
+        elif self.status == "failed":
+            payload.update({"success": False, "error": self.error})
+        if self.timings:
+            payload["timings"] = self.timings
+        return payload
+
+
+class PageTask:
+    """Одна единица работы для пула: изображение или страница PDF
+
+    Для PDF contents - одностраничный PDF, а key - ключ кеша по
+    исходному файлу и номеру страницы.
+    """
+
+    def __init__(self, file_index, filename, contents, page=None, key=None):
+        self.file_index = file_index
+        self.filename = filename
+        self.contents = contents
+        self.page = page
+        self.key = key
+
+    @property
+    def label(self):
+        if self.page is None:
+            return self.filename
+        return f"{self.filename} p.{self.page + 1}"
+
+    def table_id(self, table_index):
+        """Стабильный id: номер файла, страницы и таблицы на странице"""
+        page = 1 if self.page is None else self.page + 1
+        return f"{self.file_index + 1}-{page}-{table_index + 1}"
+
+
+def plan_tasks(sources, params=None):
+    """Разбивает файлы на задачи: изображение целиком, PDF - по страницам"""
+    params = ocr_worker.resolve_params(params)
+    tasks = []
+    for file_index, (filename, contents) in enumerate(sources):
+        if ocr_worker.is_pdf(contents):
+            pages = ocr_worker.split_pdf_pages(contents)
+            keys = page_keys(contents, params, range(len(pages)))
+            for page, (page_contents, key) in enumerate(zip(pages, keys)):
+                tasks.append(PageTask(file_index, filename, page_contents, page, key))
+        else:
+            tasks.append(PageTask(file_index, filename, contents, key=content_key(contents, params)))
+    return tasks
+
+
+def table_summary(table_id, task, df):
+    headers = df.columns.tolist()
+    return {
+        "id": table_id,
+        "source": task.filename,
+        "page": None if task.page is None else task.page + 1,
+        "rows": len(df),
+        "columns": len(headers),
+        "headers": headers,
+    }
+
+
+def merge_timings(outcomes):
+    """Суммарное время этапов по всем страницам задачи"""
+    if len(outcomes) == 1:
+        return outcomes[0].get("timings")
+    total = {}
+    for outcome in outcomes:
+        for stage, ms in (outcome.get("timings") or {}).items():
+            total[stage] = round(total.get(stage, 0) + ms, 1)
+    return total
+
+
+class OcrJobQueue:
+    """Ограниченная очередь задач OCR поверх пула процессов"""
+
+    def __init__(self, max_workers=OCR_WORKERS, max_pending=OCR_QUEUE_SIZE, job_dir=JOB_DIR):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.job_dir = job_dir
+        self.jobs = {}  # задачи, которые выполняет этот процесс
+        self.pending = 0  # страницы этого процесса, которые ждут пул или выполняются
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            # spawn: процессы не наследуют потоки и event loop сервера
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=ocr_worker.init_worker,
+            )
+        return self._pool
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished and now - job.finished > JOB_TTL:
+                del self.jobs[job_id]
+        if not os.path.isdir(self.job_dir):
+            return
+        for entry in os.scandir(self.job_dir):
+            age = now - entry.stat().st_mtime
+            if age <= JOB_TTL:
+                continue
+            job = self._load(entry.name.split(".", 1)[0])
+            if job is None or job.status != "queued" or age > STALE_JOB_AGE:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def _job_path(self, job_id):
+        return os.path.join(self.job_dir, job_id + ".json")
+
+    def save(self, job):
+        """Записывает состояние задачи для всех воркеров"""
+        os.makedirs(self.job_dir, exist_ok=True)
+        path = self._job_path(job.id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job.to_state(), f, default=str)
+        os.replace(tmp_path, path)
+
+    def _load(self, job_id):
+        if not JOB_ID_RE.fullmatch(job_id):
+            return None
+        try:
+            with open(self._job_path(job_id), encoding="utf-8") as f:
+                return OcrJob.from_state(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    async def submit(self, session_id, sources, params=None):
+        """Ставит файлы [(имя, байты)] в очередь (QueueFullError если мест нет)
+
+        Очередь ограничена числом страниц, а не задач: PDF на 50 страниц
+        занимает пул как 50 фотографий. Задачу больше всей очереди
+        принимаем, только когда очередь пуста.
+        """
+        self._prune()
+        if self.pending >= self.max_pending:
+            raise QueueFullError("OCR queue is full, try again later")
+
+        for _, contents in sources:
+            payload_bytes.observe(len(contents), kind="ocr_input")
+        job = OcrJob(session_id, [filename for filename, _ in sources])
+        try:
+            tasks = await run_in_threadpool(plan_tasks, sources, params)
+        except Exception as e:
+            print(f"img2table error details: {e}")
+            return self._finish_failed(job, f"img2table error: {str(e)}")
+        if len(tasks) > MAX_JOB_PAGES:
+            return self._finish_failed(job, f"Too many pages: {len(tasks)} (limit {MAX_JOB_PAGES})")
+        if self.pending and self.pending + len(tasks) > self.max_pending:
+            raise QueueFullError("OCR queue is full, try again later")
+
+        self.pending += len(tasks)
+        self.jobs[job.id] = job
+        self.save(job)
+        asyncio.get_running_loop().create_task(self._run(job, tasks, params))
+        return job
+
+    def _finish_failed(self, job, error):
+        """Задача, которую не поставили в пул (файл не разобрался или слишком большой)"""
+        job.status = "failed"
+        job.error = error
+        job.finished = time.time()
+        self.jobs[job.id] = job
+        self.save(job)
+        job.done.set()
+        return job
+
+    def get(self, job_id):
+        """Задача по id: выполняемая здесь или сохраненная любым воркером"""
+        job = self.jobs.get(job_id)
+        if job is not None and not job.done.is_set():
+            return job
+        # Готовую задачу читаем с диска: выбор таблицы мог сделать другой воркер
+        return self._load(job_id) or job
+
+    async def _extract(self, task, params):
+        """Таблицы одной страницы: из кеша по байтам или в пуле процессов"""
+        try:
+            # Тот же файл уже распознавали - отвечаем из кеша, не занимая пул
+            started = time.perf_counter()
+            outcome = await run_in_threadpool(ocr_cache.get, task.key)
+            if outcome:
+                elapsed = round((time.perf_counter() - started) * 1000, 1)
+                outcome.update(timings={"cache_lookup": elapsed},
+                               cache={"hit": True, "match": "content"})
+                return outcome
+
+            loop = asyncio.get_running_loop()
+            if task.page is None:
+                return await loop.run_in_executor(
+                    self._get_pool(), ocr_worker.extract_image_tables, task.contents, params
+                )
+            return await loop.run_in_executor(
+                self._get_pool(), ocr_worker.extract_pdf_page, task.contents, task.page, params, task.key
+            )
+        finally:
+            self.pending -= 1
+
+    async def _run(self, job, tasks, params):
+        try:
+            # Страницы расходятся по процессам пула параллельно
+            outcomes = await asyncio.gather(*(self._extract(task, params) for task in tasks),
+                                            return_exceptions=True)
+            for outcome in outcomes:
+                if isinstance(outcome, BrokenProcessPool):
+                    raise outcome
+
+            pages = []
+            tables = []
+            finished = []
+            for task, outcome in zip(tasks, outcomes):
+                if isinstance(outcome, Exception):
+                    print(f"img2table error details: {outcome}")
+                    pages.append({"source": task.label, "tables": 0,
+                                  "error": f"img2table error: {str(outcome)}"})
+                    continue
+                finished.append(outcome)
+                # Этапы decode/deskew/ocr... замерены в процессе пула
+                record_stages("ocr", outcome.get("timings"))
+                if not outcome["success"]:
+                    pages.append({"source": task.label, "tables": 0, "error": outcome["error"]})
+                    continue
+
+                pages.append({"source": task.label, "tables": len(outcome["tables"])})
+                for table_index, df in enumerate(outcome["tables"]):
+                    # Каждая таблица - отдельный датасет в хранилище
+                    table_id = task.table_id(table_index)
+                    row_counts.observe(len(df), kind="ocr_table")
+                    job.tables[table_id] = await run_in_threadpool(
+                        store_frame, df, source_name=f"{task.label} table {table_index + 1}"
+                    )
+                    tables.append((table_summary(table_id, task, df), df))
+
+            job.timings = merge_timings(finished)
+            if job.timings:
+                print(f"OCR job {job.id} timings (ms): {job.timings}")
+
+            if not tables:
+                job.status = "failed"
+                job.error = pages[0]["error"] if len(pages) == 1 else "No tables detected"
+                return
+
+            # По умолчанию к сессии привязывается первая таблица
+            first, df = tables[0]
+            job.data_path = job.tables[first["id"]]
+            hits = sum(1 for outcome in finished if outcome.get("cache", {}).get("hit"))
+            job.result = {
+                "success": True,
+                "message": f"Extracted {first['rows']} rows with {first['columns']} columns",
+                "preview": {"headers": first["headers"], "rows": df.values.tolist()[:5]},
+                "method": "img2table + tesseract",
+                "tables_found": len(tables),
+                "tables": [summary for summary, _ in tables],
+                "selected": first["id"],
+                "pages": pages,
+                "cache": (finished[0]["cache"] if len(tasks) == 1
+                          else {"hit": hits == len(tasks), "hits": hits}),
+            }
+            if len(tasks) == 1:
+                job.result["preprocessing"] = finished[0]["preprocessing"]
+            job.status = "done"
+        except BrokenProcessPool as e:
+            # Процесс пула упал (например, OOM) - следующий запрос создаст новый пул
+            print(f"OCR worker pool crashed: {e}")
+            self._pool = None
+            job.status = "failed"
+            job.error = "OCR worker crashed, please try again"
+        except Exception as e:
+            print(f"img2table error details: {e}")
+            job.status = "failed"
+            job.error = f"img2table error: {str(e)}"
+        finally:
+            job.finished = time.time()
+            self.save(job)
+            job.done.set()
+
+    async def wait(self, job, timeout):
+        """Ждет завершения задачи не дольше timeout секунд (возвращает свежее состояние)"""
+        if self.jobs.get(job.id) is job:
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return self.get(job.id) or job
+
+        # Задачу выполняет другой воркер - следим за ее файлом
+        deadline = time.monotonic() + timeout
+        while not job.done.is_set() and time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            job = self._load(job.id) or job
+        return job
+
+    async def run(self, fn, *args):
+        """Короткая работа с изображением в том же пуле, без очереди задач"""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_pool(), fn, *args)
+        except BrokenProcessPool:
+            self._pool = None
+            raise
+
+    def select(self, job, table_id):
+        """Выбирает таблицу задачи для графиков (False если такой нет)"""
+        if table_id not in job.tables:
+            return False
+        job.data_path = job.tables[table_id]
+        job.result["selected"] = table_id
+        job.attached = False
+        self.save(job)
+        return True
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+ocr_queue = OcrJobQueue()
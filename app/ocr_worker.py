@@ -0,0 +1,317 @@
+"""Код, который выполняется в процессах пула OCR.
+
+Модуль намеренно не импортирует FastAPI и роуты: процессы пула
+запускаются через spawn и импортируют только то, что нужно для OCR.
+"""
+import io
+import os
+import platform
+import threading
+import time
+
+from app.ocr_cache import ocr_cache, content_key, image_fingerprint, perceptual_hash, perceptual_key
+
+# Настройки извлечения по умолчанию (подобраны для научных таблиц)
+DEFAULT_PARAMS = {
+    "implicit_rows": True,      # Важно для таблиц без всех линий
+    "borderless_tables": True,  # Поддержка таблиц без границ
+    "min_confidence": 30,       # Понижаем порог для научных таблиц
+    "lang": "eng",
+}
+
+# Фото с телефона уменьшаем до страницы A4 (длинная сторона 11.69") при таком DPI
+TARGET_DPI = int(os.environ.get("GEOQUICK_OCR_TARGET_DPI", "300"))
+TARGET_LONG_SIDE = int(11.69 * TARGET_DPI)
+# Наклон меньше этого не исправляем, больше этого - считаем ошибкой оценки
+MIN_SKEW_DEGREES = 0.3
+MAX_SKEW_DEGREES = 15
+# Угол оцениваем на уменьшенной копии - он от масштаба не зависит
+SKEW_ESTIMATE_SIDE = 1000
+
+# Свой экземпляр OCR в каждом процессе пула
+_ocr = None
+# PDFium не потокобезопасен, а разбор PDF на сервере идет в пуле потоков
+_pdfium_lock = threading.Lock()
+
+
+# Кроссплатформенная настройка Tesseract
+def setup_tesseract():
+    if platform.system() == "Windows":
+        import pytesseract
+        # Локально на Windows
+        tesseract_path = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+        if os.path.exists(tesseract_path):
+            pytesseract.pytesseract.tesseract_cmd = tesseract_path
+        else:
+            print("Tesseract not found at default Windows location")
+    # На Linux (Render) tesseract будет в PATH автоматически
+
+
+def check_available():
+    """Проверяет, что img2table и tesseract доступны (ошибка - исключением)"""
+    setup_tesseract()
+    from img2table.ocr import TesseractOCR
+
+    TesseractOCR(n_threads=1, lang=DEFAULT_PARAMS["lang"])
+
+
+def init_worker():
+    """Инициализатор процесса пула: один TesseractOCR на процесс"""
+    global _ocr
+    setup_tesseract()
+    try:
+        from img2table.ocr import TesseractOCR
+
+        _ocr = TesseractOCR(n_threads=1, lang=DEFAULT_PARAMS["lang"])
+    except Exception as e:
+        # Без tesseract пул все равно нужен для обработки изображений
+        print(f"OCR worker started without tesseract: {e}")
+
+
+def resolve_params(params=None):
+    """Параметры по умолчанию, переопределенные запросом"""
+    return {**DEFAULT_PARAMS, **(params or {})}
+
+
+def get_ocr(lang):
+    global _ocr
+    if _ocr is None or _ocr.lang != lang:
+        from img2table.ocr import TesseractOCR
+
+        _ocr = TesseractOCR(n_threads=1, lang=lang)
+    return _ocr
+
+
+def downscale(image):
+    """Уменьшает большие фото (12+ Мп) до TARGET_DPI, мелкие не трогаем"""
+    import cv2
+
+    scale = TARGET_LONG_SIDE / max(image.shape[:2])
+    if scale >= 1:
+        return image
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def estimate_skew(gray):
+    """Угол наклона страницы в градусах по почти горизонтальным линиям"""
+    import cv2
+    import numpy as np
+
+    scale = SKEW_ESTIMATE_SIDE / max(gray.shape)
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    edges = cv2.Canny(gray, 50, 150)
+    min_length = gray.shape[1] // 4
+    lines = cv2.HoughLinesP(edges, 1, np.pi / 1800, threshold=50,
+                            minLineLength=min_length, maxLineGap=20)
+    if lines is None:
+        return 0.0
+
+    x1, y1, x2, y2 = lines.reshape(-1, 4).T.astype(float)
+    angles = np.degrees(np.arctan2(y2 - y1, x2 - x1))
+    angles = angles[np.abs(angles) < MAX_SKEW_DEGREES]
+    if angles.size == 0:
+        return 0.0
+    return float(np.median(angles))
+
+
+def deskew(gray):
+    import cv2
+
+    angle = estimate_skew(gray)
+    if abs(angle) < MIN_SKEW_DEGREES:
+        return gray, 0.0
+    h, w = gray.shape
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    rotated = cv2.warpAffine(gray, matrix, (w, h), flags=cv2.INTER_LINEAR,
+                             borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+    return rotated, angle
+
+
+def enhance_image(contents):
+    """Улучшение фото таблицы для OCR в браузере: PNG черно-белого изображения
+
+    Уменьшение до TARGET_DPI, выравнивание контраста (CLAHE), подавление
+    шума и адаптивный порог - тени и неравномерный свет от телефона
+    не превращаются в черные пятна. Возвращает None, если файл не картинка.
+    """
+    import cv2
+    import numpy as np
+
+    image = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+
+    gray = cv2.cvtColor(downscale(image), cv2.COLOR_BGR2GRAY)
+    gray = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+    gray = cv2.medianBlur(gray, 3)
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                   cv2.THRESH_BINARY, 31, 15)
+    binary, _ = deskew(binary)
+
+    ok, encoded = cv2.imencode(".png", binary, [cv2.IMWRITE_PNG_COMPRESSION, 3])
+    return encoded.tobytes() if ok else None
+
+
+class StageTimer:
+    """Время этапов обработки в миллисекундах"""
+
+    def __init__(self):
+        self.timings = {}
+        self._started = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.timings[stage] = round((now - self._started) * 1000, 1)
+        self._started = now
+
+
+def clean_tables(extracted_tables):
+    """DataFrame всех найденных таблиц без пустых строк и колонок"""
+    tables = []
+    for table in extracted_tables:
+        # Очищаем и обрабатываем данные
+        df = table.df.dropna(how='all').reset_index(drop=True)
+        # Убираем пустые колонки
+        df = df.loc[:, df.any()]
+        if not df.empty:
+            tables.append(df)
+    return tables
+
+
+def run_extraction(doc, params):
+    # Извлекаем таблицы с настройками для научных таблиц
+    return doc.extract_tables(
+        ocr=get_ocr(params["lang"]),
+        implicit_rows=params["implicit_rows"],
+        borderless_tables=params["borderless_tables"],
+        min_confidence=params["min_confidence"]
+    )
+
+
+def tables_outcome(extracted_tables, preprocessing, timer, cache_keys, fingerprint=None):
+    if not extracted_tables:
+        return {"success": False, "error": "No tables detected", "timings": timer.timings}
+
+    tables = clean_tables(extracted_tables)
+    timer.mark("postprocess")
+    if not tables:
+        return {"success": False, "error": "Empty table extracted", "timings": timer.timings}
+
+    outcome = {"success": True, "tables": tables, "preprocessing": preprocessing}
+    ocr_cache.put(cache_keys, outcome, fingerprint)
+    return {**outcome, "timings": timer.timings, "cache": {"hit": False, "match": None}}
+
+
+def extract_image_tables(contents, params=None):
+    """Извлекает все таблицы из изображения
+
+    Все этапы идут в памяти, без временных файлов. Возвращает словарь:
+    success, error или tables (список DataFrame), а также timings - время этапов в мс.
+    """
+    import cv2
+    import numpy as np
+    from img2table.document import Image
+
+    params = resolve_params(params)
+    timer = StageTimer()
+
+    # Читаем изображение
+    image = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+    timer.mark("decode")
+
+    if image is None:
+        return {"success": False, "error": "Invalid image format", "timings": timer.timings}
+
+    # Предобработка: размер, оттенки серого, выравнивание наклона
+    original_size = image.shape[1], image.shape[0]
+    image = downscale(image)
+    timer.mark("downscale")
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    timer.mark("grayscale")
+
+    # То же фото, загруженное повторно (пересжатое, другого размера) - берем из кеша.
+    # Сначала точный ключ; перцептивный хеш только находит кандидата, а отдаем
+    # его, лишь если совпали большой хеш и уменьшенная картинка
+    cache_keys = [content_key(contents, params), perceptual_key(perceptual_hash(gray), params)]
+    fingerprint = image_fingerprint(gray)
+    cached = ocr_cache.get(cache_keys[0])
+    match = "content"
+    if not cached:
+        cached = ocr_cache.get(cache_keys[1], fingerprint)
+        match = "perceptual"
+    timer.mark("cache_lookup")
+    if cached:
+        if match == "perceptual":
+            ocr_cache.put(cache_keys[:1], cached, fingerprint)
+        return {**cached, "timings": timer.timings, "cache": {"hit": True, "match": match}}
+    gray, skew = deskew(gray)
+    timer.mark("deskew")
+
+    # PNG без потерь вместо повторного сжатия в JPEG; быстрое сжатие - байты живут недолго
+    ok, encoded = cv2.imencode(".png", gray, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    if not ok:
+        return {"success": False, "error": "Could not encode image", "timings": timer.timings}
+    img_doc = Image(encoded.tobytes())
+    timer.mark("encode")
+
+    extracted_tables = run_extraction(img_doc, params)
+    timer.mark("ocr")
+
+    preprocessing = {
+        "original_size": original_size,
+        "processed_size": (gray.shape[1], gray.shape[0]),
+        "skew_degrees": round(skew, 2),
+    }
+    return tables_outcome(extracted_tables, preprocessing, timer, cache_keys, fingerprint)
+
+
+def is_pdf(contents):
+    return contents[:5] == b"%PDF-"
+
+
+def split_pdf_pages(contents):
+    """Каждая страница PDF - отдельным одностраничным PDF
+
+    В процесс пула уходит только своя страница, а не весь файл на
+    каждую задачу. Текстовый слой страницы сохраняется.
+    """
+    import pypdfium2
+
+    pages = []
+    with _pdfium_lock:
+        doc = pypdfium2.PdfDocument(contents)
+        try:
+            for page in range(len(doc)):
+                single = pypdfium2.PdfDocument.new()
+                try:
+                    single.import_pages(doc, [page])
+                    buffer = io.BytesIO()
+                    single.save(buffer)
+                finally:
+                    single.close()
+                pages.append(buffer.getvalue())
+        finally:
+            doc.close()
+    return pages
+
+
+def extract_pdf_page(contents, page, params=None, cache_key=None):
+    """Извлекает все таблицы с одной страницы PDF (страницы идут в разные процессы)
+
+    contents - одностраничный PDF из split_pdf_pages, page - номер
+    страницы в исходном файле, cache_key - ключ кеша по исходному файлу
+    (байты отдельной страницы при каждом разбиении немного разные).
+    """
+    from img2table.document import PDF
+
+    params = resolve_params(params)
+    timer = StageTimer()
+    cache_keys = [cache_key or content_key(contents, params, page)]
+
+    # Страница рендерится в img2table в 200 dpi, текстовый слой PDF используется без OCR
+    pdf_doc = PDF(contents, pages=[0])
+    extracted_tables = run_extraction(pdf_doc, params).get(0, [])
+    timer.mark("ocr")
+
+    return tables_outcome(extracted_tables, {"page": page + 1}, timer, cache_keys)
@@ -0,0 +1,276 @@
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+# Режим сокращения точек scatter plot:
+#   auto   - выборка, а при очень большом числе точек - карта плотности
+#   sample - только выборка (без карты плотности)
+#   off    - отдаем все точки окна просмотра
+REDUCTION_MODE = os.environ.get("GEOQUICK_SCATTER_REDUCTION", "auto")
+# Запас за границами окна просмотра (доля ширины окна): hover у края оси продолжает работать
+WINDOW_MARGIN = float(os.environ.get("GEOQUICK_WINDOW_MARGIN", "0.02"))
+# Сколько точек телефон еще рисует без подвисаний
+MAX_SCATTER_POINTS = int(os.environ.get("GEOQUICK_MAX_SCATTER_POINTS", "20000"))
+# Выше этого числа видимых точек вместо scatter строим карту плотности
+DENSITY_THRESHOLD = int(os.environ.get("GEOQUICK_DENSITY_THRESHOLD", "300000"))
+# Размер сетки для карты плотности и поиска редких точек
+DENSITY_BINS = int(os.environ.get("GEOQUICK_DENSITY_BINS", "200"))
+OUTLIER_GRID = 128
+# Точки в ячейках сетки с таким или меньшим числом соседей считаем выбросами
+SPARSE_CELL_MAX = 2
+# При большем числе групп цвет считаем непрерывным и не стратифицируем
+MAX_STRATA = 50
+# Минимум точек на группу, чтобы маленькие группы не пропадали из легенды
+MIN_PER_GROUP = 50
+
+
+class PointReduction:
+    """Результат сокращения точек перед построением фигуры"""
+
+    def __init__(self, df, mode, total, shown, density=None):
+        self.df = df
+        self.mode = mode  # full / windowed / sampled / density
+        self.total = total
+        self.shown = shown
+        self.density = density
+        self.render = None  # webgl / svg - выбирается при построении фигуры
+
+    @property
+    def reduced(self):
+        return self.mode != "full"
+
+    def summary(self):
+        return {"mode": self.mode, "total": self.total, "shown": self.shown, "render": self.render}
+
+
+def display_values(series, log):
+    """Значения колонки в пространстве отображения оси (log10 для лог. шкалы)"""
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    if log:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = np.where(values > 0, np.log10(values), np.nan)
+    return values
+
+
+def display_range(value_range, log):
+    """Пользовательский диапазон оси в пространстве отображения"""
+    if not value_range:
+        return None
+    bounds = []
+    for value in value_range:
+        if value is not None and log:
+            # На лог. шкале неположительная граница не имеет смысла
+            value = math.log10(value) if value > 0 else None
+        bounds.append(value)
+    if bounds[0] is None and bounds[1] is None:
+        return None
+    return bounds
+
+
+class SortedIndex:
+    """Значения колонки в пространстве оси, отсортированные один раз на датасет
+
+    Строки в диапазоне - два searchsorted (O(log n)) и срез перестановки
+    (O(k)) вместо прохода по всей колонке. NaN и неположительные значения
+    на лог. шкале в индекс не попадают.
+    """
+
+    def __init__(self, values):
+        finite = np.flatnonzero(np.isfinite(values))
+        order = finite[np.argsort(values[finite], kind="stable")]
+        self.order = order.astype(np.int32 if len(values) < 2**31 else np.int64)
+        self.values = values[order]
+        self.nbytes = self.order.nbytes + self.values.nbytes
+
+    def __len__(self):
+        return len(self.order)
+
+    def extent(self):
+        return float(self.values[0]), float(self.values[-1])
+
+    def rows_between(self, bounds):
+        """Номера строк со значением в [lo, hi] (None - граница не задана), в порядке значений"""
+        lo, hi = bounds or (None, None)
+        start = 0 if lo is None else int(np.searchsorted(self.values, lo, side="left"))
+        stop = len(self.values) if hi is None else int(np.searchsorted(self.values, hi, side="right"))
+        return self.order[start:stop]
+
+
+def sorted_index(df, column, log, memo=None):
+    """SortedIndex колонки; с memo (CachedDataset.memo) строится один раз на датасет"""
+    def build():
+        return SortedIndex(display_values(df[column], log))
+
+    return memo(("sorted_index", column, bool(log)), build) if memo else build()
+
+
+def with_margin(bounds, extent, margin=WINDOW_MARGIN):
+    """Границы окна, расширенные на долю его ширины (незаданная граница остается открытой)"""
+    if not bounds:
+        return None
+    lo = bounds[0] if bounds[0] is not None else extent[0]
+    hi = bounds[1] if bounds[1] is not None else extent[1]
+    pad = max(hi - lo, 0.0) * margin
+    return [None if bounds[0] is None else bounds[0] - pad,
+            None if bounds[1] is None else bounds[1] + pad]
+
+
+def window_rows(df, x, y, log_x, log_y, x_bounds, y_bounds, memo=None):
+    """Номера строк (по возрастанию), видимых в окне просмотра с запасом
+
+    По оси с более узким результатом строки берутся из отсортированного
+    индекса, вторая ось проверяется только для найденных k строк.
+    """
+    candidates = []
+    for column, log, bounds in ((x, log_x, x_bounds), (y, log_y, y_bounds)):
+        if bounds:
+            index = sorted_index(df, column, log, memo)
+            if len(index) == 0:
+                return np.empty(0, dtype=np.int64)
+            bounds = with_margin(bounds, index.extent())
+            candidates.append((index.rows_between(bounds), column, log, bounds))
+    candidates.sort(key=lambda candidate: len(candidate[0]))
+
+    rows = np.sort(candidates[0][0])  # исходный порядок строк
+    # Вторая ось: ее окно (если задано) или просто конечные значения
+    if len(candidates) > 1:
+        _, column, log, bounds = candidates[1]
+    else:
+        column, log, bounds = (y, log_y, None) if x_bounds else (x, log_x, None)
+    values = display_values(df[column].iloc[rows], log)
+    return rows[_window_mask(values, bounds)]
+
+
+def _window_mask(values, bounds):
+    mask = np.isfinite(values)
+    if bounds:
+        if bounds[0] is not None:
+            mask &= values >= bounds[0]
+        if bounds[1] is not None:
+            mask &= values <= bounds[1]
+    return mask
+
+
+def _extent(values, bounds):
+    lo = bounds[0] if bounds and bounds[0] is not None else float(values.min())
+    hi = bounds[1] if bounds and bounds[1] is not None else float(values.max())
+    if hi <= lo:
+        hi = lo + 1.0
+    return lo, hi
+
+
+def _grid_cells(xs, ys, x_extent, y_extent, size):
+    ix = ((xs - x_extent[0]) / (x_extent[1] - x_extent[0]) * size).astype(np.int64)
+    iy = ((ys - y_extent[0]) / (y_extent[1] - y_extent[0]) * size).astype(np.int64)
+    np.clip(ix, 0, size - 1, out=ix)
+    np.clip(iy, 0, size - 1, out=iy)
+    return ix * size + iy
+
+
+def _extreme_points(xs, ys, cells, budget, rng):
+    """Индексы точек, которые нельзя потерять: границы облака и редкие выбросы"""
+    extremes = np.unique([xs.argmin(), xs.argmax(), ys.argmin(), ys.argmax()])
+
+    counts = np.bincount(cells, minlength=OUTLIER_GRID * OUTLIER_GRID)
+    sparse = np.flatnonzero(counts[cells] <= SPARSE_CELL_MAX)
+    if len(sparse) > budget:
+        # Слишком много редких точек - оставляем по одной на ячейку
+        _, first = np.unique(cells[sparse], return_index=True)
+        sparse = sparse[first]
+    if len(sparse) > budget:
+        sparse = rng.choice(sparse, budget, replace=False)
+
+    return np.union1d(extremes, sparse)
+
+
+def _stratified_sample(groups, candidates, budget, rng):
+    """Случайная выборка с сохранением доли каждой группы цвета"""
+    if len(candidates) <= budget:
+        return candidates
+
+    codes = groups[candidates]
+    sizes = np.bincount(codes)
+    quota = np.floor(sizes * (budget / len(candidates))).astype(np.int64)
+    # Маленькие группы сохраняем хотя бы частично
+    quota = np.maximum(quota, np.minimum(sizes, MIN_PER_GROUP))
+
+    # Случайный ранг точки внутри своей группы (без цикла по группам)
+    order = np.lexsort((rng.random(len(candidates)), codes))
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    rank = np.empty(len(candidates), dtype=np.int64)
+    rank[order] = np.arange(len(candidates)) - starts[codes[order]]
+
+    return candidates[rank < quota[codes]]
+
+
+def reduce_points(df, x, y, color=None, log_x=False, log_y=False, x_range=None, y_range=None,
+                  max_points=MAX_SCATTER_POINTS, density_threshold=DENSITY_THRESHOLD,
+                  mode=REDUCTION_MODE, memo=None):
+    """Сокращает число точек scatter plot в пространстве отображения осей
+
+    memo - кеш производных данных датасета (CachedDataset.memo): в нем
+    живут отсортированные индексы колонок для запросов по окну.
+    """
+    total = len(df)
+    # Категориальные оси не сокращаем - бинировать их нельзя
+    numeric = pd.api.types.is_numeric_dtype(df[x]) and pd.api.types.is_numeric_dtype(df[y])
+    x_bounds = display_range(x_range, log_x)
+    y_bounds = display_range(y_range, log_y)
+
+    if numeric and (x_bounds or y_bounds):
+        # Задано окно просмотра: точки вне его (плюс запас) не отправляем вовсе
+        visible = window_rows(df, x, y, log_x, log_y, x_bounds, y_bounds, memo)
+        if mode == "off" or len(visible) <= max_points:
+            return PointReduction(df.iloc[visible], "windowed" if len(visible) < total else "full",
+                                  total, len(visible))
+        xs = display_values(df[x].iloc[visible], log_x)
+        ys = display_values(df[y].iloc[visible], log_y)
+    else:
+        if mode == "off" or total <= max_points or not numeric:
+            return PointReduction(df, "full", total, total)
+
+        xs = display_values(df[x], log_x)
+        ys = display_values(df[y], log_y)
+        # Неположительные значения на лог. шкале не видны
+        visible = np.flatnonzero(np.isfinite(xs) & np.isfinite(ys))
+        if len(visible) <= max_points:
+            return PointReduction(df.iloc[visible], "windowed" if len(visible) < total else "full",
+                                  total, len(visible))
+        xs, ys = xs[visible], ys[visible]
+    x_extent = _extent(xs, x_bounds)
+    y_extent = _extent(ys, y_bounds)
+    rng = np.random.default_rng(0)  # Детерминированно: один и тот же вид при перезагрузке
+
+    cells = _grid_cells(xs, ys, x_extent, y_extent, OUTLIER_GRID)
+    keep = _extreme_points(xs, ys, cells, max_points // 4, rng)
+
+    if mode == "auto" and len(visible) > density_threshold:
+        counts, x_edges, y_edges = np.histogram2d(
+            xs, ys, bins=DENSITY_BINS, range=[x_extent, y_extent]
+        )
+        x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+        y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+        density = {
+            "x": 10 ** x_centers if log_x else x_centers,
+            "y": 10 ** y_centers if log_y else y_centers,
+            # Heatmap ожидает z[строка=y][колонка=x], пустые ячейки не рисуем
+            "z": np.where(counts.T > 0, counts.T, np.nan),
+        }
+        return PointReduction(df.iloc[visible[keep]], "density", total, len(keep), density)
+
+    if color and color in df.columns:
+        groups, uniques = pd.factorize(df[color].iloc[visible])
+        if len(uniques) > MAX_STRATA:
+            groups = np.zeros(len(visible), dtype=np.int64)
+        # NaN в колонке цвета - отдельная группа
+        groups = np.where(groups < 0, groups.max() + 1, groups)
+    else:
+        groups = np.zeros(len(visible), dtype=np.int64)
+
+    rest = np.setdiff1d(np.arange(len(visible)), keep, assume_unique=True)
+    sample = _stratified_sample(groups, rest, max_points - len(keep), rng)
+    chosen = np.union1d(keep, sample)  # union1d сортирует - исходный порядок строк сохраняется
+
+    return PointReduction(df.iloc[visible[chosen]], "sampled", total, len(chosen))
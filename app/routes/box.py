@@ -1,38 +1,85 @@
 from fastapi import APIRouter, Request, Form
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import RedirectResponse, HTMLResponse
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse, Response
+from app.dataset_cache import load_session_dataset, no_data_error
+from app.static_assets import PLOTLY_INCLUDE
+from app.charts import MOBILE_CONFIG, cacheable, figure_body, not_modified
+from app.figure_cache import client_has, figure_cache, figure_key
+from app.metrics import span
+from app.subsystems import chart_stack
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
 
-def create_mobile_boxplot(df, y_column, group_column=None):
-    """Создает мобильно-оптимизированный box plot"""
-    
+def build_mobile_boxplot(df, y_column, group_column=None, memo=None):
+    """Строит Plotly-фигуру box plot (ValueError если колонка не подходит)
+
+    Статистика считается на сервере, в браузер уходят только квартили,
+    усы и ограниченное число выбросов. memo - кеш производных данных
+    датасета (CachedDataset.memo), чтобы не пересчитывать статистику.
+    """
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    from app.box_stats import compute_box_stats
+
     if y_column not in df.columns:
-        return "<div class='text-red-500 p-4'>Selected column not found</div>"
+        raise ValueError("Selected column not found")
     
     # Проверяем что Y колонка числовая
     if not pd.api.types.is_numeric_dtype(df[y_column]):
-        return f"<div class='text-red-500 p-4'>Column '{y_column}' is not numeric</div>"
+        raise ValueError(f"Column '{y_column}' is not numeric")
+    
+    if not (group_column and group_column in df.columns):
+        group_column = None
+    
+    def compute():
+        return compute_box_stats(df, y_column, group_column)
     
-    # Создаем box plot
-    if group_column and group_column in df.columns and group_column != "":
+    with span("box.stats"):
+        stats = memo(("box_stats", y_column, group_column), compute) if memo else compute()
+    
+    # Box plot из предвычисленных квартилей
+    fig = go.Figure(go.Box(
+        x=stats.labels,
+        q1=stats.q1,
+        median=stats.median,
+        q3=stats.q3,
+        lowerfence=stats.lowerfence,
+        upperfence=stats.upperfence,
+        mean=stats.mean,
+        boxpoints=False,
+        name=y_column,
+    ))
+    # Выбросы отдельным слоем (не больше лимита на группу)
+    if stats.outlier_y:
+        fig.add_trace(go.Scatter(
+            x=stats.outlier_x,
+            y=stats.outlier_y,
+            mode="markers",
+            marker=dict(size=4, color='#636efa'),  # Цвет первого трейса в plotly_dark
+            name="outliers",
+        ))
+    
+    if group_column:
         # С группировкой
-        fig = px.box(df, y=y_column, x=group_column, 
-                    template="plotly_dark",
-                    title=f"{y_column} distribution by {group_column}")
+        fig.update_layout(
+            template="plotly_dark",
+            title=f"{y_column} distribution by {group_column}",
+            xaxis_title=group_column,
+            yaxis_title=y_column,
+        )
         
         # Поворачиваем подписи X если они длинные
         fig.update_xaxes(tickangle=45)
     else:
         # Без группировки - один box plot
-        fig = px.box(df, y=y_column, 
-                    template="plotly_dark",
-                    title=f"{y_column} distribution")
+        fig.update_layout(
+            template="plotly_dark",
+            title=f"{y_column} distribution",
+            yaxis_title=y_column,
+        )
     
     # Мобильная оптимизация
     fig.update_layout(
@@ -60,81 +107,115 @@ def create_mobile_boxplot(df, y_column, group_column=None):
         automargin=True
     )
     
-    # Мобильная конфигурация (такая же как в scatter)
-    config = {
-        "displayModeBar": False,  # Убираем панель инструментов
-        "responsive": True,       # Адаптивный размер
-        "doubleClick": False,     # Отключаем двойной клик
-        "scrollZoom": False,      # Отключаем зум скроллом
-        "showTips": False,        # Убираем подсказки
-        "staticPlot": False,      # Оставляем интерактивность для hover
-        "displaylogo": False,     # Убираем логотип Plotly
-        # Отключаем все взаимодействия кроме hover
-        "modeBarButtonsToRemove": [
-            'pan2d', 'select2d', 'lasso2d', 'zoomIn2d', 'zoomOut2d',
-            'autoScale2d', 'resetScale2d', 'zoom2d'
-        ]
-    }
-    
-    return fig.to_html(full_html=False, config=config)
+    return fig
+
+
+def create_mobile_boxplot(df, y_column, group_column=None, memo=None):
+    """Создает мобильно-оптимизированный box plot"""
+    try:
+        with span("box.build"):
+            fig = build_mobile_boxplot(df, y_column, group_column, memo)
+    except ValueError as e:
+        return f"<div class='text-red-500 p-4'>{e}</div>"
+
+    # plotly.js подключается отдельным кешируемым скриптом, а не встраивается
+    with span("figure.to_html"):
+        return fig.to_html(full_html=False, include_plotlyjs=PLOTLY_INCLUDE, config=MOBILE_CONFIG)
+
+
+def cached_boxplot_html(dataset, y, group=None):
+    """HTML графика из кеша; строится только при первом запросе с такими параметрами"""
+    key = figure_key("box-html", dataset, y=y, group=group or "")
+    return figure_cache.get_or_render(key, lambda: create_mobile_boxplot(
+        dataset.frame([y, group or ""]), y, group, dataset.memo
+    ))
 
 
 @router.get("/box")
 async def box_get(request: Request):
-    # Загружаем данные из сессии
-    data_path = request.session.get("data_path")
-    gsheet_csv_url = request.session.get("gsheet_csv_url")
-    if data_path:
-        df = pd.read_csv(data_path)
-    elif gsheet_csv_url:
-        df = pd.read_csv(gsheet_csv_url)
-    else:
+    # Загружаем данные из сессии (распарсенный датасет берется из кеша)
+    dataset = await load_session_dataset(request)
+    if dataset is None:
         return RedirectResponse("/upload", status_code=303)
 
-    columns = list(df.columns)
+    columns = list(dataset.columns)
     
     # Находим числовые колонки для Y
-    numeric_columns = df.select_dtypes(include=['number']).columns.tolist()
+    numeric_columns = list(dataset.numeric_columns)
     
     # По умолчанию берем первую числовую колонку для Y
     y = numeric_columns[0] if numeric_columns else columns[0]
     group = ""  # По умолчанию нет группировки
     plot_html = ""
     
+    # Страница по умолчанию зависит только от данных - повторный заход отдаем как 304
+    etag = figure_cache.etag(figure_key("box-page", dataset, y=y, group=group))
+    if client_has(request, etag):
+        return not_modified(etag)
+
     if y:
-        plot_html = create_mobile_boxplot(df, y, group)
+        await chart_stack.ensure_async()
+        plot_html = cached_boxplot_html(dataset, y)
 
-    return templates.TemplateResponse("box.html", {
-        "request": request,
-        "columns": columns,
-        "numeric_columns": numeric_columns,
-        "y": y,
-        "group": group,
-        "plot_html": plot_html
-    })
+    with span("template.box"):
+        page = templates.TemplateResponse("box.html", {
+            "request": request,
+            "columns": columns,
+            "numeric_columns": numeric_columns,
+            "y": y,
+            "group": group,
+            "plot_html": plot_html
+        })
+    return cacheable(page, etag)
 
 
 @router.post("/box")
 async def box_post(request: Request, y: str = Form(...), group: str = Form("")):
-    data_path = request.session.get("data_path")
-    gsheet_csv_url = request.session.get("gsheet_csv_url")
-    if data_path:
-        df = pd.read_csv(data_path)
-    elif gsheet_csv_url:
-        df = pd.read_csv(gsheet_csv_url)
-    else:
+    dataset = await load_session_dataset(request)
+    if dataset is None:
         return RedirectResponse("/upload", status_code=303)
 
-    columns = list(df.columns)
-    numeric_columns = df.select_dtypes(include=['number']).columns.tolist()
+    columns = list(dataset.columns)
+    numeric_columns = list(dataset.numeric_columns)
     
-    plot_html = create_mobile_boxplot(df, y, group if group else None)
-
-    return templates.TemplateResponse("box.html", {
-        "request": request,
-        "columns": columns,
-        "numeric_columns": numeric_columns,
-        "y": y,
-        "group": group,
-        "plot_html": plot_html
-    })
\ No newline at end of file
+    # Читаем только колонки, которые нужны графику
+    await chart_stack.ensure_async()
+    plot_html = cached_boxplot_html(dataset, y, group if group else None)
+
+    with span("template.box"):
+        return templates.TemplateResponse("box.html", {
+            "request": request,
+            "columns": columns,
+            "numeric_columns": numeric_columns,
+            "y": y,
+            "group": group,
+            "plot_html": plot_html
+        })
+
+
+@router.get("/api/box")
+async def box_api(request: Request, y: str, group: str = ""):
+    """Фигура box plot в JSON для обновления графика без перезагрузки страницы"""
+    dataset = await load_session_dataset(request)
+    if dataset is None:
+        return JSONResponse({"success": False, "error": no_data_error(request)})
+
+    key = figure_key("box-json", dataset, y=y, group=group)
+    etag = figure_cache.etag(key)
+    if client_has(request, etag):
+        return not_modified(etag)
+
+    await chart_stack.ensure_async()
+
+    def render():
+        df = dataset.frame([y, group])
+        with span("box.build"):
+            fig = build_mobile_boxplot(df, y, group if group else None, dataset.memo)
+        return figure_body(fig)
+
+    try:
+        body = figure_cache.get_or_render(key, render)
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)})
+
+    return cacheable(Response(body, media_type="application/json"), etag)
@@ -1,113 +1,109 @@
+from typing import List
+
 from fastapi import APIRouter, Request, UploadFile, File
 from fastapi.responses import JSONResponse
-import cv2
-import numpy as np
-import tempfile
-import pandas as pd
-import os
-import platform
+from app.dataset_cache import set_session_dataset
+from app.dataset_store import session_id
+from app.ocr_jobs import ocr_queue, QueueFullError
+from app.subsystems import ocr_stack
 
 router = APIRouter()
 
-# Кроссплатформенная настройка Tesseract
-def setup_tesseract():
-    if platform.system() == "Windows":
-        import pytesseract
-        # Локально на Windows
-        tesseract_path = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-        if os.path.exists(tesseract_path):
-            pytesseract.pytesseract.tesseract_cmd = tesseract_path
-        else:
-            print("Tesseract not found at default Windows location")
-    # На Linux (Render) tesseract будет в PATH автоматически
-
-# Инициализация
-setup_tesseract()
-
-try:
-    from img2table.document import Image
-    from img2table.ocr import TesseractOCR
-    
-    ocr = TesseractOCR(n_threads=1, lang="eng")
-    IMG2TABLE_AVAILABLE = True
-    print("✅ img2table + tesseract initialized successfully")
-except Exception as e:
-    print(f"❌ img2table not available: {e}")
-    IMG2TABLE_AVAILABLE = False
+# Дольше этого long-poll статуса не держим соединение
+MAX_WAIT_SECONDS = 30
+
+
+def unavailable_response():
+    return JSONResponse({
+        "success": False, 
+        "error": "img2table not available on this system"
+    })
+
+
+async def submit_job(request, files):
+    """Ставит загруженные изображения и PDF в очередь OCR"""
+    sources = [(file.filename, await file.read()) for file in files]
+    return await ocr_queue.submit(session_id(request), sources)
+
+
+def queue_full_response(error):
+    return JSONResponse({"success": False, "error": str(error)}, status_code=429,
+                        headers={"Retry-After": "5"})
+
+
+def job_response(request, job):
+    """Статус задачи; готовый результат привязываем к сессии владельца"""
+    if job.status == "done" and not job.attached and job.session_id == request.session.get("sid"):
+        set_session_dataset(request, job.data_path, "img2table")
+        job.attached = True
+        ocr_queue.save(job)
+    return JSONResponse(job.to_dict())
+
+
+def find_job(request, job_id):
+    """Задача этой сессии (чужие задачи не видны)"""
+    job = ocr_queue.get(job_id)
+    if job is None or job.session_id != request.session.get("sid"):
+        return None
+    return job
+
+
+def job_not_found():
+    return JSONResponse({"success": False, "error": "Job not found"}, status_code=404)
+
 
 @router.post("/api/img2table-extract")
 async def extract_with_img2table(request: Request, file: UploadFile = File(...)):
-    """Извлечение таблиц с помощью img2table + tesseract"""
+    """Извлечение таблиц с помощью img2table + tesseract (ждет результат)"""
     
-    if not IMG2TABLE_AVAILABLE:
-        return JSONResponse({
-            "success": False, 
-            "error": "img2table not available on this system"
-        })
+    if not await ocr_stack.ensure_async():
+        return unavailable_response()
     
     try:
-        # Читаем изображение
-        contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if image is None:
-            return JSONResponse({"success": False, "error": "Invalid image format"})
-        
-        # Сохраняем временно изображение
-        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-            cv2.imwrite(temp_file.name, image)
-            
-            # Создаем Image объект
-            img_doc = Image(temp_file.name)
-            
-            # Извлекаем таблицы с настройками для научных таблиц
-            extracted_tables = img_doc.extract_tables(
-                ocr=ocr, 
-                implicit_rows=True,      # Важно для таблиц без всех линий
-                borderless_tables=True,  # Поддержка таблиц без границ
-                min_confidence=30        # Понижаем порог для научных таблиц
-            )
-            
-            if not extracted_tables:
-                return JSONResponse({"success": False, "error": "No tables detected"})
-            
-            # Берем первую найденную таблицу
-            table = extracted_tables[0]
-            df = table.df
-            
-            if df.empty:
-                return JSONResponse({"success": False, "error": "Empty table extracted"})
-            
-            # Очищаем и обрабатываем данные
-            df = df.dropna(how='all').reset_index(drop=True)
-            
-            # Убираем пустые колонки
-            df = df.loc[:, df.any()]
-            
-            # Подготавливаем данные
-            headers = df.columns.tolist()
-            rows = df.values.tolist()
-            
-            # Сохраняем в сессию
-            temp_csv = tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False)
-            df.to_csv(temp_csv.name, index=False)
-            temp_csv.close()
-            
-            request.session["data_path"] = temp_csv.name
-            request.session["data_source"] = "img2table"
-            
-            # Очищаем временный файл
-            os.unlink(temp_file.name)
-            
-            return JSONResponse({
-                "success": True,
-                "message": f"Extracted {len(rows)} rows with {len(headers)} columns",
-                "preview": {"headers": headers, "rows": rows[:5]},
-                "method": "img2table + tesseract",
-                "tables_found": len(extracted_tables)
-            })
-            
-    except Exception as e:
-        print(f"img2table error details: {e}")
-        return JSONResponse({"success": False, "error": f"img2table error: {str(e)}"})
\ No newline at end of file
+        job = await submit_job(request, [file])
+    except QueueFullError as e:
+        return queue_full_response(e)
+    
+    # OCR идет в пуле процессов, event loop при этом свободен
+    await job.done.wait()
+    return job_response(request, job)
+
+
+@router.post("/api/img2table-jobs")
+async def create_img2table_job(request: Request, files: List[UploadFile] = File(...)):
+    """Асинхронное извлечение из изображений и многостраничных PDF: сразу возвращает id задачи"""
+    
+    if not await ocr_stack.ensure_async():
+        return unavailable_response()
+    
+    try:
+        job = await submit_job(request, files)
+    except QueueFullError as e:
+        return queue_full_response(e)
+    
+    return JSONResponse({"success": True, "job_id": job.id, "status": job.status}, status_code=202)
+
+
+@router.get("/api/img2table-jobs/{job_id}")
+async def get_img2table_job(request: Request, job_id: str, wait: float = 0):
+    """Статус задачи; wait > 0 - long-poll до завершения (в секундах)"""
+    job = find_job(request, job_id)
+    if job is None:
+        return job_not_found()
+    
+    if wait > 0 and not job.done.is_set():
+        job = await ocr_queue.wait(job, min(wait, MAX_WAIT_SECONDS))
+    
+    return job_response(request, job)
+
+
+@router.post("/api/img2table-jobs/{job_id}/tables/{table_id}/select")
+async def select_img2table_table(request: Request, job_id: str, table_id: str):
+    """Выбор таблицы из результата задачи для /scatter и /box"""
+    job = find_job(request, job_id)
+    if job is None:
+        return job_not_found()
+    if job.status != "done" or not ocr_queue.select(job, table_id):
+        return JSONResponse({"success": False, "error": "Table not found"}, status_code=404)
+    
+    return job_response(request, job)
@@ -1,18 +1,69 @@
 from fastapi import APIRouter, Request, Form
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import RedirectResponse, HTMLResponse
-import pandas as pd
-import plotly.express as px
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse, Response
+from app.dataset_cache import load_session_dataset, no_data_error
+from app.static_assets import PLOTLY_INCLUDE
+from app.charts import MOBILE_CONFIG, cacheable, figure_body, not_modified, render_mode
+from app.figure_cache import client_has, figure_cache, figure_key
+from app.metrics import row_counts, span
+from app.subsystems import chart_stack
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
 
-def create_mobile_plot(df, x, y, color=None, log_x=False, log_y=False, x_range=None, y_range=None):
-    if color and color in df.columns:
-        fig = px.scatter(df, x=x, y=y, color=color, template="plotly_white")
+def parse_range(min_value, max_value):
+    """Парсит границы диапазона из формы (None если диапазон не задан)"""
+    try:
+        min_val = float(min_value.strip()) if min_value.strip() else None
+        max_val = float(max_value.strip()) if max_value.strip() else None
+    except ValueError:
+        return None  # Игнорируем неверные значения
+
+    if min_val is None and max_val is None:
+        return None
+    return [min_val, max_val]
+
+
+def build_mobile_plot(df, x, y, color=None, log_x=False, log_y=False, x_range=None, y_range=None,
+                      memo=None):
+    """Строит Plotly-фигуру scatter plot (общая логика для HTML и JSON API)
+
+    Возвращает фигуру и отчет о сокращении числа точек. memo - кеш
+    производных данных датасета (CachedDataset.memo) для индексов окна.
+    """
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    from app.point_reduction import reduce_points, display_range
+
+    # Сокращаем число точек до построения фигуры (в пространстве осей)
+    with span("scatter.reduce"):
+        reduction = reduce_points(df, x, y, color, log_x, log_y, x_range, y_range, memo=memo)
+    row_counts.observe(reduction.shown, kind="scatter_points")
+    plot_df = reduction.df
+    # Много точек - WebGL: SVG создает DOM-элемент на каждую точку
+    reduction.render = render_mode(reduction.shown)
+    scatter_trace = go.Scattergl if reduction.render == "webgl" else go.Scatter
+
+    if reduction.mode == "density":
+        # Слишком много точек - карта плотности плюс выбросы поверх нее
+        fig = go.Figure(go.Heatmap(
+            x=reduction.density["x"],
+            y=reduction.density["y"],
+            z=reduction.density["z"],
+            colorscale="Blues",
+            colorbar=dict(title="count"),
+            hovertemplate=f"{x}: %{{x}}<br>{y}: %{{y}}<br>count: %{{z}}<extra></extra>",
+        ))
+        fig.add_trace(scatter_trace(x=plot_df[x], y=plot_df[y], mode="markers", name="outliers"))
+        fig.update_layout(template="plotly_white", xaxis_title=x, yaxis_title=y)
+        color = None
+    elif color and color in df.columns:
+        fig = px.scatter(plot_df, x=x, y=y, color=color, template="plotly_white",
+                         render_mode=reduction.render)
     else:
-        fig = px.scatter(df, x=x, y=y, template="plotly_white")
+        fig = px.scatter(plot_df, x=x, y=y, template="plotly_white", render_mode=reduction.render)
     
     # Мобильная оптимизация с белым фоном
     fig.update_layout(
@@ -54,7 +105,7 @@ def create_mobile_plot(df, x, y, color=None, log_x=False, log_y=False, x_range=N
         tickfont=dict(color='black', size=11),
         title_font=dict(color='black', size=12),
         type='log' if log_x else 'linear',  # Логарифмический масштаб
-        range=x_range if x_range else None  # Пользовательский диапазон X
+        range=display_range(x_range, log_x)  # Пользовательский диапазон X (в единицах оси)
     )
     fig.update_yaxes(
         fixedrange=True,  # Запрещаем зум по Y  
@@ -72,7 +123,7 @@ def create_mobile_plot(df, x, y, color=None, log_x=False, log_y=False, x_range=N
         tickfont=dict(color='black', size=11),
         title_font=dict(color='black', size=12),
         type='log' if log_y else 'linear',  # Логарифмический масштаб
-        range=y_range if y_range else None  # Пользовательский диапазон Y
+        range=display_range(y_range, log_y)  # Пользовательский диапазон Y (в единицах оси)
     )
     
     # Обновляем цвета точек для лучшей видимости на белом фоне
@@ -82,40 +133,56 @@ def create_mobile_plot(df, x, y, color=None, log_x=False, log_y=False, x_range=N
             size=8,
             opacity=0.7,
             line=dict(width=1, color='white')  # Белая обводка
-        ))
+        ), selector=lambda trace: trace.type != 'heatmap')
     
-    # Мобильная конфигурация
-    config = {
-        "displayModeBar": False,  # Убираем панель инструментов
-        "responsive": True,       # Адаптивный размер
-        "doubleClick": False,     # Отключаем двойной клик
-        "scrollZoom": False,      # Отключаем зум скроллом
-        "showTips": False,        # Убираем подсказки
-        "staticPlot": False,      # Оставляем интерактивность для hover
-        "displaylogo": False,     # Убираем логотип Plotly
-        # Отключаем все взаимодействия кроме hover
-        "modeBarButtonsToRemove": [
-            'pan2d', 'select2d', 'lasso2d', 'zoomIn2d', 'zoomOut2d',
-            'autoScale2d', 'resetScale2d', 'zoom2d'
-        ]
-    }
+    # Сообщаем пользователю, что показаны не все точки
+    if reduction.reduced:
+        if reduction.mode == "density":
+            note = f"Density of {reduction.total:,} points, {reduction.shown:,} outliers shown"
+        else:
+            note = f"Showing {reduction.shown:,} of {reduction.total:,} points ({reduction.mode})"
+        fig.add_annotation(
+            text=note,
+            xref="paper", yref="paper", x=0, y=1.02,
+            xanchor="left", yanchor="bottom",
+            showarrow=False,
+            font=dict(size=10, color='gray')
+        )
     
-    return fig.to_html(full_html=False, config=config)
+    return fig, reduction
+
+
+def create_mobile_plot(df, x, y, color=None, log_x=False, log_y=False, x_range=None, y_range=None,
+                       memo=None):
+    with span("scatter.build"):
+        fig, _ = build_mobile_plot(df, x, y, color, log_x, log_y, x_range, y_range, memo)
+
+    # plotly.js подключается отдельным кешируемым скриптом, а не встраивается
+    with span("figure.to_html"):
+        return fig.to_html(full_html=False, include_plotlyjs=PLOTLY_INCLUDE, config=MOBILE_CONFIG)
+
+
+def plot_key(kind, dataset, x, y, color, log_x, log_y, x_range, y_range):
+    return figure_key(kind, dataset, x=x, y=y, color=color or "", log_x=bool(log_x), log_y=bool(log_y),
+                      x_range=tuple(x_range or ()), y_range=tuple(y_range or ()))
+
+
+def cached_plot_html(dataset, x, y, color=None, log_x=False, log_y=False, x_range=None, y_range=None):
+    """HTML графика из кеша; строится только при первом запросе с такими параметрами"""
+    key = plot_key("scatter-html", dataset, x, y, color, log_x, log_y, x_range, y_range)
+    return figure_cache.get_or_render(key, lambda: create_mobile_plot(
+        dataset.frame([x, y, color or ""]), x, y, color, log_x, log_y, x_range, y_range, dataset.memo
+    ))
 
 
 @router.get("/scatter")
 async def scatter_get(request: Request):
-    # Загружаем данные из сессии
-    data_path = request.session.get("data_path")
-    gsheet_csv_url = request.session.get("gsheet_csv_url")
-    if data_path:
-        df = pd.read_csv(data_path)
-    elif gsheet_csv_url:
-        df = pd.read_csv(gsheet_csv_url)
-    else:
+    # Загружаем данные из сессии (распарсенный датасет берется из кеша)
+    dataset = await load_session_dataset(request)
+    if dataset is None:
         return RedirectResponse("/upload", status_code=303)
 
-    columns = list(df.columns)
+    columns = list(dataset.columns)
     x = columns[0] if columns else ""
     y = columns[1] if len(columns) > 1 else ""
     color = ""  # По умолчанию нет группировки
@@ -130,23 +197,32 @@ async def scatter_get(request: Request):
     
     plot_html = ""
     
+    # Страница по умолчанию зависит только от данных - повторный заход отдаем как 304
+    etag = figure_cache.etag(plot_key("scatter-page", dataset, x, y, color, log_x, log_y, None, None))
+    if client_has(request, etag):
+        return not_modified(etag)
+
     if x and y:
-        plot_html = create_mobile_plot(df, x, y, color, log_x, log_y)
-
-    return templates.TemplateResponse("scatter.html", {
-        "request": request,
-        "columns": columns,
-        "x": x,
-        "y": y,
-        "color": color,
-        "log_x": log_x,
-        "log_y": log_y,
-        "x_min": x_min,
-        "x_max": x_max,
-        "y_min": y_min,
-        "y_max": y_max,
-        "plot_html": plot_html
-    })
+        await chart_stack.ensure_async()
+        # Читаем только колонки, которые нужны графику
+        plot_html = cached_plot_html(dataset, x, y, None, log_x, log_y)
+
+    with span("template.scatter"):
+        page = templates.TemplateResponse("scatter.html", {
+            "request": request,
+            "columns": columns,
+            "x": x,
+            "y": y,
+            "color": color,
+            "log_x": log_x,
+            "log_y": log_y,
+            "x_min": x_min,
+            "x_max": x_max,
+            "y_min": y_min,
+            "y_max": y_max,
+            "plot_html": plot_html
+        })
+    return cacheable(page, etag)
 
 
 @router.post("/scatter")
@@ -160,54 +236,75 @@ async def scatter_post(request: Request,
                       x_max: str = Form(""),
                       y_min: str = Form(""),
                       y_max: str = Form("")):
-    data_path = request.session.get("data_path")
-    gsheet_csv_url = request.session.get("gsheet_csv_url")
-    if data_path:
-        df = pd.read_csv(data_path)
-    elif gsheet_csv_url:
-        df = pd.read_csv(gsheet_csv_url)
-    else:
+    dataset = await load_session_dataset(request)
+    if dataset is None:
         return RedirectResponse("/upload", status_code=303)
 
-    columns = list(df.columns)
+    columns = list(dataset.columns)
     
     # Обработка диапазонов
-    x_range = None
-    y_range = None
+    x_range = parse_range(x_min, x_max)
+    y_range = parse_range(y_min, y_max)
     
-    # Парсим X диапазон
-    try:
-        x_min_val = float(x_min.strip()) if x_min.strip() else None
-        x_max_val = float(x_max.strip()) if x_max.strip() else None
-        
-        if x_min_val is not None or x_max_val is not None:
-            x_range = [x_min_val, x_max_val]
-    except ValueError:
-        pass  # Игнорируем неверные значения
-    
-    # Парсим Y диапазон
+    await chart_stack.ensure_async()
+    plot_html = cached_plot_html(dataset, x, y, color if color else None, log_x, log_y, x_range, y_range)
+
+    with span("template.scatter"):
+        return templates.TemplateResponse("scatter.html", {
+            "request": request,
+            "columns": columns,
+            "x": x,
+            "y": y,
+            "color": color,
+            "log_x": log_x,
+            "log_y": log_y,
+            "x_min": x_min,
+            "x_max": x_max,
+            "y_min": y_min,
+            "y_max": y_max,
+            "plot_html": plot_html
+        })
+
+
+@router.get("/api/scatter")
+async def scatter_api(request: Request,
+                      x: str,
+                      y: str,
+                      color: str = "",
+                      log_x: bool = False,
+                      log_y: bool = False,
+                      x_min: str = "",
+                      x_max: str = "",
+                      y_min: str = "",
+                      y_max: str = ""):
+    """Фигура scatter plot в JSON для обновления графика без перезагрузки страницы"""
+    dataset = await load_session_dataset(request)
+    if dataset is None:
+        return JSONResponse({"success": False, "error": no_data_error(request)})
+
+    if x not in dataset.columns or y not in dataset.columns:
+        return JSONResponse({"success": False, "error": "Selected column not found"})
+
+    x_range = parse_range(x_min, x_max)
+    y_range = parse_range(y_min, y_max)
+
+    key = plot_key("scatter-json", dataset, x, y, color, log_x, log_y, x_range, y_range)
+    etag = figure_cache.etag(key)
+    if client_has(request, etag):
+        return not_modified(etag)
+
+    await chart_stack.ensure_async()
+
+    def render():
+        df = dataset.frame([x, y, color])
+        with span("scatter.build"):
+            fig, reduction = build_mobile_plot(df, x, y, color if color else None,
+                                               log_x, log_y, x_range, y_range, dataset.memo)
+        return figure_body(fig, points=reduction.summary())
+
     try:
-        y_min_val = float(y_min.strip()) if y_min.strip() else None
-        y_max_val = float(y_max.strip()) if y_max.strip() else None
-        
-        if y_min_val is not None or y_max_val is not None:
-            y_range = [y_min_val, y_max_val]
-    except ValueError:
-        pass  # Игнорируем неверные значения
-    
-    plot_html = create_mobile_plot(df, x, y, color if color else None, log_x, log_y, x_range, y_range)
-
-    return templates.TemplateResponse("scatter.html", {
-        "request": request,
-        "columns": columns,
-        "x": x,
-        "y": y,
-        "color": color,
-        "log_x": log_x,
-        "log_y": log_y,
-        "x_min": x_min,
-        "x_max": x_max,
-        "y_min": y_min,
-        "y_max": y_max,
-        "plot_html": plot_html
-    })
\ No newline at end of file
+        body = figure_cache.get_or_render(key, render)
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)})
+
+    return cacheable(Response(body, media_type="application/json"), etag)
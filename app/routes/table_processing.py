@@ -0,0 +1,75 @@
+import base64
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import APIRouter, Request, UploadFile, File
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+from app import ocr_worker
+from app.ocr_jobs import ocr_queue
+
+router = APIRouter()
+
+
+def table_rows(payload):
+    """Ячейки таблицы из того, что прислал браузер после OCR
+
+    Предпочитаем уже выровненную клиентом таблицу, затем слова с
+    координатами, затем сырой текст.
+    """
+    from app.table_cleaning import grid_from_text, grid_from_words
+
+    preliminary = payload.get("preliminary_data") or {}
+    if preliminary.get("rows"):
+        return [preliminary.get("headers") or []] + preliminary["rows"]
+    if payload.get("lines"):
+        return grid_from_words(payload["lines"])
+    return grid_from_text(payload.get("raw_text"))
+
+
+def process_table(payload):
+    from app.table_cleaning import clean_table, display_rows
+
+    rows = [row for row in table_rows(payload) if row]
+    df, numeric_columns, header_rows = clean_table(rows)
+    return {
+        "success": True,
+        "data": {"headers": df.columns.tolist(), "rows": display_rows(df)},
+        "numeric_columns": numeric_columns,
+        "header_rows": header_rows,
+    }
+
+
+@router.post("/api/process-table-data")
+async def process_table_data(request: Request):
+    """Серверная очистка таблицы, распознанной в браузере"""
+    try:
+        payload = await request.json()
+    except ValueError:
+        return JSONResponse({"success": False, "error": "Invalid JSON"}, status_code=400)
+
+    # Проверка доступности сервера из photo_uploader.js
+    if payload.get("test"):
+        return JSONResponse({"success": True})
+
+    try:
+        result = await run_in_threadpool(process_table, payload)
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)})
+    return JSONResponse(result)
+
+
+@router.post("/api/enhance-image")
+async def enhance_image(file: UploadFile = File(...)):
+    """Контраст, порог и шумоподавление фото таблицы (в пуле процессов)"""
+    contents = await file.read()
+    try:
+        enhanced = await ocr_queue.run(ocr_worker.enhance_image, contents)
+    except BrokenProcessPool:
+        return JSONResponse({"success": False, "error": "Image worker crashed, please try again"})
+
+    if enhanced is None:
+        return JSONResponse({"success": False, "error": "Invalid image format"})
+
+    encoded = base64.b64encode(enhanced).decode("ascii")
+    return JSONResponse({"success": True, "enhanced_image": f"data:image/png;base64,{encoded}"})
@@ -1,28 +1,34 @@
 from fastapi import APIRouter, Request, Form, UploadFile, File
 from fastapi.responses import RedirectResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
-import os, shutil
-import pandas as pd
 import json
-import tempfile
+from app.dataset_cache import invalidate_session_dataset, set_session_dataset
+from app.ingest import MAX_UPLOAD_BYTES, IngestError, ingest_upload, store_frame
+from app.sheets import SheetFetchError, sheet_fetcher
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
-UPLOAD_DIR = "app/uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+def render_upload(request, error=None, status_code=200):
+    return templates.TemplateResponse("upload.html", {
+        "request": request,
+        "error": error,
+        "max_upload_mb": MAX_UPLOAD_BYTES // (1024 * 1024)
+    }, status_code=status_code)
 
 @router.get("/upload")
 async def upload_get(request: Request):
-    return templates.TemplateResponse("upload.html", {"request": request})
+    # Графики перенаправляют сюда, если таблицу сессии не удалось загрузить
+    return render_upload(request, error=request.session.pop("data_error", None))
 
 @router.post("/upload_local")
 async def upload_local(request: Request, datafile: UploadFile = File(...)):
-    file_path = os.path.join(UPLOAD_DIR, datafile.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(datafile.file, buffer)
-    request.session["data_path"] = file_path
-    request.session["data_source"] = "local_file"
+    # Потоковый прием с лимитом размера; ошибки формата видны сразу, а не на графике
+    try:
+        manifest = await ingest_upload(datafile)
+    except IngestError as e:
+        return render_upload(request, error=str(e), status_code=400)
+    set_session_dataset(request, manifest["data_path"], "local_file")
     return RedirectResponse("/", status_code=303)
 
 @router.post("/upload_gsheet")
@@ -33,6 +39,13 @@ async def upload_gsheet(request: Request, gsheet_url: str = Form(...)):
         csv_url = gsheet_url.replace("/view#gid=", "/export?format=csv&gid=")
     else:
         csv_url = gsheet_url
+    # Скачиваем сразу: недоступная таблица - ошибка здесь, а не на странице графика
+    try:
+        await sheet_fetcher.fetch(csv_url)
+    except SheetFetchError as e:
+        return render_upload(request, error=str(e), status_code=400)
+    invalidate_session_dataset(request)
+    request.session.pop("data_path", None)
     request.session["gsheet_csv_url"] = csv_url
     request.session["data_source"] = "google_sheets"
     return RedirectResponse("/", status_code=303)
@@ -48,26 +61,16 @@ async def save_photo_data(request: Request, table_data: str = Form(...)):
         if not data or 'headers' not in data or 'rows' not in data:
             return JSONResponse({"success": False, "error": "Invalid data format"})
         
-        # Создаем DataFrame
-        df = pd.DataFrame(data['rows'], columns=data['headers'])
-        
-        # Пытаемся конвертировать числовые колонки
-        for col in df.columns:
-            try:
-                # Убираем лишние символы и пробелы
-                cleaned = df[col].astype(str).str.replace(r'[^\d\.-]', '', regex=True)
-                df[col] = pd.to_numeric(cleaned, errors='ignore')
-            except:
-                pass
+        # Создаем DataFrame: те же правила очистки, что и в /api/process-table-data
+        from app.table_cleaning import clean_table
+
+        df, _, _ = clean_table(data['rows'], headers=data['headers'])
         
-        # Сохраняем в сессию как временный файл (для совместимости с существующим кодом)
-        temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False)
-        df.to_csv(temp_file.name, index=False)
-        temp_file.close()
+        # Сохраняем в сессию как временный файл в колоночном формате (с манифестом)
+        data_path = store_frame(df, source_name="photo")
         
         # Сохраняем путь в сессию
-        request.session["data_path"] = temp_file.name
-        request.session["data_source"] = "photo_extract"
+        set_session_dataset(request, data_path, "photo_extract")
         
         return JSONResponse({
             "success": True, 
@@ -0,0 +1,148 @@
+"""Датасеты, общие для всех воркеров uvicorn.
+
+Parquet при чтении распаковывается, и каждый воркер держал бы свою
+копию DataFrame. В этом режиме датасет один раз переводится в
+несжатый Arrow IPC (<dataset_id>.arrow рядом с parquet в хранилище),
+а воркеры отображают файл в память: числовые колонки становятся
+numpy-массивами прямо поверх mmap, строковые - Arrow-строками без
+копирования. Страницы файла общие для всех процессов (page cache),
+поэтому память не растет с числом воркеров.
+"""
+import importlib.metadata
+import os
+import threading
+
+from app.columnar import PARQUET_AVAILABLE
+from app.dataset_store import dataset_id_of, dataset_store, file_lock
+
+SHARED_SUFFIX = ".arrow"
+# По умолчанию включено, если uvicorn запущен с несколькими воркерами (WEB_CONCURRENCY)
+SHARED_DATASETS_REQUESTED = PARQUET_AVAILABLE and os.environ.get(
+    "GEOQUICK_SHARED_DATASETS", "1" if int(os.environ.get("WEB_CONCURRENCY", "1")) > 1 else "0"
+) == "1"
+# Без copy-on-write и Arrow-строк pandas 3 каждый воркер молча копирует колонки из mmap
+ZERO_COPY_PANDAS = int(importlib.metadata.version("pandas").split(".")[0]) >= 3
+SHARED_DATASETS = SHARED_DATASETS_REQUESTED and ZERO_COPY_PANDAS
+if SHARED_DATASETS_REQUESTED and not ZERO_COPY_PANDAS:
+    print(f"Shared datasets disabled: pandas {importlib.metadata.version('pandas')} "
+          f"copies memory-mapped columns, pandas>=3 is required")
+
+
+def string_dtype():
+    """Строковый dtype pandas на Arrow (как у read_parquet), если он есть"""
+    import pandas as pd
+
+    dtype = pd.Series([], dtype="str").dtype
+    if isinstance(dtype, pd.StringDtype) and dtype.storage == "pyarrow":
+        return dtype
+    return None
+
+
+class SharedDatasets:
+    """Реестр отображенных в память датасетов процесса
+
+    Между процессами реестр - это сам каталог хранилища: файл
+    <dataset_id>.arrow создается один раз под файловой блокировкой,
+    остальные воркеры просто отображают готовый файл.
+    """
+
+    def __init__(self, store=dataset_store):
+        self.store = store
+        self._tables = {}  # dataset_id -> pyarrow.Table поверх mmap
+        self._lock = threading.Lock()
+        self.materialized = 0
+        self.private_bytes = 0
+
+    def arrow_path(self, source):
+        return self.store.path_base(dataset_id_of(source)) + SHARED_SUFFIX
+
+    def table(self, source):
+        """Arrow-таблица датасета, отображенная в память"""
+        import pyarrow as pa
+
+        dataset_id = dataset_id_of(source)
+        with self._lock:
+            table = self._tables.get(dataset_id)
+        if table is not None:
+            return table
+
+        path = self.arrow_path(source)
+        if not os.path.exists(path):
+            self._materialize(source, path)
+        # read_all() над memory_map ничего не читает - буферы указывают в отображение
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        with self._lock:
+            return self._tables.setdefault(dataset_id, table)
+
+    def _materialize(self, source, path):
+        """Parquet -> несжатый Arrow IPC (один раз на все процессы)"""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        with file_lock(path + ".lock"):
+            if os.path.exists(path):
+                return  # другой воркер успел раньше
+            table = pq.read_table(source)
+            columns = []
+            for column in table.columns:
+                column = column.combine_chunks()
+                # NaN храним значением, а не null - тогда numpy-массив берется без копии
+                if pa.types.is_floating(column.type) and column.null_count:
+                    column = pc.fill_null(column, float("nan"))
+                columns.append(column)
+            table = pa.table(columns, names=table.column_names)
+
+            tmp_path = path + ".tmp"
+            with pa.OSFile(tmp_path, "wb") as f:
+                with pa.ipc.new_file(f, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+            self.materialized += 1
+
+    def read_columns(self, source, columns):
+        """DataFrame с колонками поверх общей памяти и число байт, скопированных в процесс"""
+        import pandas as pd
+        import pyarrow as pa
+
+        table = self.table(source)
+        strings = string_dtype()
+        data = {}
+        private = 0
+        for name in columns:
+            column = table.column(name)
+            if column.num_chunks == 1:
+                try:
+                    data[name] = column.chunk(0).to_numpy(zero_copy_only=True)
+                    continue
+                except pa.ArrowInvalid:
+                    pass  # bool, целые с пропусками и т.п. - обычное преобразование
+            is_string = pa.types.is_string(column.type) or pa.types.is_large_string(column.type)
+            if is_string and strings is not None:
+                # Строковый массив pandas оборачивает Arrow-буферы без копии
+                data[name] = column.to_pandas(types_mapper=lambda _: strings)
+            else:
+                data[name] = column.to_pandas()
+                private += int(data[name].memory_usage(deep=True, index=False))
+        with self._lock:
+            self.private_bytes += private
+        return pd.DataFrame(data, copy=False), private
+
+    def forget(self, path):
+        """Датасет удален сборщиком - отпускаем отображение"""
+        with self._lock:
+            self._tables.pop(dataset_id_of(path), None)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "enabled": SHARED_DATASETS,
+                "mapped": len(self._tables),
+                "mapped_bytes": sum(table.nbytes for table in self._tables.values()),
+                "materialized": self.materialized,
+                "private_bytes": self.private_bytes,
+            }
+
+
+shared_datasets = SharedDatasets()
+dataset_store.on_evict.append(shared_datasets.forget)
@@ -0,0 +1,150 @@
+import asyncio
+import io
+import os
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from app.ingest import store_frame
+from app.metrics import payload_bytes, span
+
+# Сколько секунд снимок таблицы считается свежим без запроса к Google
+SHEET_FRESHNESS = float(os.environ.get("GEOQUICK_SHEET_FRESHNESS", os.environ.get("GEOQUICK_URL_CACHE_TTL", "60")))
+SHEET_TIMEOUT = float(os.environ.get("GEOQUICK_SHEET_TIMEOUT", "20"))
+# Общий пул соединений для всех запросов к таблицам
+SHEET_MAX_CONNECTIONS = 20
+
+
+class SheetFetchError(Exception):
+    """Таблицу не удалось скачать, а локального снимка нет"""
+
+
+class SheetSnapshot:
+    """Последняя скачанная версия таблицы и валидаторы для условного запроса"""
+
+    def __init__(self, url):
+        self.url = url
+        self.data_path = None
+        self.etag = None
+        self.last_modified = None
+        self.checked_at = 0.0
+
+
+class SheetFetcher:
+    """Асинхронная загрузка Google Sheets со снимками в хранилище датасетов
+
+    Снимок сохраняется через store_frame (parquet + манифест), поэтому
+    графики читают его так же, как загруженный файл. Пока снимок свежее
+    freshness секунд, сеть не трогаем; потом делаем условный запрос
+    (If-None-Match / If-Modified-Since) - на 304 просто продлеваем снимок.
+    Одновременные запросы одной таблицы ждут одну и ту же загрузку.
+    """
+
+    def __init__(self, freshness=SHEET_FRESHNESS, timeout=SHEET_TIMEOUT, transport=None):
+        self.freshness = freshness
+        self.timeout = timeout
+        self.transport = transport
+        self._client = None
+        self._snapshots = {}
+        self._inflight = {}
+        self.fetches = 0
+        self.not_modified = 0
+        self.coalesced = 0
+
+    def _get_client(self):
+        import httpx
+
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,  # export-ссылки Google отвечают редиректом
+                limits=httpx.Limits(max_connections=SHEET_MAX_CONNECTIONS),
+                transport=self.transport,
+            )
+        return self._client
+
+    async def fetch(self, url):
+        """Путь к актуальному снимку таблицы (SheetFetchError если его нет)"""
+        snapshot = self._snapshots.setdefault(url, SheetSnapshot(url))
+        if self._is_fresh(snapshot):
+            return snapshot.data_path
+
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(snapshot))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _is_fresh(self, snapshot):
+        return (snapshot.data_path is not None
+                and time.monotonic() - snapshot.checked_at < self.freshness
+                and os.path.exists(snapshot.data_path))
+
+    async def _refresh(self, snapshot):
+        import httpx
+
+        have_snapshot = snapshot.data_path is not None and os.path.exists(snapshot.data_path)
+        headers = {}
+        if have_snapshot:
+            if snapshot.etag:
+                headers["If-None-Match"] = snapshot.etag
+            if snapshot.last_modified:
+                headers["If-Modified-Since"] = snapshot.last_modified
+
+        try:
+            self.fetches += 1
+            with span("sheet.fetch"):
+                response = await self._get_client().get(snapshot.url, headers=headers)
+            if response.status_code == 304 and have_snapshot:
+                self.not_modified += 1
+                snapshot.checked_at = time.monotonic()
+                return snapshot.data_path
+            response.raise_for_status()
+            payload_bytes.observe(len(response.content), kind="sheet")
+            snapshot.data_path = await run_in_threadpool(
+                self._store, response.content, snapshot.url
+            )
+        except (httpx.HTTPError, ValueError) as e:
+            if have_snapshot:
+                # Google недоступен - показываем последнюю версию, а не ошибку
+                print(f"Sheet refresh failed, serving snapshot: {e}")
+                snapshot.checked_at = time.monotonic()
+                return snapshot.data_path
+            self._snapshots.pop(snapshot.url, None)
+            message = str(e).splitlines()[0] if str(e) else type(e).__name__
+            raise SheetFetchError(f"Could not load Google Sheet: {message}")
+
+        snapshot.etag = response.headers.get("ETag")
+        snapshot.last_modified = response.headers.get("Last-Modified")
+        snapshot.checked_at = time.monotonic()
+        return snapshot.data_path
+
+    @staticmethod
+    def _store(content, url):
+        import pandas as pd
+
+        try:
+            with span("sheet.parse"):
+                df = pd.read_csv(io.BytesIO(content))
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+            raise ValueError(f"Sheet is not a CSV table: {e}")
+        return store_frame(df, source_name=url)
+
+    def metrics(self):
+        return {
+            "sheets": len(self._snapshots),
+            "fetches": self.fetches,
+            "not_modified": self.not_modified,
+            "coalesced": self.coalesced,
+        }
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+sheet_fetcher = SheetFetcher()
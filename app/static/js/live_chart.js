@@ -0,0 +1,58 @@
+// Обновление графика без перезагрузки страницы:
+// форма отправляется в JSON API, а Plotly.react перерисовывает график на месте.
+// Без JS (или без Plotly) форма продолжает работать обычным POST.
+function bindLiveChart(form, container, apiUrl) {
+    if (!form || !container || !window.fetch) return;
+
+    let pending = null;
+
+    function showError(message) {
+        const errorDiv = document.createElement('div');
+        errorDiv.className = 'text-red-500 p-4';
+        errorDiv.textContent = message;
+        container.replaceChildren(errorDiv);
+    }
+
+    async function update() {
+        if (!window.Plotly) {
+            form.submit();
+            return;
+        }
+
+        // Отменяем предыдущий запрос, если пользователь быстро меняет параметры
+        if (pending) pending.abort();
+        pending = new AbortController();
+
+        const params = new URLSearchParams(new FormData(form));
+        try {
+            const response = await fetch(apiUrl + '?' + params.toString(), {
+                signal: pending.signal,
+                credentials: 'same-origin'
+            });
+            const result = await response.json();
+
+            if (!result.success) {
+                showError(result.error || 'Failed to build plot');
+                return;
+            }
+
+            let plotDiv = container.querySelector('.plotly-graph-div');
+            if (!plotDiv) {
+                plotDiv = document.createElement('div');
+                plotDiv.className = 'plotly-graph-div';
+                container.replaceChildren(plotDiv);
+            }
+            Plotly.react(plotDiv, result.figure.data, result.figure.layout, result.config);
+        } catch (error) {
+            if (error.name !== 'AbortError') {
+                form.submit();
+            }
+        }
+    }
+
+    form.addEventListener('submit', (event) => {
+        event.preventDefault();
+        update();
+    });
+    form.addEventListener('change', update);
+}
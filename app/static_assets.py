@@ -0,0 +1,171 @@
+import glob
+import hashlib
+import mimetypes
+import os
+import re
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+
+from app.compression import ENCODING_SUFFIXES, ENCODINGS, MIN_SIZE, compress_max, negotiate
+
+STATIC_DIR = "app/static"
+PLOTLY_JS_DIR = os.path.join(STATIC_DIR, "js")
+
+# Режим подключения plotly.js к графикам:
+#   static - один раз отдаем как кешируемый файл из /static (по умолчанию)
+#   cdn    - грузим с cdn.plot.ly
+#   inline - встраиваем библиотеку в каждый ответ (старое поведение)
+PLOTLY_JS_MODE = os.environ.get("GEOQUICK_PLOTLY_JS", "static")
+
+# Файлы с хешем содержимого в имени можно кешировать навсегда
+HASHED_ASSET_RE = re.compile(r"-[0-9a-f]{12}\.min\.js$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Остальные файлы меняются при деплое под тем же именем - браузер сверяет ETag (ответ 304)
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+# Какие файлы статики сжимаем заранее (.gz и .br рядом с исходным)
+PRECOMPRESS_SUFFIXES = (".js", ".css", ".html", ".svg", ".json", ".txt")
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles с кешированием и предсжатыми вариантами файлов
+
+    Если браузер принимает br или gzip и рядом с файлом лежит свежий
+    .br/.gz (precompress_static), отдаем его с Content-Encoding -
+    сжатия на каждый запрос нет.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = self.precompressed_response(full_path, stat_result, scope, status_code)
+        if response is None:
+            response = super().file_response(full_path, stat_result, scope, status_code)
+        if str(full_path).endswith(PRECOMPRESS_SUFFIXES):
+            response.headers["Vary"] = "Accept-Encoding"
+        if HASHED_ASSET_RE.search(os.path.basename(full_path)):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers.setdefault("Cache-Control", REVALIDATE_CACHE_CONTROL)
+        return response
+
+    def precompressed_response(self, full_path, stat_result, scope, status_code):
+        full_path = str(full_path)
+        if not full_path.endswith(PRECOMPRESS_SUFFIXES):
+            return None
+        request_headers = Headers(scope=scope)
+        variants = [encoding for encoding in ENCODINGS
+                    if is_fresh(full_path + ENCODING_SUFFIXES[encoding], stat_result)]
+        encoding = negotiate(request_headers.get("accept-encoding", ""), variants)
+        if encoding is None:
+            return None
+
+        variant_path = full_path + ENCODING_SUFFIXES[encoding]
+        media_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+        response = FileResponse(variant_path, status_code=status_code, media_type=media_type,
+                                stat_result=os.stat(variant_path))
+        response.headers["Content-Encoding"] = encoding
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def is_fresh(variant_path, source_stat):
+    """Предсжатый файл есть и не старше исходного"""
+    try:
+        return os.stat(variant_path).st_mtime >= source_stat.st_mtime
+    except OSError:
+        return False
+
+
+def precompress_static(directory=STATIC_DIR):
+    """Пишет рядом с файлами статики .gz (и .br, если есть brotli) с максимальным сжатием
+
+    Уже свежие варианты пропускаются, поэтому повторный запуск дешевый.
+    Вызывается при сборке (python -m app.static_assets) и в фоне при старте.
+    Возвращает список (файл, кодировка, байт до, байт после) для новых вариантов.
+    """
+    written = []
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if not name.endswith(PRECOMPRESS_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            source_stat = os.stat(path)
+            if source_stat.st_size < MIN_SIZE:
+                continue
+            data = None
+            for encoding in ENCODINGS:
+                variant_path = path + ENCODING_SUFFIXES[encoding]
+                if is_fresh(variant_path, source_stat):
+                    continue
+                if data is None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                compressed = compress_max(data, encoding)
+                if len(compressed) >= len(data):
+                    continue
+                # Имя с pid: несколько воркеров могут сжимать одновременно
+                tmp_path = f"{variant_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(compressed)
+                os.replace(tmp_path, variant_path)
+                written.append((path, encoding, len(data), len(compressed)))
+    return written
+
+
+def publish_plotly_js():
+    """Кладет plotly.js в /static под именем с хешем и возвращает его URL"""
+    from plotly.offline import get_plotlyjs
+
+    source = get_plotlyjs().encode("utf-8")
+    digest = hashlib.sha256(source).hexdigest()[:12]
+    filename = f"plotly-{digest}.min.js"
+    path = os.path.join(PLOTLY_JS_DIR, filename)
+
+    if not os.path.exists(path):
+        # Удаляем бандлы от предыдущих версий plotly (вместе с .gz и .br)
+        for stale in glob.glob(os.path.join(PLOTLY_JS_DIR, "plotly-*.min.js*")):
+            os.remove(stale)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(source)
+        os.replace(tmp_path, path)
+
+    return f"/static/js/{filename}"
+
+
+def resolve_plotly_include():
+    """Значение include_plotlyjs для fig.to_html в зависимости от режима"""
+    if PLOTLY_JS_MODE == "inline":
+        return True
+    if PLOTLY_JS_MODE == "cdn":
+        return "cdn"
+    try:
+        return publish_plotly_js()
+    except OSError as e:
+        # Например, read-only файловая система - откатываемся на встраивание
+        print(f"Could not publish plotly.js to /static: {e}")
+        return True
+
+
+PLOTLY_INCLUDE = resolve_plotly_include()
+
+
+def precompress_on_startup():
+    """precompress_static для фонового потока при старте: ошибки только в лог"""
+    try:
+        written = precompress_static()
+    except OSError as e:
+        # Например, read-only файловая система - статика уйдет со сжатием на лету
+        print(f"Could not precompress static files: {e}")
+        return
+    if written:
+        print(f"Precompressed {len(written)} static files")
+
+
+if __name__ == "__main__":
+    # Шаг сборки: публикуем plotly.js (при импорте) и сжимаем статику заранее
+    for path, encoding, raw, compressed in precompress_static():
+        print(f"{path} [{encoding}]: {raw} -> {compressed} bytes")
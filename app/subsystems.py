@@ -0,0 +1,131 @@
+"""Ленивая загрузка тяжелых подсистем.
+
+pandas, plotly и стек OCR (OpenCV, img2table, tesseract) не импортируются
+при старте сервера: модули приложения импортируют их внутри функций.
+Подсистема загружается при первом запросе, которому она нужна, или
+заранее в фоне, когда сервер уже принимает запросы (GEOQUICK_WARMUP).
+"""
+import importlib
+import os
+import sys
+import threading
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from app.columnar import PARQUET_AVAILABLE
+
+# Прогревать подсистемы в фоне после старта; 0 - только при первом использовании
+WARMUP = os.environ.get("GEOQUICK_WARMUP", "1") != "0"
+
+
+class Subsystem:
+    """Набор модулей, который загружается один раз и целиком
+
+    check - дополнительная проверка после импорта (например, что
+    tesseract установлен). Ошибка загрузки запоминается: подсистема
+    помечается недоступной, повторно не загружается.
+    """
+
+    def __init__(self, name, modules, check=None, required=True):
+        self.name = name
+        self.modules = modules
+        self.check = check
+        self.required = required  # без нее сервер не готов отвечать на запросы
+        self.state = "not_loaded"  # not_loaded / loading / ready / failed
+        self.error = None
+        self.load_ms = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    @property
+    def settled(self):
+        return self.state in ("ready", "failed")
+
+    def ensure(self):
+        """Загружает подсистему при первом вызове; True если она доступна"""
+        if self.settled:
+            return self.ready
+        with self._lock:
+            if not self.settled:
+                self._load()
+        return self.ready
+
+    def _load(self):
+        self.state = "loading"
+        started = time.perf_counter()
+        try:
+            for module in self.modules:
+                importlib.import_module(module)
+            if self.check is not None:
+                self.check()
+            self.state = "ready"
+        except Exception as e:
+            self.error = str(e)
+            self.state = "failed"
+        self.load_ms = round((time.perf_counter() - started) * 1000, 1)
+        if self.ready:
+            print(f"✅ {self.name} loaded in {self.load_ms} ms")
+        else:
+            print(f"❌ {self.name} not available: {self.error}")
+
+    async def ensure_async(self):
+        """ensure() в пуле потоков, чтобы импорт не блокировал event loop"""
+        if self.settled:
+            return self.ready
+        return await run_in_threadpool(self.ensure)
+
+    def to_dict(self):
+        state = self.state
+        if state == "not_loaded" and all(module in sys.modules for module in self.modules):
+            # Модули уже импортировал другой код, хотя ensure() не вызывался
+            state = "imported"
+        return {"state": state, "required": self.required,
+                "load_ms": self.load_ms, "error": self.error}
+
+
+def _check_ocr():
+    from app import ocr_worker
+
+    ocr_worker.check_available()
+
+
+data_stack = Subsystem("data", ["pandas", "httpx", "app.table_cleaning"]
+                      + (["pyarrow.parquet"] if PARQUET_AVAILABLE else []))
+chart_stack = Subsystem("charts", ["plotly.express", "plotly.graph_objects", "plotly.io",
+                                   "app.point_reduction", "app.box_stats"])
+# OCR необязателен: без tesseract работают загрузка файлов и графики
+ocr_stack = Subsystem("ocr", ["cv2", "img2table.document", "img2table.ocr"],
+                      check=_check_ocr, required=False)
+
+SUBSYSTEMS = [data_stack, chart_stack, ocr_stack]
+
+
+def readiness():
+    """Состояние подсистем; сервер готов, когда загружены обязательные
+
+    Без фонового прогрева подсистемы грузятся при первом запросе,
+    поэтому готовность означает только, что ни одна из них не упала.
+    """
+    required = [subsystem for subsystem in SUBSYSTEMS if subsystem.required]
+    if WARMUP:
+        ready = all(subsystem.ready for subsystem in required)
+    else:
+        ready = not any(subsystem.state == "failed" for subsystem in required)
+    return {
+        "ready": ready,
+        "subsystems": {subsystem.name: subsystem.to_dict() for subsystem in SUBSYSTEMS},
+    }
+
+
+async def warm_up():
+    """Фоновая загрузка всех подсистем по очереди
+
+    Импорты идут в пуле потоков, поэтому сервер отвечает на запросы
+    (например, отдает статику и /api/health) уже во время прогрева.
+    """
+    for subsystem in SUBSYSTEMS:
+        await subsystem.ensure_async()
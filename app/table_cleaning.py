@@ -0,0 +1,257 @@
+"""Серверная очистка таблиц, распознанных с фото.
+
+Все шаги работают с колонками целиком через .str и numpy, без циклов
+по ячейкам: определение заголовка, склейка разрезанных OCR ячеек,
+нормализация чисел (десятичная запятая, единицы измерения, ошибки OCR)
+и приведение колонок к числовому типу.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# Колонка считается числовой, если столько непустых ячеек распознаются как числа
+NUMERIC_SHARE = 0.6
+# Сколько первых строк могут быть заголовком (например, "SiO2" и под ним "wt%")
+MAX_HEADER_ROWS = 3
+# По скольким первым строкам ищем заголовок
+HEADER_SAMPLE_ROWS = 50
+# Колонку заполненную меньше чем на эту долю приклеиваем к соседней слева
+SPARSE_COLUMN_SHARE = 0.3
+# Слова одной строки OCR: разница по Y меньше этого - та же строка
+ROW_TOLERANCE = 15
+# Слова ближе этого по X относятся к одной колонке
+COLUMN_GAP = 30
+
+UNITS = ["wt%", "wt.%", "%", "ppm", "ppb", "ppt", "g/t", "mg/kg", "µg/g", "ug/g", "mg/l", "ng/g"]
+UNIT_PATTERN = "|".join(re.escape(unit) for unit in sorted(UNITS, key=len, reverse=True))
+# "Ниже предела обнаружения" и прочие пропуски
+MISSING_VALUES = {"", "-", "--", "—", "n.d.", "nd", "n/a", "na", "bdl", "b.d.l.", "bd", "<dl", "nan"}
+# Частые ошибки OCR в числах (только для ячеек, похожих на число)
+OCR_DIGIT_FIXES = str.maketrans({"O": "0", "o": "0", "l": "1", "I": "1", "S": "5", "Z": "2"})
+# Отдельно распознанные знаки, которые относятся к следующей ячейке
+DETACHED_PREFIXES = {"<", ">", "-", "±", "~"}
+
+
+def grid_from_words(lines):
+    """Сетка ячеек из слов OCR с координатами ({y, words: [{text, x}]})"""
+    words = pd.DataFrame(
+        [(line.get("y", 0), word.get("x", 0), str(word.get("text", "")))
+         for line in lines for word in line.get("words", [])],
+        columns=["y", "x", "text"],
+    )
+    if words.empty:
+        return []
+
+    # Строки и колонки - разрывы больше допуска в отсортированных координатах
+    words = words.sort_values("y", kind="stable")
+    words["row"] = (words["y"].diff() > ROW_TOLERANCE).cumsum()
+    starts = np.sort(words["x"].to_numpy())
+    column_starts = starts[np.r_[True, np.diff(starts) > COLUMN_GAP]]
+    words["col"] = np.searchsorted(column_starts, words["x"].to_numpy(), side="right") - 1
+
+    # Слова в одной ячейке склеиваем по порядку X
+    cells = (words.sort_values(["row", "col", "x"])
+             .groupby(["row", "col"])["text"].agg(" ".join)
+             .unstack(fill_value=""))
+    cells = cells.reindex(columns=range(len(column_starts)), fill_value="")
+    return cells.to_numpy().tolist()
+
+
+def grid_from_text(text):
+    """Сетка из сырого текста: ячейки разделены табуляцией или 2+ пробелами"""
+    lines = [line.strip() for line in (text or "").splitlines() if line.strip()]
+    return [re.split(r"\t+|\s{2,}", line) for line in lines]
+
+
+def to_frame(rows, headers=None):
+    """DataFrame из строк разной длины, все ячейки - очищенные строки"""
+    width = max([len(row) for row in rows] + [len(headers or [])])
+    df = pd.DataFrame([list(row) + [""] * (width - len(row)) for row in rows])
+    df = df.reindex(columns=range(width)).fillna("").astype(str)
+    df = df.apply(lambda col: col.str.strip())
+    if headers is not None:
+        df.columns = [str(header).strip() for header in headers] + [""] * (width - len(headers))
+    return df
+
+
+def normalize_cells(col, fix_ocr=False):
+    """Текст ячеек, приведенный к виду, который понимает pd.to_numeric
+
+    fix_ocr - заменять похожие на цифры буквы (O -> 0, l -> 1). Только для
+    колонок, которые и без этого числовые: иначе "S1" станет 51.
+    """
+    text = col.str.strip().str.replace("−", "-", regex=False)
+
+    if fix_ocr:
+        # Ошибки OCR правим только там, где ячейка и так почти число
+        almost_numeric = text.str.fullmatch(r"[<>]?[-+]?[\dOolISZ.,]*\d[\dOolISZ.,]*")
+        text = text.where(~almost_numeric, text.str.translate(OCR_DIGIT_FIXES))
+
+    # Регулярки без lookbehind и флагов - так pandas выполняет их в Arrow, а не по ячейке в Python
+    # Единицы измерения в конце ячейки и знак предела (<, >) снимаем до разбора
+    # запятых: иначе "12,5 wt%" и "<0,05" не совпадут с шаблонами ниже
+    text = text.str.replace(rf"(?i)\s*({UNIT_PATTERN})$", "", regex=True)
+    text = text.str.replace(r"^[<>]\s*", "", regex=True)
+    # Пробелы между цифрами - разделитель тысяч или разрыв OCR
+    text = text.str.replace(r"(\d)\s+(\d)", r"\1\2", regex=True)
+    # Десятичная запятая: 12,5 -> 12.5 (а 1,234.5 - тысячи)
+    text = text.str.replace(r"^([-+]?\d+),(\d+)$", r"\1.\2", regex=True)
+    for _ in range(2):  # 1,234,567: соседние группы перекрываются
+        text = text.str.replace(r"(\d),(\d{3})(\D|$)", r"\1\2\3", regex=True)
+    return text
+
+
+def detect_units(col):
+    """Единица измерения, общая для большинства ячеек колонки (или None)"""
+    pattern = rf"(?i)\d\s*({UNIT_PATTERN})$"
+    with_units = col[col.str.contains(rf"(?i)\d\s*(?:{UNIT_PATTERN})$")]
+    if with_units.empty or len(with_units) < NUMERIC_SHARE * col.ne("").sum():
+        return None
+    return with_units.str.extract(pattern)[0].str.lower().mode().iloc[0]
+
+
+def parse_numbers(text):
+    """Числа из нормализованного текста (знак предела уже снят normalize_cells)"""
+    missing = text.str.lower().isin(MISSING_VALUES)
+    values = pd.to_numeric(text, errors="coerce")
+    return values.mask(missing), missing
+
+
+def numeric_mask(df):
+    """Таблица True/False: ячейка - число после нормализации"""
+    return df.apply(lambda col: parse_numbers(normalize_cells(col))[0].notna())
+
+
+def merge_split_cells(df):
+    """Склеивает ячейки, которые OCR разрезал на соседние колонки
+
+    Почти пустая колонка без заголовка приклеивается к колонке слева,
+    а отдельно стоящий знак ("<", "-") - к следующей ячейке. Колонки
+    обрабатываются по позиции: заголовки здесь еще могут повторяться.
+    """
+    columns = list(df.columns)
+    filled = df.ne("").mean().to_numpy()
+    keep = [0]
+    for i in range(1, len(columns)):
+        if str(columns[i]).strip() == "" and filled[i] < SPARSE_COLUMN_SHARE:
+            target, col = df.iloc[:, keep[-1]], df.iloc[:, i]
+            extra = col.ne("")
+            df.iloc[extra.to_numpy(), keep[-1]] = (target[extra] + " " + col[extra]).str.strip()
+        else:
+            keep.append(i)
+    df = df.iloc[:, keep].copy()
+
+    for i in range(df.shape[1] - 1):
+        left, right = df.iloc[:, i], df.iloc[:, i + 1]
+        detached = (left.isin(DETACHED_PREFIXES) & right.ne("")).to_numpy()
+        df.iloc[detached, i + 1] = left[detached] + right[detached]
+        df.iloc[detached, i] = ""
+    return df
+
+
+def detect_header(df):
+    """Отделяет строки заголовка от данных
+
+    Заголовок - первые строки, где числовых ячеек заметно меньше, чем
+    в данных (не больше MAX_HEADER_ROWS). Многострочный заголовок
+    склеивается через пробел: "SiO2" + "wt%" -> "SiO2 wt%". В таблице
+    без чисел заголовок - только первая строка, как в CSV.
+    """
+    # Для решения хватает начала таблицы
+    numeric_share = numeric_mask(df.head(HEADER_SAMPLE_ROWS)).mean(axis=1).to_numpy()
+    header_rows = 0
+    while header_rows < min(MAX_HEADER_ROWS, len(df) - 1):
+        below = numeric_share[header_rows + 1:].max()
+        # Строки ниже не числовее этой - дальше уже данные
+        if below == 0 or numeric_share[header_rows] >= 0.5 * below:
+            break
+        header_rows += 1
+    if header_rows == 0 and len(df) > 1 and not numeric_share.any():
+        header_rows = 1
+
+    if header_rows == 0:
+        headers = [f"Column {i + 1}" for i in range(df.shape[1])]
+    else:
+        headers = df.iloc[:header_rows].apply(lambda col: " ".join(part for part in col if part)).tolist()
+    data = df.iloc[header_rows:].reset_index(drop=True)
+    data.columns = headers
+    return data, header_rows
+
+
+def unique_headers(headers):
+    """Пустые и повторяющиеся заголовки делаем уникальными"""
+    seen = {}
+    result = []
+    for i, header in enumerate(headers):
+        header = str(header).strip() or f"Column {i + 1}"
+        count = seen.get(header, 0)
+        seen[header] = count + 1
+        result.append(header if count == 0 else f"{header}.{count}")
+    return result
+
+
+def coerce_numeric(df):
+    """Приводит к числам колонки, где большинство ячеек - числа
+
+    Возвращает новый DataFrame и список числовых колонок. Единица
+    измерения из ячеек переносится в заголовок.
+    """
+    result = {}
+    headers = []
+    numeric_columns = []
+    for header, col in df.items():
+        values, missing = parse_numbers(normalize_cells(col))
+        filled = col.ne("") & ~missing
+        numeric = values.notna().sum()
+        if filled.any() and numeric < filled.sum() and numeric >= 0.5 * filled.sum():
+            # Большинство ячеек - числа, остальные могут быть числами с ошибками OCR
+            values, _ = parse_numbers(normalize_cells(col, fix_ocr=True))
+            numeric = values.notna().sum()
+        if filled.any() and numeric >= NUMERIC_SHARE * filled.sum():
+            unit = detect_units(col)
+            if unit and unit.lower() not in header.lower():
+                header = f"{header} ({unit})"
+            result[header] = values
+            numeric_columns.append(header)
+        else:
+            result[header] = col.mask(col.eq(""))
+        headers.append(header)
+    return pd.DataFrame(result, columns=headers), numeric_columns
+
+
+def clean_table(rows, headers=None):
+    """Полная очистка таблицы
+
+    rows - список строк ячеек; headers - готовые заголовки (например,
+    исправленные пользователем), иначе заголовок ищется в первых строках.
+    Возвращает (DataFrame, числовые колонки, число строк заголовка).
+    """
+    if not rows:
+        raise ValueError("Table has no rows")
+
+    df = to_frame(rows, headers)
+    df = df.loc[df.ne("").any(axis=1)].reset_index(drop=True)
+    if df.empty:
+        raise ValueError("Table has no data")
+
+    header_rows = 0
+    if headers is None:
+        df, header_rows = detect_header(df)
+    df = merge_split_cells(df)
+    if headers is None:
+        # Пустые колонки (например, от рамок таблицы) не нужны
+        df = df.loc[:, df.ne("").any().to_numpy()]
+    df.columns = unique_headers(df.columns)
+    df, numeric_columns = coerce_numeric(df)
+    return df, numeric_columns, header_rows
+
+
+def display_rows(df):
+    """Строки таблицы для показа в браузере: числа без экспоненты, пропуски пустые"""
+    cells = df.astype(object)
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            cells[col] = [np.format_float_positional(value, trim="-") if pd.notna(value) else ""
+                          for value in df[col].to_numpy(dtype=float)]
+    return cells.where(cells.notna(), "").to_numpy().tolist()
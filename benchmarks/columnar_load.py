@@ -0,0 +1,94 @@
+"""Сравнение холодной загрузки CSV и parquet на широких таблицах.
+
+Каждый вариант запускается в отдельном процессе, чтобы честно измерить
+время холодной загрузки и прирост RSS после импортов (VmRSS из /proc,
+поэтому только Linux).
+
+    python benchmarks/columnar_load.py --rows 200000 --cols 100
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.columnar import convert_csv  # noqa: E402
+from benchmarks.synthetic import make_wide_csv  # noqa: E402
+
+# Код, который выполняется в дочернем процессе
+CHILD = """
+import sys, time
+sys.path.insert(0, {root!r})
+import pandas as pd
+from app.columnar import read_columns
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        return int(f.read().split("VmRSS:")[1].split()[0])
+
+base_rss = rss_kb()
+start = time.perf_counter()
+mode, path, columns = {mode!r}, {path!r}, {columns!r}
+if mode == "csv_full":
+    df = pd.read_csv(path)
+elif mode == "csv_usecols":
+    df = pd.read_csv(path, usecols=columns)
+elif mode == "parquet_full":
+    df = read_columns(path, None)
+else:
+    df = read_columns(path, columns)
+elapsed = time.perf_counter() - start
+print(elapsed, rss_kb() - base_rss, df.shape[0], df.shape[1])
+"""
+
+
+def run_child(mode, path, columns):
+    code = CHILD.format(root=ROOT, mode=mode, path=path, columns=columns)
+    output = subprocess.run([sys.executable, "-c", code], check=True,
+                            capture_output=True, text=True).stdout.split()
+    elapsed, rss_kb, nrows, ncols = float(output[0]), int(output[1]), int(output[2]), int(output[3])
+    return {"mode": mode, "seconds": round(elapsed, 4), "rss_growth_mb": round(rss_kb / 1024, 1),
+            "rows": nrows, "columns": ncols}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--cols", type=int, default=100)
+    parser.add_argument("--json", help="куда записать результаты в JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "wide.csv")
+        make_wide_csv(csv_path, args.rows, args.cols)
+        parquet_path = convert_csv(csv_path)
+        # Scatter читает не больше трех колонок
+        columns = ["el_0", "el_1", "lithology"]
+
+        results = [
+            run_child("csv_full", csv_path, columns),
+            run_child("csv_usecols", csv_path, columns),
+            run_child("parquet_full", parquet_path, columns),
+            run_child("parquet_projected", parquet_path, columns),
+        ]
+        sizes = {"csv_mb": round(os.path.getsize(csv_path) / 2**20, 1),
+                 "parquet_mb": round(os.path.getsize(parquet_path) / 2**20, 1)}
+
+    print(f"{args.rows} rows x {args.cols} columns, "
+          f"CSV {sizes['csv_mb']} MB, parquet {sizes['parquet_mb']} MB")
+    print(f"{'mode':<20}{'seconds':>10}{'RSS +MB':>14}")
+    for result in results:
+        print(f"{result['mode']:<20}{result['seconds']:>10}{result['rss_growth_mb']:>14}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"rows": args.rows, "cols": args.cols, "files": sizes,
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Кодирование scatter-фигуры: SVG с числами текстом против WebGL с typed arrays.
+
+Для каждого размера строится фигура как в /api/scatter (без сокращения
+точек) в двух вариантах:
+    svg + text   - trace scatter, массивы десятичными числами в JSON
+                   (так сериализовал plotly до 6.0)
+    webgl + bdata - trace scattergl, массивы base64 typed arrays
+Считаются время построения и сериализации на сервере, размер JSON и
+время json.loads - грубая оценка разбора на клиенте (сама отрисовка
+в браузере здесь не измеряется).
+
+    python benchmarks/figure_encoding.py --sizes 100000,1000000
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Все точки на графике - сравниваем именно кодирование, а не выборку
+os.environ["GEOQUICK_SCATTER_REDUCTION"] = "off"
+
+import numpy as np  # noqa: E402
+
+from benchmarks.synthetic import CHART_PARAMS, make_survey_frame  # noqa: E402
+
+
+def as_text_arrays(value):
+    """Фигура с массивами в виде списков чисел (JSON как до typed arrays)"""
+    if isinstance(value, dict):
+        if "bdata" in value:
+            array = np.frombuffer(base64.b64decode(value["bdata"]), dtype=value["dtype"])
+            return array.reshape(value.get("shape", array.shape)).tolist()
+        return {key: as_text_arrays(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [as_text_arrays(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, round((time.perf_counter() - started) * 1000, 1)
+
+
+def measure(df, params, color, render):
+    import plotly.io as pio
+    from plotly.utils import PlotlyJSONEncoder
+
+    from app.routes.scatter import build_mobile_plot
+
+    (fig, _), build_ms = timed(lambda: build_mobile_plot(df, params["x"], params["y"], color))
+    if render == "webgl":
+        body, json_ms = timed(lambda: pio.to_json(fig, validate=False))
+    else:
+        body, json_ms = timed(lambda: json.dumps(as_text_arrays(fig.to_plotly_json()),
+                                                 cls=PlotlyJSONEncoder))
+    _, parse_ms = timed(lambda: json.loads(body))
+    return {"trace": fig.data[0].type, "build_ms": build_ms, "serialize_ms": json_ms,
+            "bytes": len(body), "parse_ms": parse_ms}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100000,1000000")
+    parser.add_argument("--shape", choices=sorted(CHART_PARAMS), default="narrow")
+    parser.add_argument("--json", help="куда записать результаты в JSON")
+    args = parser.parse_args()
+
+    import app.charts
+
+    params = CHART_PARAMS[args.shape]
+    results = []
+    print(f"{'rows':>9} {'color':<10} {'variant':<14}{'trace':<11}{'build ms':>10}{'serialize ms':>14}"
+          f"{'MB':>8}{'parse ms':>10}")
+    for rows in [int(size) for size in args.sizes.split(",")]:
+        df = make_survey_frame(rows, args.shape)
+        for color in (None, params["color"]):
+            for variant, render in (("svg + text", "svg"), ("webgl + bdata", "webgl")):
+                # render_mode() читает режим из модуля charts при каждом вызове
+                app.charts.SCATTER_RENDER = render
+                result = measure(df, params, color, render)
+                result.update(rows=rows, color=color or "", variant=variant)
+                results.append(result)
+                print(f"{rows:>9} {color or '-':<10} {variant:<14}{result['trace']:<11}{result['build_ms']:>10}"
+                      f"{result['serialize_ms']:>14}{result['bytes'] / 2**20:>8.1f}{result['parse_ms']:>10}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
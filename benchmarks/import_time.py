@@ -0,0 +1,92 @@
+"""Время холодного старта: импорт app.main в свежем интерпретаторе.
+
+Каждый замер - отдельный процесс, как при старте воркера uvicorn.
+Скрипт завершается с кодом 1, если медиана превышает бюджет или если
+при старте импортировался тяжелый модуль (pandas, plotly, OpenCV...),
+который должен грузиться лениво.
+
+    python benchmarks/import_time.py --runs 5 --budget-ms 800
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Эти модули грузятся при первом использовании или фоновым прогревом (app/subsystems.py)
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "plotly.express", "plotly.graph_objects",
+                 "plotly.io", "cv2", "img2table", "httpx"]
+
+# Код, который выполняется в дочернем процессе
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed,
+                   "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def run_child():
+    code = CHILD.format(heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    # Последняя строка - наш JSON, выше могут быть print'ы приложения
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(top):
+    """Самые долгие модули по -X importtime (суммарно с вложенными)"""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"],
+                            cwd=ROOT, check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=800,
+                        help="максимальная медиана времени импорта")
+    parser.add_argument("--top", type=int, default=10, help="сколько самых долгих модулей показать")
+    parser.add_argument("--json", help="куда записать результаты в JSON")
+    args = parser.parse_args()
+
+    runs = [run_child() for _ in range(args.runs)]
+    times_ms = [round(run["seconds"] * 1000, 1) for run in runs]
+    median_ms = statistics.median(times_ms)
+    heavy = sorted({module for run in runs for module in run["heavy"]})
+
+    print(f"import app.main: median {median_ms} ms, runs {times_ms} (budget {args.budget_ms} ms)")
+    if args.top:
+        print(f"{'module':<50}{'cumulative ms':>15}")
+        for cumulative_us, name in slowest_imports(args.top):
+            print(f"{name:<50}{cumulative_us / 1000:>15.1f}")
+
+    failures = []
+    if median_ms > args.budget_ms:
+        failures.append(f"startup {median_ms} ms exceeds budget {args.budget_ms} ms")
+    if heavy:
+        failures.append(f"imported at startup, should be lazy: {', '.join(heavy)}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"runs_ms": times_ms, "median_ms": median_ms, "budget_ms": args.budget_ms,
+                       "heavy_modules": heavy, "failures": failures}, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
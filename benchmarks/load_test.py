@@ -0,0 +1,351 @@
+"""Нагрузочный бенчмарк графиков, загрузки файлов и OCR.
+
+Генерирует синтетические таблицы опробования (benchmarks/synthetic.py),
+гоняет эндпоинты конкурентными клиентами (у каждого своя сессия) и
+пишет p50/p95/p99, пропускную способность, размер ответов и пиковый
+RSS (вместе с процессами пула OCR) в JSON. С --baseline сравнивает
+прогон с сохраненным и завершается с кодом 1 при регрессии p95.
+
+    in-process - приложение в том же процессе через httpx.ASGITransport
+    uvicorn    - отдельный процесс uvicorn на localhost, как в продакшене
+
+    python benchmarks/load_test.py --sizes 10000,100000 --shapes narrow,wide --json run.json
+    python benchmarks/load_test.py --mode uvicorn --concurrency 8 --baseline run.json
+
+Таблицы больше GEOQUICK_MAX_UPLOAD_MB (200 MB) сервер не примет - для
+5M строк задайте больший лимит в окружении. Пиковый RSS читается из
+/proc, поэтому только Linux.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import CHART_PARAMS, make_table_image, write_survey_csv  # noqa: E402
+
+CHART_SCENARIOS = ["upload", "scatter_page", "scatter_api", "scatter_api_cold", "box_page", "box_api"]
+# Ключи, по которым прогон сопоставляется с базовым
+RESULT_KEY = ("mode", "scenario", "shape", "rows", "concurrency")
+
+
+def chart_request(scenario, params, csv_bytes, i):
+    """Запрос номер i сценария: (метод, URL, аргументы httpx)"""
+    if scenario == "upload":
+        # Уникальная последняя строка - иначе сработает дедупликация и парсинга не будет
+        return "POST", "/upload_local", {"files": {"datafile": ("survey.csv", unique_csv(csv_bytes, i))}}
+    if scenario == "scatter_page":
+        return "GET", "/scatter", {}
+    if scenario == "scatter_api":
+        return "GET", "/api/scatter", {"params": {"x": params["x"], "y": params["y"], "color": params["color"]}}
+    if scenario == "scatter_api_cold":
+        # Свой диапазон на каждый запрос - мимо кеша графиков, полная отрисовка
+        return "GET", "/api/scatter", {"params": {"x": params["x"], "y": params["y"],
+                                                  "color": params["color"], "x_min": str(-1 - i)}}
+    if scenario == "box_page":
+        return "GET", "/box", {}
+    if scenario == "box_api":
+        return "GET", "/api/box", {"params": {"y": params["box_y"], "group": params["group"]}}
+    raise ValueError(f"Unknown scenario {scenario}")
+
+
+def unique_csv(csv_bytes, i):
+    last_row = csv_bytes.rstrip(b"\n").rsplit(b"\n", 1)[-1]
+    _, rest = last_row.split(b",", 1)
+    return csv_bytes + str(1_000_000 + i).encode() + b"," + rest + b"\n"
+
+
+def ocr_request(i):
+    # Каждая картинка своя, чтобы не отвечал кеш OCR
+    image = make_table_image(seed=i)
+    return "POST", "/api/img2table-extract", {"files": {"file": (f"table-{i}.png", image, "image/png")}}
+
+
+def is_error(response):
+    if response.status_code >= 400:
+        return True
+    if response.headers.get("content-type", "").startswith("application/json"):
+        return response.json().get("success") is False
+    return False
+
+
+def process_tree(pid):
+    """pid и все его потомки (процессы пула OCR, воркеры uvicorn)"""
+    pids = [pid]
+    for current in pids:
+        try:
+            for tid in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{tid}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def reset_peak_rss(pid):
+    for current in process_tree(pid):
+        try:
+            with open(f"/proc/{current}/clear_refs", "w") as f:
+                f.write("5")  # сбрасывает VmHWM
+        except OSError:
+            pass
+
+
+def peak_rss_mb(pid):
+    total_kb = 0
+    for current in process_tree(pid):
+        try:
+            with open(f"/proc/{current}/status") as f:
+                total_kb += int(f.read().split("VmHWM:")[1].split()[0])
+        except (OSError, IndexError):
+            pass
+    return round(total_kb / 1024, 1)
+
+
+async def run_scenario(clients, make_request, total, warmup=0):
+    """Клиенты выбирают запросы из общего счетчика, пока не выполнят total
+
+    Первые warmup запросов (первая отрисовка, загрузка модулей) не входят
+    в статистику; у них свои номера, чтобы не совпасть с замеряемыми.
+    """
+    for i in range(total, total + warmup):
+        method, url, kwargs = make_request(i)
+        await clients[0].request(method, url, **kwargs)
+
+    latencies = []
+    sizes = []
+    errors = 0
+    next_index = 0
+
+    async def worker(client):
+        nonlocal errors, next_index
+        while next_index < total:
+            i = next_index
+            next_index += 1
+            method, url, kwargs = make_request(i)
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            sizes.append(len(response.content))
+            errors += is_error(response)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(client) for client in clients))
+    elapsed = time.perf_counter() - started
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "requests": total,
+        "errors": int(errors),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 2),
+        "mean_ms": round(float(latencies_ms.mean()), 2),
+        "throughput_rps": round(total / elapsed, 2),
+        "response_bytes_mean": int(np.mean(sizes)),
+    }
+
+
+async def run_suite(args, make_client, server_pid):
+    results = []
+    base = {"mode": args.mode, "concurrency": args.concurrency}
+
+    for shape in args.shapes:
+        params = CHART_PARAMS[shape]
+        for rows in args.sizes:
+            csv_path = os.path.join(args.data_dir, f"survey-{shape}-{rows}.csv")
+            if not os.path.exists(csv_path):
+                print(f"Generating {csv_path}")
+                write_survey_csv(csv_path, rows, shape)
+            with open(csv_path, "rb") as f:
+                csv_bytes = f.read()
+
+            clients = [make_client() for _ in range(args.concurrency)]
+            try:
+                # У каждого клиента своя сессия с этим датасетом (после первой загрузки - дедупликация)
+                for client in clients:
+                    await client.post("/upload_local", files={"datafile": ("survey.csv", csv_bytes)})
+
+                for scenario in args.scenarios:
+                    if scenario not in CHART_SCENARIOS:
+                        continue
+                    reset_peak_rss(server_pid)
+                    result = await run_scenario(
+                        clients, lambda i: chart_request(scenario, params, csv_bytes, i),
+                        args.requests, args.warmup)
+                    result.update(base, scenario=scenario, shape=shape, rows=rows,
+                                  csv_mb=round(len(csv_bytes) / 2**20, 1), peak_rss_mb=peak_rss_mb(server_pid))
+                    results.append(result)
+                    print_result(result)
+            finally:
+                for client in clients:
+                    await client.aclose()
+
+    if "ocr" in args.scenarios:
+        if shutil.which("tesseract") is None:
+            print("Skipping OCR scenario: tesseract is not installed")
+        else:
+            clients = [make_client() for _ in range(args.concurrency)]
+            try:
+                reset_peak_rss(server_pid)
+                result = await run_scenario(clients, ocr_request, args.ocr_requests, args.warmup)
+                result.update(base, scenario="ocr", shape="image", rows=0, peak_rss_mb=peak_rss_mb(server_pid))
+                results.append(result)
+                print_result(result)
+            finally:
+                for client in clients:
+                    await client.aclose()
+    return results
+
+
+async def run_in_process(args):
+    from app.main import app
+    from app.ocr_jobs import ocr_queue
+    from app.subsystems import warm_up
+
+    # ASGITransport не запускает lifespan - прогреваем подсистемы сами, как сервер при старте
+    await warm_up()
+    transport = httpx.ASGITransport(app=app)
+    try:
+        return await run_suite(
+            args, lambda: httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None),
+            os.getpid())
+    finally:
+        ocr_queue.shutdown()
+
+
+async def run_uvicorn(args):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=ROOT)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        await wait_ready(base_url, server)
+        limits = httpx.Limits(max_connections=1)
+        return await run_suite(
+            args, lambda: httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits), server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+async def wait_ready(base_url, server, timeout=120):
+    """Ждет, пока сервер загрузит обязательные подсистемы (/api/ready)"""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError("uvicorn exited before becoming ready")
+            try:
+                if (await client.get("/api/ready")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("uvicorn did not become ready in time")
+
+
+def print_result(result):
+    print(f"{result['scenario']:<18}{result['shape']:<8}{result['rows']:>10}"
+          f"{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}"
+          f"{result['throughput_rps']:>10}{result['response_bytes_mean']:>12}"
+          f"{result['peak_rss_mb']:>10}{result['errors']:>7}")
+
+
+def compare(results, baseline, max_regression):
+    """Печатает отношения к базовому прогону; возвращает список регрессий"""
+    previous = {tuple(result[key] for key in RESULT_KEY): result for result in baseline["results"]}
+    regressions = []
+    print(f"\n{'scenario':<18}{'shape':<8}{'rows':>10}{'p95 x':>10}{'rps x':>10}{'RSS x':>10}")
+    for result in results:
+        old = previous.get(tuple(result[key] for key in RESULT_KEY))
+        if old is None:
+            continue
+        p95 = result["p95_ms"] / old["p95_ms"] if old["p95_ms"] else 1
+        rps = result["throughput_rps"] / old["throughput_rps"] if old["throughput_rps"] else 1
+        rss = result["peak_rss_mb"] / old["peak_rss_mb"] if old["peak_rss_mb"] else 1
+        print(f"{result['scenario']:<18}{result['shape']:<8}{result['rows']:>10}"
+              f"{p95:>10.2f}{rps:>10.2f}{rss:>10.2f}")
+        if p95 > 1 + max_regression:
+            regressions.append(f"{result['scenario']} {result['shape']} {result['rows']}: p95 x{p95:.2f}")
+    return regressions
+
+
+def run_metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": {key: value for key, value in vars(args).items() if key not in ("json", "baseline")},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["in-process", "uvicorn"], default="in-process")
+    parser.add_argument("--sizes", default="10000,100000",
+                        help="число строк через запятую (до 5000000)")
+    parser.add_argument("--shapes", default="narrow,wide", help="narrow и/или wide")
+    parser.add_argument("--scenarios", default=",".join(CHART_SCENARIOS + ["ocr"]))
+    parser.add_argument("--concurrency", type=int, default=4, help="число одновременных клиентов")
+    parser.add_argument("--requests", type=int, default=40, help="запросов на сценарий")
+    parser.add_argument("--ocr-requests", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=1, help="незамеряемых запросов перед сценарием")
+    parser.add_argument("--workers", type=int, default=1, help="воркеры uvicorn (режим uvicorn)")
+    parser.add_argument("--data-dir", help="где хранить сгенерированные CSV между прогонами")
+    parser.add_argument("--json", help="куда записать результаты в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="допустимый рост p95 относительно базового прогона (0.2 = 20%%)")
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(",")]
+    args.shapes = args.shapes.split(",")
+    args.scenarios = args.scenarios.split(",")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        args.data_dir = args.data_dir or tmp
+        os.makedirs(args.data_dir, exist_ok=True)
+        print(f"{'scenario':<18}{'shape':<8}{'rows':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+              f"{'rps':>10}{'bytes':>12}{'RSS MB':>10}{'errors':>7}")
+        runner = run_in_process if args.mode == "in-process" else run_uvicorn
+        results = asyncio.run(runner(args))
+
+    report = {"meta": run_metadata(args), "results": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
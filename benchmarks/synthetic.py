@@ -0,0 +1,81 @@
+"""Синтетические данные для бенчмарков: геохимические таблицы и фото таблиц.
+
+Генераторы детерминированы (seed), поэтому прогоны на разных коммитах
+сравнимы между собой.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+
+LITHOLOGIES = ["granite", "basalt", "shale", "sandstone", "limestone", "gneiss"]
+# Окислы основной формы таблицы (wt%) и золото (ppb) с логнормальным распределением
+OXIDES = ["SiO2", "Al2O3", "Fe2O3", "MgO", "CaO"]
+
+# Какие колонки берут графики для каждой формы таблицы
+CHART_PARAMS = {
+    "narrow": {"x": "SiO2", "y": "Al2O3", "color": "lithology", "box_y": "Au_ppb", "group": "lithology"},
+    "wide": {"x": "el_0", "y": "el_1", "color": "lithology", "box_y": "el_2", "group": "lithology"},
+}
+WIDE_COLUMNS = 100
+
+
+def make_survey_frame(rows, shape="narrow", seed=0):
+    """Таблица опробования: narrow - ~10 колонок, wide - WIDE_COLUMNS колонок"""
+    rng = np.random.default_rng(seed)
+    if shape == "wide":
+        data = {f"el_{i}": rng.lognormal(size=rows).round(4) for i in range(WIDE_COLUMNS - 2)}
+    else:
+        data = {
+            "easting": rng.uniform(500_000, 520_000, rows).round(1),
+            "northing": rng.uniform(6_100_000, 6_120_000, rows).round(1),
+            "depth": rng.uniform(0, 300, rows).round(2),
+        }
+        for i, oxide in enumerate(OXIDES):
+            data[oxide] = rng.normal(50 / (i + 1), 5 / (i + 1), rows).round(3)
+        data["Au_ppb"] = rng.lognormal(1.5, 1.2, rows).round(1)
+    data["sample"] = [f"S-{i}" for i in range(rows)]
+    data["lithology"] = rng.choice(LITHOLOGIES, rows)
+    return pd.DataFrame(data)
+
+
+def write_survey_csv(path, rows, shape="narrow", seed=0):
+    make_survey_frame(rows, shape, seed).to_csv(path, index=False)
+    return path
+
+
+def make_wide_csv(path, rows, cols):
+    """Синтетическая широкая таблица: числовые колонки плюс пара текстовых"""
+    rng = np.random.default_rng(0)
+    data = {f"el_{i}": rng.lognormal(size=rows).round(4) for i in range(cols - 2)}
+    data["sample"] = [f"S-{i}" for i in range(rows)]
+    data["lithology"] = rng.choice(["granite", "basalt", "shale", "sandstone"], rows)
+    pd.DataFrame(data).to_csv(path, index=False)
+
+
+def make_table_image(rows=8, cols=4, seed=0, cell=(180, 60)):
+    """PNG с таблицей анализов в сетке (как фото распечатки, но без шума)"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    rng = np.random.default_rng(seed)
+    width, height = cols * cell[0] + 40, (rows + 1) * cell[1] + 40
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=28)
+
+    headers = ["Sample"] + OXIDES[:cols - 1]
+    for r in range(rows + 1):
+        for c in range(cols):
+            x0, y0 = 20 + c * cell[0], 20 + r * cell[1]
+            draw.rectangle([x0, y0, x0 + cell[0], y0 + cell[1]], outline=0, width=2)
+            if r == 0:
+                text = headers[c]
+            elif c == 0:
+                text = f"S-{seed}-{r}"
+            else:
+                text = f"{rng.uniform(0.1, 80):.2f}"
+            draw.text((x0 + 12, y0 + 14), text, fill=0, font=font)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
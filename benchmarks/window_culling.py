@@ -0,0 +1,98 @@
+"""Отсечение точек вне окна просмотра: отсортированный индекс против прохода по колонке.
+
+Для окон, покрывающих разную долю данных по обеим осям, замеряет
+поиск строк через SortedIndex (после однократного построения) и
+полный проход с маской, а также размер JSON фигуры /api/scatter -
+он должен уменьшаться вместе с видимой частью данных.
+
+    python benchmarks/window_culling.py --rows 1000000 --reduction off
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+
+from benchmarks.synthetic import make_survey_frame  # noqa: E402
+
+# Доля ширины диапазона каждой оси, попадающая в окно (видимая доля точек ~ квадрат)
+WINDOW_FRACTIONS = [0.01, 0.1, 0.3, 1.0]
+
+
+def timed(func, repeat=5):
+    """Лучшее время из repeat запусков, в миллисекундах"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return result, round(best, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--reduction", choices=["auto", "sample", "off"], default="off",
+                        help="GEOQUICK_SCATTER_REDUCTION для замера размера фигуры")
+    parser.add_argument("--json", help="куда записать результаты в JSON")
+    args = parser.parse_args()
+    os.environ["GEOQUICK_SCATTER_REDUCTION"] = args.reduction
+
+    from app.charts import figure_body
+    from app.point_reduction import display_values, sorted_index, window_rows, with_margin, _window_mask
+    from app.routes.scatter import build_mobile_plot
+
+    df = make_survey_frame(args.rows)
+    x, y = "easting", "northing"
+    derived = {}
+
+    def memo(key, factory):
+        if key not in derived:
+            derived[key] = factory()
+        return derived[key]
+
+    _, build_ms = timed(lambda: [sorted_index(df, column, False, memo) for column in (x, y)], repeat=1)
+    index_mb = sum(index.nbytes for index in derived.values()) / 2**20
+    print(f"{args.rows} rows: sorted indexes built in {build_ms} ms, {index_mb:.1f} MB")
+
+    def scan(x_bounds, y_bounds):
+        xs = display_values(df[x], False)
+        ys = display_values(df[y], False)
+        x_bounds = with_margin(x_bounds, (np.nanmin(xs), np.nanmax(xs)))
+        y_bounds = with_margin(y_bounds, (np.nanmin(ys), np.nanmax(ys)))
+        return np.flatnonzero(_window_mask(xs, x_bounds) & _window_mask(ys, y_bounds))
+
+    results = []
+    print(f"{'window':>8}{'rows':>10}{'index ms':>10}{'scan ms':>10}{'shown':>9}{'figure KB':>11}")
+    for fraction in WINDOW_FRACTIONS:
+        ranges = []
+        for column in (x, y):
+            lo, hi = float(df[column].min()), float(df[column].max())
+            middle, half = (lo + hi) / 2, (hi - lo) * fraction / 2
+            ranges.append([middle - half, middle + half])
+
+        rows, index_ms = timed(lambda: window_rows(df, x, y, False, False, ranges[0], ranges[1], memo))
+        scanned, scan_ms = timed(lambda: scan(ranges[0], ranges[1]))
+        assert np.array_equal(rows, scanned)
+
+        fig, reduction = build_mobile_plot(df, x, y, x_range=ranges[0], y_range=ranges[1], memo=memo)
+        figure_kb = len(figure_body(fig, points=reduction.summary())) / 1024
+        result = {"window": fraction, "rows": len(rows), "index_ms": index_ms, "scan_ms": scan_ms,
+                  "shown": reduction.shown, "figure_kb": round(figure_kb, 1)}
+        results.append(result)
+        print(f"{fraction:>8}{len(rows):>10}{index_ms:>10}{scan_ms:>10}{reduction.shown:>9}{figure_kb:>11.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"rows": args.rows, "reduction": args.reduction, "index_build_ms": build_ms,
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
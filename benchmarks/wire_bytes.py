@@ -0,0 +1,131 @@
+"""Байты в сети: страницы графиков, JSON и статика без сжатия и со сжатием.
+
+Каждый ответ запрашивается с Accept-Encoding: identity (как было до
+сжатия) и с каждой кодировкой, которую умеет сервер. Считаются байты
+тела до распаковки и время ответа. Приложение работает в том же
+процессе (httpx.ASGITransport); статика предварительно сжимается,
+как на шаге сборки.
+
+    python benchmarks/wire_bytes.py --rows 20000 --json wire.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # app/static и app/templates заданы относительными путями
+
+from benchmarks.synthetic import CHART_PARAMS, write_survey_csv  # noqa: E402
+
+STATIC_FILES = ["/static/js/photo_uploader.js", "/static/js/live_chart.js", "/static/style.css"]
+# Таблица, как ее присылает photo_uploader.js после распознавания
+PHOTO_TABLE = {
+    "headers": ["Sample", "SiO2", "Al2O3", "Fe2O3", "MgO"],
+    "rows": [[f"S-{i}", f"{50 + i % 7}.{i % 10}", f"{14 + i % 3}.2", f"{5 + i % 4}.71", f"{2 + i % 5}.05"]
+             for i in range(200)],
+}
+
+
+def requests_to_measure(params, plotly_url):
+    """(название, метод, URL, аргументы httpx)"""
+    requests = [
+        ("scatter page", "GET", "/scatter", {}),
+        ("box page", "GET", "/box", {}),
+        ("scatter json", "GET", "/api/scatter", {"params": {"x": params["x"], "y": params["y"],
+                                                            "color": params["color"]}}),
+        ("box json", "GET", "/api/box", {"params": {"y": params["box_y"], "group": params["group"]}}),
+        ("process-table-data json", "POST", "/api/process-table-data", {"json": {"preliminary_data": PHOTO_TABLE}}),
+        ("save-photo-data json", "POST", "/api/save-photo-data", {"data": {"table_data": json.dumps(PHOTO_TABLE)}}),
+    ]
+    requests += [(path.rsplit("/", 1)[-1], "GET", path, {}) for path in STATIC_FILES]
+    if isinstance(plotly_url, str):
+        requests.append(("plotly.js", "GET", plotly_url, {}))
+    return requests
+
+
+async def measure(client, method, url, kwargs, encoding):
+    """Байты тела в том виде, как они пришли по сети, и время ответа"""
+    headers = {"Accept-Encoding": encoding}
+    started = time.perf_counter()
+    async with client.stream(method, url, headers=headers, **kwargs) as response:
+        # aiter_raw не распаковывает - считаем именно то, что ушло в сеть
+        size = 0
+        async for chunk in response.aiter_raw():
+            size += len(chunk)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return {"status": response.status_code, "bytes": size, "ms": round(elapsed_ms, 2),
+            "content_encoding": response.headers.get("content-encoding", "identity")}
+
+
+async def run(args):
+    from app.compression import ENCODINGS
+    from app.main import app
+    from app.ocr_jobs import ocr_queue
+    from app.static_assets import PLOTLY_INCLUDE, precompress_static
+    from app.subsystems import warm_up
+
+    # ASGITransport не запускает lifespan - прогрев и сжатие статики делаем сами
+    await warm_up()
+    precompress_static()
+
+    params = CHART_PARAMS[args.shape]
+    csv_path = os.path.join(args.data_dir, f"survey-{args.shape}-{args.rows}.csv")
+    if not os.path.exists(csv_path):
+        write_survey_csv(csv_path, args.rows, args.shape)
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            with open(csv_path, "rb") as f:
+                await client.post("/upload_local", files={"datafile": ("survey.csv", f.read())})
+            for name, method, url, kwargs in requests_to_measure(params, PLOTLY_INCLUDE):
+                # Первый запрос строит график и кладет его в кеш - в замер не входит
+                await client.request(method, url, **kwargs)
+                row = {"name": name, "url": url}
+                for encoding in ("identity",) + ENCODINGS:
+                    row[encoding] = await measure(client, method, url, kwargs, encoding)
+                results.append(row)
+                print_row(row, ENCODINGS)
+    finally:
+        ocr_queue.shutdown()
+    return results, ENCODINGS
+
+
+def print_row(row, encodings):
+    identity = row["identity"]["bytes"]
+    cells = [f"{row['name']:<26}{identity:>12}"]
+    for encoding in encodings:
+        measured = row[encoding]
+        ratio = identity / measured["bytes"] if measured["bytes"] else 0
+        cells.append(f"{encoding:>6} {measured['bytes']:>10} ({ratio:4.1f}x, {measured['ms']:.1f} ms)")
+    print("  ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--shape", choices=sorted(CHART_PARAMS), default="narrow")
+    parser.add_argument("--data-dir", default=tempfile.gettempdir())
+    parser.add_argument("--json", help="куда записать результаты в JSON")
+    args = parser.parse_args()
+
+    print(f"{'response':<26}{'identity':>12}")
+    results, encodings = asyncio.run(run(args))
+
+    total = {encoding: sum(row[encoding]["bytes"] for row in results) for encoding in ("identity",) + encodings}
+    print("total: " + ", ".join(f"{encoding} {size}" for encoding, size in total.items()))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"rows": args.rows, "shape": args.shape, "results": results, "total_bytes": total}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from app.box_stats import WHISKER_IQR, compute_box_stats
+
+
+def survey(seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(50, 5, 3000)
+    values[:40] = 200 + np.arange(40)  # далекие выбросы
+    groups = np.where(np.arange(3000) % 3 == 0, "granite", "basalt")
+    df = pd.DataFrame({"SiO2": values, "rock": groups})
+    df.loc[5, "SiO2"] = np.nan
+    return df
+
+
+def test_quartiles_and_whiskers_match_pandas():
+    df = survey()
+    stats = compute_box_stats(df, "SiO2", "rock")
+    assert stats.labels == ["granite", "basalt"]
+
+    for i, label in enumerate(stats.labels):
+        values = df.loc[df["rock"] == label, "SiO2"].dropna()
+        q1, median, q3 = values.quantile([0.25, 0.5, 0.75])
+        assert np.isclose(stats.q1[i], q1)
+        assert np.isclose(stats.median[i], median)
+        assert np.isclose(stats.q3[i], q3)
+        inside = values[values.between(q1 - WHISKER_IQR * (q3 - q1), q3 + WHISKER_IQR * (q3 - q1))]
+        assert np.isclose(stats.lowerfence[i], inside.min())
+        assert np.isclose(stats.upperfence[i], inside.max())
+        assert np.isclose(stats.mean[i], values.mean())
+        assert stats.counts[i] == len(values)
+
+
+def test_outlier_cap_keeps_farthest_points():
+    df = survey()
+    stats = compute_box_stats(df, "SiO2", "rock", max_outliers=5)
+    outliers = pd.DataFrame({"rock": stats.outlier_x, "SiO2": stats.outlier_y})
+    assert outliers["rock"].value_counts().max() <= 5
+
+    for label, kept in outliers.groupby("rock")["SiO2"]:
+        values = df.loc[df["rock"] == label, "SiO2"].dropna()
+        farthest = values[values > 150].nlargest(5)
+        assert sorted(kept) == sorted(farthest)
+
+
+def test_without_groups():
+    stats = compute_box_stats(pd.DataFrame({"MgO": [1.0, 2.0, 3.0, 4.0, 100.0]}), "MgO")
+    assert stats.labels == ["MgO"]
+    assert stats.upperfence == [4.0]
+    assert stats.outlier_y == [100.0]
@@ -0,0 +1,52 @@
+"""Регрессия размера страниц графиков: plotly.js не должен снова встраиваться в ответ"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.dataset_store import dataset_store
+from app.main import app
+from app.static_assets import PLOTLY_INCLUDE
+from benchmarks.synthetic import make_survey_frame
+
+# Бюджеты для таблицы из 500 строк (с plotly.js внутри страница весит ~5 MB)
+MAX_BYTES = {
+    ("GET", "/scatter"): 64_000,
+    ("POST", "/scatter"): 64_000,
+    ("GET", "/box"): 32_000,
+    ("POST", "/box"): 32_000,
+}
+FORMS = {
+    "/scatter": {"x": "SiO2", "y": "Al2O3", "color": "lithology"},
+    "/box": {"y": "SiO2", "group": "lithology"},
+}
+INLINE_PLOTLY_MARKER = "* plotly.js v"
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    # Загруженная таблица ложится во временный каталог, а не в app/uploads
+    directory = dataset_store.directory
+    dataset_store.directory = str(tmp_path_factory.mktemp("uploads"))
+    try:
+        with TestClient(app) as client:
+            csv = make_survey_frame(500).to_csv(index=False).encode()
+            response = client.post("/upload_local", files={"datafile": ("survey.csv", csv)})
+            assert response.status_code < 400
+            yield client
+    finally:
+        dataset_store.directory = directory
+
+
+@pytest.mark.parametrize("method,path", sorted(MAX_BYTES))
+def test_chart_page_size(client, method, path):
+    if method == "GET":
+        response = client.get(path)
+    else:
+        response = client.post(path, data=FORMS[path])
+    assert response.status_code == 200
+
+    body = response.text
+    assert len(response.content) < MAX_BYTES[(method, path)]
+    assert INLINE_PLOTLY_MARKER not in body
+    if isinstance(PLOTLY_INCLUDE, str) and PLOTLY_INCLUDE.startswith("/static/"):
+        # Библиотека подключается кешируемым файлом с хешем в имени
+        assert f'src="{PLOTLY_INCLUDE}"' in body
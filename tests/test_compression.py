@@ -0,0 +1,95 @@
+import asyncio
+import gzip
+
+from app.compression import STREAM_CHUNK, CompressionMiddleware, negotiate
+
+TEXT = b"SiO2,Al2O3,Fe2O3\n" + b"50.1,14.2,5.71\n" * 2000
+
+
+def response_app(status=200, headers=(), chunks=(TEXT,)):
+    """ASGI-приложение, отдающее тело заданными кусками"""
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"text/csv")] + list(headers)})
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+
+    return app
+
+
+def call(app, accept_encoding="gzip", method="GET"):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app)(scope, receive, send))
+    start = messages[0]
+    headers = {name.decode(): value.decode() for name, value in start["headers"]}
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return start["status"], headers, body, messages[1:]
+
+
+def test_negotiate_q_values():
+    assert negotiate("gzip", ("br", "gzip")) == "gzip"
+    assert negotiate("gzip;q=0.5, br;q=0.8", ("br", "gzip")) == "br"
+    assert negotiate("br;q=0, gzip", ("br", "gzip")) == "gzip"
+    assert negotiate("gzip;q=0", ("br", "gzip")) is None
+    assert negotiate("*;q=0.1, gzip;q=0", ("br", "gzip")) == "br"
+    assert negotiate("identity", ("br", "gzip")) is None
+    assert negotiate("gzip;q=bogus", ("gzip",)) is None
+    # При равных q - порядок сервера
+    assert negotiate("gzip, br", ("br", "gzip")) == "br"
+
+
+def test_compresses_and_sets_headers():
+    status, headers, body, _ = call(response_app(headers=[(b"etag", b'"abc"')]))
+    assert status == 200
+    assert headers["content-encoding"] == "gzip"
+    assert headers["vary"] == "Accept-Encoding"
+    assert headers["etag"] == 'W/"abc"'
+    assert int(headers["content-length"]) == len(body)
+    assert gzip.decompress(body) == TEXT
+
+
+def test_client_refusing_gzip_gets_identity():
+    _, headers, body, _ = call(response_app(), accept_encoding="gzip;q=0")
+    assert "content-encoding" not in headers
+    assert body == TEXT
+
+
+def test_passthrough_small_not_modified_and_encoded():
+    _, headers, body, _ = call(response_app(chunks=(b"a,b\n1,2\n",)))
+    assert "content-encoding" not in headers and body == b"a,b\n1,2\n"
+
+    status, headers, body, _ = call(response_app(status=304, chunks=(b"",)))
+    assert status == 304 and "content-encoding" not in headers and body == b""
+
+    precompressed = gzip.compress(TEXT)
+    _, headers, body, _ = call(response_app(headers=[(b"content-encoding", b"gzip")],
+                                            chunks=(precompressed,)))
+    assert body == precompressed
+
+
+def test_vary_is_merged():
+    _, headers, _, _ = call(response_app(headers=[(b"vary", b"Cookie")]))
+    assert headers["vary"] == "Cookie, Accept-Encoding"
+
+    _, headers, _, _ = call(response_app(headers=[(b"vary", b"accept-encoding")]))
+    assert headers["vary"] == "accept-encoding"
+
+
+def test_streamed_body_gunzips_to_original():
+    chunks = [TEXT, TEXT * 3, b"tail\n"]
+    original = b"".join(chunks)
+    assert len(original) > STREAM_CHUNK
+    _, headers, body, messages = call(response_app(chunks=chunks))
+    assert headers["content-encoding"] == "gzip"
+    assert "content-length" not in headers
+    assert len(messages) > 2  # уходит кусками, а не одним телом
+    assert messages[-1]["more_body"] is False
+    assert gzip.decompress(body) == original
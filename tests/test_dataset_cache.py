@@ -0,0 +1,68 @@
+import asyncio
+import os
+
+import pandas as pd
+
+from app.dataset_cache import dataset_cache, load_session_dataset, no_data_error, set_session_dataset
+from app.dataset_store import dataset_store
+from app.ingest import store_frame
+from app.sheets import sheet_fetcher
+
+
+class FakeRequest:
+    def __init__(self):
+        self.session = {}
+
+
+def test_replacing_session_data_keeps_shared_dataset_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_store, "directory", str(tmp_path))
+    shared = store_frame(pd.DataFrame({"SiO2": [50.1, 48.7], "MgO": [3.2, 4.0]}), source_name="a.csv")
+    other = store_frame(pd.DataFrame({"SiO2": [61.0], "MgO": [1.1]}), source_name="b.csv")
+
+    first, second = FakeRequest(), FakeRequest()
+    set_session_dataset(first, shared, "local_file")
+    set_session_dataset(second, shared, "local_file")
+    entry = dataset_cache.get(shared)
+    entry.memo(("sorted_index", "SiO2", False), lambda: "index")
+
+    # Первая сессия загрузила другой файл - вторая продолжает работать с разобранным датасетом
+    set_session_dataset(first, other, "local_file")
+    assert dataset_cache.get(shared) is entry
+    assert entry.memo(("sorted_index", "SiO2", False), lambda: "rebuilt") == "index"
+    dataset_cache.clear()
+
+
+def test_legacy_csv_session_is_moved_into_store(tmp_path, monkeypatch):
+    store_dir = tmp_path / "store"
+    monkeypatch.setattr(dataset_store, "directory", str(store_dir))
+    legacy = tmp_path / "legacy" / "old-session.csv"
+    legacy.parent.mkdir()
+    legacy.write_text("SiO2,MgO\n50.1,3.2\n48.7,4.0\n")
+
+    request = FakeRequest()
+    request.session.update(sid="s1", data_path=str(legacy))
+    dataset = asyncio.run(load_session_dataset(request))
+
+    data_path = request.session["data_path"]
+    assert dataset_store.owns(data_path) and data_path.endswith(".parquet")
+    assert dataset.df["SiO2"].tolist() == [50.1, 48.7]
+    # Новый файл учтен сборщиком: у сессии есть ссылка, рядом с CSV ничего не появилось
+    assert dataset_store.metrics()["referenced_datasets"] == 1
+    assert os.listdir(legacy.parent) == ["old-session.csv"]
+    dataset_cache.clear()
+
+
+def test_unreachable_sheet_error_reaches_the_user():
+    request = FakeRequest()
+    request.session["gsheet_csv_url"] = "http://127.0.0.1:1/export?format=csv"
+
+    async def scenario():
+        try:
+            return await load_session_dataset(request)
+        finally:
+            await sheet_fetcher.close()  # клиент httpx привязан к event loop теста
+
+    assert asyncio.run(scenario()) is None
+    assert request.session["data_error"].startswith("Could not load Google Sheet")
+    assert no_data_error(request).startswith("Could not load Google Sheet")
+    assert no_data_error(request) == "No data loaded"
@@ -0,0 +1,57 @@
+import os
+import time
+
+from app.dataset_store import UNREFERENCED_GRACE, DatasetStore
+
+
+def make_dataset(directory, dataset_id, age=0):
+    path = os.path.join(directory, f"{dataset_id}.parquet")
+    with open(path, "wb") as f:
+        f.write(b"x" * 100)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+def test_abandoned_dataset_is_reaped_after_grace(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    old = make_dataset(str(tmp_path), "aaa")
+    new = make_dataset(str(tmp_path), "bbb")
+    store.attach("s1", old)
+    store.attach("s1", new, previous_path=old)
+
+    evicted = store.reap(time.time() + UNREFERENCED_GRACE + 60)
+    assert evicted == ["aaa"]
+    assert os.path.exists(new)
+    assert store.metrics()["referenced_datasets"] == 1
+
+
+def test_refs_of_other_workers_are_visible_immediately(tmp_path):
+    # Два воркера - два экземпляра над одним каталогом
+    worker_a = DatasetStore(str(tmp_path))
+    worker_b = DatasetStore(str(tmp_path))
+    path = make_dataset(str(tmp_path), "ccc", age=UNREFERENCED_GRACE + 60)
+    worker_a.attach("s1", path)
+
+    assert worker_b.reap(time.time() + UNREFERENCED_GRACE + 60) == []
+    assert os.path.exists(path)
+
+
+def test_touch_keeps_unreferenced_dataset_alive_across_workers(tmp_path):
+    worker_a = DatasetStore(str(tmp_path))
+    worker_b = DatasetStore(str(tmp_path))
+    path = make_dataset(str(tmp_path), "ddd", age=UNREFERENCED_GRACE + 60)
+    worker_a.touch(None, path)
+
+    assert worker_b.reap() == []
+    assert worker_b.reap(time.time() + UNREFERENCED_GRACE + 60) == ["ddd"]
+    assert not os.listdir(tmp_path) or all(name.startswith(".") for name in os.listdir(tmp_path))
+
+
+def test_expired_session_ref_no_longer_holds_dataset(tmp_path):
+    store = DatasetStore(str(tmp_path), session_ttl=3600)
+    path = make_dataset(str(tmp_path), "eee")
+    store.attach("s1", path)
+
+    assert store.reap(time.time() + 1800) == []
+    assert store.reap(time.time() + 3600 + UNREFERENCED_GRACE + 60) == ["eee"]
@@ -0,0 +1,26 @@
+from app.figure_cache import build_hash
+
+
+def test_build_hash_follows_templates_but_not_plotly_bundle(tmp_path):
+    templates = tmp_path / "templates"
+    scripts = tmp_path / "js"
+    templates.mkdir()
+    scripts.mkdir()
+    (templates / "scatter.html").write_text("<div>{{ plot }}</div>")
+    (scripts / "live_chart.js").write_text("draw();")
+    directories = (str(templates), str(scripts))
+    before = build_hash(directories)
+
+    (scripts / "plotly-0123456789ab.min.js").write_text("bundle")
+    (scripts / "live_chart.js.gz").write_bytes(b"\x1f\x8b")
+    assert build_hash(directories) == before
+
+    (templates / "scatter.html").write_text("<section>{{ plot }}</section>")
+    assert build_hash(directories) != before
+
+
+def test_build_hash_follows_chart_code(tmp_path):
+    (tmp_path / "scatter.py").write_text("MARKER_SIZE = 6\n")
+    before = build_hash((str(tmp_path),))
+    (tmp_path / "scatter.py").write_text("MARKER_SIZE = 8\n")
+    assert build_hash((str(tmp_path),)) != before
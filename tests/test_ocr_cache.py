@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+import pandas as pd
+
+from app.ocr_cache import OcrResultCache, image_fingerprint, perceptual_hash, perceptual_key
+from benchmarks.synthetic import make_table_image
+
+PARAMS = {"lang": "eng"}
+
+
+def gray_image(contents, scale=1.0, jpeg_quality=None):
+    image = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if scale != 1.0:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    if jpeg_quality is not None:
+        _, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        image = cv2.imdecode(encoded, cv2.IMREAD_GRAYSCALE)
+    return image
+
+
+def store(cache, gray):
+    outcome = {"tables": [pd.DataFrame({"SiO2": [1.0]})], "preprocessing": {}}
+    key = perceptual_key(perceptual_hash(gray), PARAMS)
+    cache.put([key], outcome, image_fingerprint(gray))
+    return key
+
+
+def test_same_grid_different_values_is_not_served(tmp_path):
+    # Одна сетка, разные числа: 64-битный dHash совпадает
+    first = gray_image(make_table_image(seed=4))
+    second = gray_image(make_table_image(seed=6))
+    assert perceptual_hash(first) == perceptual_hash(second)
+
+    cache = OcrResultCache(str(tmp_path))
+    key = store(cache, first)
+    assert perceptual_key(perceptual_hash(second), PARAMS) == key
+    assert cache.get(key, image_fingerprint(second)) is None
+
+
+def test_recompressed_copy_is_served(tmp_path):
+    original = make_table_image(seed=4)
+    cache = OcrResultCache(str(tmp_path))
+    key = store(cache, gray_image(original))
+
+    copy = gray_image(original, scale=0.8, jpeg_quality=60)
+    assert perceptual_key(perceptual_hash(copy), PARAMS) == key
+    cached = cache.get(key, image_fingerprint(copy))
+    assert cached is not None
+    assert "fingerprint" not in cached
+
+
+def test_entry_without_fingerprint_is_not_served(tmp_path):
+    gray = gray_image(make_table_image(seed=1))
+    cache = OcrResultCache(str(tmp_path))
+    key = perceptual_key(perceptual_hash(gray), PARAMS)
+    cache.put([key], {"tables": [pd.DataFrame({"a": [1]})], "preprocessing": {}})
+    assert cache.get(key, image_fingerprint(gray)) is None
+    assert cache.get(key) is not None
@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+import pytest
+
+from app.ocr_jobs import OcrJob, OcrJobQueue
+
+
+def finished_job(session_id="s1"):
+    job = OcrJob(session_id, ["table.png"])
+    job.status = "done"
+    job.finished = time.time()
+    job.tables = {"1-1-1": "app/uploads/a.parquet", "1-1-2": "app/uploads/b.parquet"}
+    job.data_path = job.tables["1-1-1"]
+    job.result = {"success": True, "selected": "1-1-1", "tables_found": 2}
+    job.done.set()
+    return job
+
+
+def test_job_is_visible_to_other_workers(tmp_path):
+    worker_a = OcrJobQueue(max_workers=1, job_dir=str(tmp_path))
+    worker_b = OcrJobQueue(max_workers=1, job_dir=str(tmp_path))
+    job = finished_job()
+    worker_a.jobs[job.id] = job
+    worker_a.save(job)
+
+    seen = worker_b.get(job.id)
+    assert seen is not None
+    assert seen.session_id == "s1"
+    assert seen.to_dict() == job.to_dict()
+
+
+def test_select_on_one_worker_is_seen_by_another(tmp_path):
+    worker_a = OcrJobQueue(max_workers=1, job_dir=str(tmp_path))
+    worker_b = OcrJobQueue(max_workers=1, job_dir=str(tmp_path))
+    job = finished_job()
+    worker_a.jobs[job.id] = job
+    worker_a.save(job)
+
+    assert worker_b.select(worker_b.get(job.id), "1-1-2")
+    refreshed = worker_a.get(job.id)
+    assert refreshed.data_path == "app/uploads/b.parquet"
+    assert refreshed.result["selected"] == "1-1-2"
+
+
+def test_long_poll_sees_job_finished_by_other_worker(tmp_path):
+    worker_a = OcrJobQueue(max_workers=1, job_dir=str(tmp_path))
+    worker_b = OcrJobQueue(max_workers=1, job_dir=str(tmp_path))
+    job = OcrJob("s1", ["table.png"])
+    worker_a.jobs[job.id] = job
+    worker_a.save(job)
+
+    async def scenario():
+        async def finish():
+            await asyncio.sleep(0.3)
+            done = finished_job()
+            done.id = job.id
+            worker_a.save(done)
+
+        waiter = worker_b.wait(worker_b.get(job.id), 5)
+        result, _ = await asyncio.gather(waiter, finish())
+        return result
+
+    assert asyncio.run(scenario()).status == "done"
+
+
+def test_unknown_or_malformed_job_id(tmp_path):
+    queue = OcrJobQueue(max_workers=1, job_dir=str(tmp_path))
+    assert queue.get("0" * 32) is None
+    assert queue.get("../../etc/passwd") is None
+
+
+def make_pdf(pages):
+    import io
+
+    import pypdfium2
+
+    doc = pypdfium2.PdfDocument.new()
+    for page in range(pages):
+        doc.new_page(200 + page, 300)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    doc.close()
+    return buffer.getvalue()
+
+
+def test_pdf_pages_are_sent_one_page_each():
+    import pypdfium2
+
+    from app.ocr_cache import content_key
+    from app.ocr_jobs import plan_tasks
+    from app.ocr_worker import resolve_params
+
+    pdf = make_pdf(3)
+    tasks = plan_tasks([("report.pdf", pdf)])
+    assert [task.page for task in tasks] == [0, 1, 2]
+    for task in tasks:
+        page_doc = pypdfium2.PdfDocument(task.contents)
+        assert len(page_doc) == 1
+        assert page_doc[0].get_size()[0] == 200 + task.page
+        page_doc.close()
+        # Ключ кеша прежний - по исходному файлу и номеру страницы
+        assert task.key == content_key(pdf, resolve_params(None), task.page)
+
+
+def test_queue_is_bounded_by_pages(tmp_path):
+    from app.ocr_jobs import QueueFullError
+
+    queue = OcrJobQueue(max_workers=1, max_pending=4, job_dir=str(tmp_path))
+    queue.pending = 2
+
+    async def scenario():
+        with pytest.raises(QueueFullError):
+            await queue.submit("s1", [("report.pdf", make_pdf(3))])
+        assert queue.pending == 2
+        # Пустая очередь принимает даже задачу больше себя
+        queue.pending = 0
+        job = await queue.submit("s1", [("report.pdf", make_pdf(3))])
+        return job
+
+    queue._run = lambda job, tasks, params: asyncio.sleep(0)
+    job = asyncio.run(scenario())
+    assert queue.pending == 3
+    assert queue.jobs[job.id] is job
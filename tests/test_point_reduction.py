@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from app.point_reduction import MIN_PER_GROUP, WINDOW_MARGIN, reduce_points, window_rows
+
+
+def cloud(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"x": rng.normal(50, 5, rows), "y": rng.normal(20, 2, rows)})
+
+
+def test_extremes_and_sparse_outliers_survive_sampling():
+    df = cloud(100_000)
+    outliers = [10, 20_000, 55_555]
+    df.loc[outliers, ["x", "y"]] = [[0.0, 20.0], [120.0, 5.0], [50.0, 60.0]]
+
+    reduction = reduce_points(df, "x", "y", max_points=2000, mode="sample")
+    assert reduction.mode == "sampled"
+    assert reduction.shown <= 2000
+    kept = set(reduction.df.index)
+    assert set(outliers) <= kept
+    for column in ("x", "y"):
+        assert {df[column].idxmin(), df[column].idxmax()} <= kept
+
+
+def test_every_color_group_keeps_points():
+    df = cloud(60_000)
+    df["rock"] = "granite"
+    df.loc[100:179, "rock"] = "basalt"   # 80 точек
+    df.loc[500:509, "rock"] = "gabbro"   # 10 точек
+    df.loc[900:904, "rock"] = None       # пропуски - своя группа
+
+    reduction = reduce_points(df, "x", "y", color="rock", max_points=2000, mode="sample")
+    counts = reduction.df["rock"].value_counts(dropna=False)
+    assert counts["basalt"] >= MIN_PER_GROUP
+    assert counts["gabbro"] == 10
+    assert counts[np.nan] == 5
+    assert reduction.shown <= 2000 + 3 * MIN_PER_GROUP
+
+
+def test_window_margin_includes_edge_points():
+    df = pd.DataFrame({"x": [0.0, 5.0, 10.0, 10.0 + 10 * WINDOW_MARGIN * 0.9, 10.0 + 10 * WINDOW_MARGIN * 2],
+                       "y": [1.0, 1.0, 1.0, 1.0, 1.0]})
+    rows = window_rows(df, "x", "y", False, False, [0.0, 10.0], None)
+    assert rows.tolist() == [0, 1, 2, 3]
+
+    reduction = reduce_points(df, "x", "y", x_range=[0.0, 10.0])
+    assert reduction.mode == "windowed"
+    assert reduction.df.index.tolist() == [0, 1, 2, 3]
+
+
+def test_log_axis_drops_non_positive_values():
+    df = pd.DataFrame({"x": np.r_[np.linspace(1, 100, 90), np.zeros(30), -np.ones(30)],
+                       "y": np.linspace(1, 10, 150)})
+
+    reduction = reduce_points(df, "x", "y", log_x=True, max_points=100)
+    assert reduction.shown == 90
+    assert (reduction.df["x"] > 0).all()
+
+    windowed = reduce_points(df, "x", "y", log_x=True, x_range=[0.5, 1000])
+    assert (windowed.df["x"] > 0).all()
+    assert windowed.shown == 90
@@ -0,0 +1,157 @@
+"""SheetFetcher против локального HTTP-сервера, отдающего CSV с валидаторами"""
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.dataset_store import dataset_store
+from app.sheets import SheetFetcher, SheetFetchError
+
+LAST_MODIFIED = "Wed, 01 Oct 2025 10:00:00 GMT"
+
+
+class SheetServer:
+    """Опубликованная таблица: ETag/Last-Modified, 304 и отказ по флагу"""
+
+    def __init__(self, body=b"a,b,g\n1,2,x\n3,4,y\n5,6,x\n", etag='"v1"', delay=0.0):
+        self.body = body
+        self.etag = etag
+        self.delay = delay
+        self.failing = False
+        self.hits = 0
+        self.conditional = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self._server.server_port}/export?format=csv"
+
+    def _handler(self):
+        sheet = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with sheet._lock:
+                    sheet.hits += 1
+                time.sleep(sheet.delay)
+                if sheet.failing:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                if (self.headers.get("If-None-Match") == sheet.etag
+                        and self.headers.get("If-Modified-Since") == LAST_MODIFIED):
+                    with sheet._lock:
+                        sheet.conditional += 1
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/csv")
+                self.send_header("ETag", sheet.etag)
+                self.send_header("Last-Modified", LAST_MODIFIED)
+                self.send_header("Content-Length", str(len(sheet.body)))
+                self.end_headers()
+                self.wfile.write(sheet.body)
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def store_dir(tmp_path, monkeypatch):
+    # Снимки таблиц сохраняются через store_frame - во временный каталог
+    monkeypatch.setattr(dataset_store, "directory", str(tmp_path))
+
+
+def run(coro_factory, **fetcher_args):
+    async def main():
+        fetcher = SheetFetcher(**fetcher_args)
+        try:
+            return await coro_factory(fetcher)
+        finally:
+            await fetcher.close()
+
+    return asyncio.run(main())
+
+
+def test_fresh_snapshot_skips_network():
+    with SheetServer() as sheet:
+        async def scenario(fetcher):
+            first = await fetcher.fetch(sheet.url)
+            second = await fetcher.fetch(sheet.url)
+            return first, second
+
+        first, second = run(scenario, freshness=60)
+    assert first == second
+    assert sheet.hits == 1
+
+
+def test_stale_snapshot_is_revalidated_with_304():
+    with SheetServer() as sheet:
+        async def scenario(fetcher):
+            first = await fetcher.fetch(sheet.url)
+            await asyncio.sleep(0.15)
+            second = await fetcher.fetch(sheet.url)
+            return first, second, fetcher.metrics()
+
+        first, second, metrics = run(scenario, freshness=0.1)
+    assert second == first
+    assert sheet.hits == 2
+    assert sheet.conditional == 1
+    assert metrics["not_modified"] == 1
+
+
+def test_changed_sheet_replaces_snapshot():
+    with SheetServer() as sheet:
+        async def scenario(fetcher):
+            first = await fetcher.fetch(sheet.url)
+            sheet.body, sheet.etag = b"a,b,g\n9,9,z\n", '"v2"'
+            await asyncio.sleep(0.15)
+            return first, await fetcher.fetch(sheet.url)
+
+        first, second = run(scenario, freshness=0.1)
+    assert second != first
+    assert sheet.conditional == 0
+
+
+def test_concurrent_requests_share_one_download():
+    with SheetServer(delay=0.2) as sheet:
+        async def scenario(fetcher):
+            paths = await asyncio.gather(*(fetcher.fetch(sheet.url) for _ in range(10)))
+            return paths, fetcher.metrics()
+
+        paths, metrics = run(scenario, freshness=60)
+    assert len(set(paths)) == 1
+    assert sheet.hits == 1
+    assert metrics["fetches"] == 1
+    assert metrics["coalesced"] == 9
+
+
+def test_upstream_error_serves_last_snapshot():
+    with SheetServer() as sheet:
+        async def scenario(fetcher):
+            first = await fetcher.fetch(sheet.url)
+            sheet.failing = True
+            await asyncio.sleep(0.15)
+            return first, await fetcher.fetch(sheet.url)
+
+        first, second = run(scenario, freshness=0.1)
+    assert second == first
+    assert sheet.hits == 2
+
+
+def test_upstream_error_without_snapshot_raises():
+    with SheetServer() as sheet:
+        sheet.failing = True
+        with pytest.raises(SheetFetchError):
+            run(lambda fetcher: fetcher.fetch(sheet.url))
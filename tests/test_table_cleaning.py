@@ -0,0 +1,56 @@
+import pandas as pd
+
+from app.table_cleaning import clean_table, detect_header, normalize_cells, to_frame
+
+
+def test_european_decimal_comma_with_units():
+    rows = [
+        ["Sample", "SiO2", "Al2O3", "Cu"],
+        ["S-1", "12,5 wt%", "13,9 wt%", "< 0,05 ppm"],
+        ["S-2", "48,75 wt%", "14,1 wt%", "1 250 ppm"],
+        ["S-3", "51,2 wt%", "15,0 wt%", "n.d."],
+    ]
+    df, numeric_columns, header_rows = clean_table(rows)
+    assert header_rows == 1
+    assert numeric_columns == ["SiO2 (wt%)", "Al2O3 (wt%)", "Cu (ppm)"]
+    assert df["SiO2 (wt%)"].tolist() == [12.5, 48.75, 51.2]
+    assert df["Al2O3 (wt%)"].tolist() == [13.9, 14.1, 15.0]
+    assert df["Cu (ppm)"].tolist()[:2] == [0.05, 1250.0]
+    assert pd.isna(df["Cu (ppm)"].iloc[2])
+
+
+def test_normalize_cells_thousands_and_qualifiers():
+    col = pd.Series(["1,234.5", "1,234,567", "12,5", ">3,2 %", "−0,5"])
+    assert normalize_cells(col).tolist() == ["1234.5", "1234567", "12.5", "3.2", "-0.5"]
+
+
+def test_all_text_table_keeps_data_rows():
+    df, header_rows = detect_header(to_frame([["Name", "Rock"], ["a", "granite"], ["b", "basalt"],
+                                              ["c", "gneiss"]]))
+    assert header_rows == 1
+    assert list(df.columns) == ["Name", "Rock"]
+    assert df["Name"].tolist() == ["a", "b", "c"]
+
+
+def test_single_header_row():
+    df, numeric_columns, header_rows = clean_table(
+        [["Sample", "SiO2", "MgO"], ["A", "50.1", "3.2"], ["B", "48.7", "4.0"]])
+    assert header_rows == 1
+    assert list(df.columns) == ["Sample", "SiO2", "MgO"]
+    assert numeric_columns == ["SiO2", "MgO"]
+    assert len(df) == 2
+
+
+def test_two_row_header_with_units():
+    df, numeric_columns, header_rows = clean_table(
+        [["Sample", "SiO2", "Zr"], ["", "wt%", "ppm"], ["A", "50.1", "120"], ["B", "48.7", "95"]])
+    assert header_rows == 2
+    assert list(df.columns) == ["Sample", "SiO2 wt%", "Zr ppm"]
+    assert df["Zr ppm"].tolist() == [120, 95]
+
+
+def test_table_without_header():
+    df, header_rows = detect_header(to_frame([["1.0", "2.0"], ["3.0", "4.0"]]))
+    assert header_rows == 0
+    assert list(df.columns) == ["Column 1", "Column 2"]
+    assert len(df) == 2